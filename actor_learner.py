@@ -0,0 +1,355 @@
+"""
+Asynchronous actor-learner training for TriNet. Actor processes keep playing RiskEnvWrapper
+games with the most recently broadcast policy weights and push fixed-length trajectory
+segments into a bounded queue. The learner updates the PPO policy from those segments
+while the actors keep playing. Segments may come from slightly older weights, so the
+learner corrects for the policy lag with V-trace targets and a PPO clipped ratio taken
+against the behaviour policy that acted (as in IMPALA and asynchronous PPO).
+"""
+
+import time
+import queue
+import argparse
+import numpy as np
+import torch
+import torch.multiprocessing as tmp
+from stable_baselines3.common.utils import obs_as_tensor
+
+def _zero_schedule(_):
+    return 0.0
+
+def _actor(rank, env, policy_class, policy_params, shared_state, version, lock, trajectories, stop, n_steps, seed):
+    """
+    Play games with the latest broadcast weights and push segments of n_steps transitions
+    """
+    torch.set_num_threads(1)
+    policy = policy_class(**policy_params)
+    policy.set_training_mode(False)
+    env.risk_env.seed(seed)
+    env.action_space.seed(seed)
+    torch.manual_seed(seed)
+    obs, _ = env.reset(seed=seed)
+    local_version = -1
+    while not stop.is_set():
+        if version.value != local_version:
+            with lock:
+                policy.load_state_dict(shared_state)
+                local_version = version.value
+        segment = {'obs': {key: [] for key in obs}, 'actions': [], 'rewards': [], 'dones': [], 'log_probs': []}
+        for _ in range(n_steps):
+            with torch.no_grad():
+                actions, _, log_probs = policy(obs_as_tensor({key: value[None] for key, value in obs.items()}, policy.device))
+            action = actions.cpu().numpy()[0]
+            for key, value in obs.items():
+                segment['obs'][key].append(value)
+            obs, reward, done, truncated, _ = env.step(np.clip(action, env.action_space.low, env.action_space.high))
+            segment['actions'].append(action)
+            segment['rewards'].append(reward)
+            segment['dones'].append(done or truncated)
+            segment['log_probs'].append(log_probs.item())
+            if done or truncated:
+                obs, _ = env.reset()
+        segment = {
+            'obs': {key: np.stack(values) for key, values in segment['obs'].items()},
+            'next_obs': {key: np.asarray(value) for key, value in obs.items()},
+            'actions': np.stack(segment['actions']).astype(np.float32),
+            'rewards': np.array(segment['rewards'], dtype=np.float32),
+            'dones': np.array(segment['dones'], dtype=np.float32),
+            'log_probs': np.array(segment['log_probs'], dtype=np.float32),
+            'version': local_version
+        }
+        while not stop.is_set():
+            try:
+                trajectories.put(segment, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+
+def vtrace(behaviour_log_probs, target_log_probs, rewards, dones, values, bootstrap, gamma, rho_bar=1.0, c_bar=1.0):
+    """
+    V-trace targets of Espeholt et al. 2018 for a batch of segments
+
+    Parameters:
+    behaviour_log_probs, target_log_probs: S x n arrays of the log probabilities of the actions
+    under the policy that acted and under the current policy
+    rewards, dones: S x n arrays
+    values: a S x n array of the current value estimates
+    bootstrap: a (S,) array of the value estimates of the observation after each segment
+    gamma: the discount factor
+    rho_bar, c_bar: truncation levels of the importance weights
+
+    Returns:
+    targets: a S x n array of value targets
+    advantages: a S x n array of policy gradient advantages
+    """
+    rho = np.exp(target_log_probs - behaviour_log_probs)
+    clipped_rho, c = np.minimum(rho, rho_bar), np.minimum(rho, c_bar)
+    discounts = gamma * (1 - dones)
+    next_values = np.concatenate((values[:, 1:], bootstrap[:, None]), axis=1)
+    deltas = clipped_rho * (rewards + discounts * next_values - values)
+    corrections = np.zeros_like(values)
+    correction = np.zeros(len(values))
+    for t in reversed(range(values.shape[1])):
+        correction = deltas[:, t] + discounts[:, t] * c[:, t] * correction
+        corrections[:, t] = correction
+    targets = values + corrections
+    next_targets = np.concatenate((targets[:, 1:], bootstrap[:, None]), axis=1)
+    advantages = rewards + discounts * next_targets - values
+    return targets, advantages
+
+class ActorLearner():
+    def __init__(self, trinet, env, num_actors=2, n_steps=128, queue_size=8, segments_per_batch=4, n_epochs=2,
+                 batch_size=256, gamma=0.99, clip_range=0.2, ent_coef=0.001, vf_coef=0.5, max_grad_norm=0.5,
+                 broadcast_interval=1, seed=0, start_method=None):
+        """
+        Observations and rewards reach the policy unnormalized, as TriNet.predict sees them,
+        so compact observations are the better fit for this mode.
+
+        Parameters:
+        trinet: the TriNet whose PPO policy is trained, it can be saved and loaded as usual afterwards
+        env: a RiskEnvWrapper, copied into every actor
+        num_actors: the number of actor processes
+        n_steps: transitions per trajectory segment
+        queue_size: the most segments waiting for the learner, actors block when it is full
+        segments_per_batch: segments consumed by one learner update
+        n_epochs: passes over each batch
+        batch_size: minibatch size of the gradient steps
+        gamma: the discount factor
+        clip_range, ent_coef, vf_coef, max_grad_norm: PPO loss settings
+        broadcast_interval: learner updates between weight broadcasts
+        seed: base seed, actor i plays with seed + i
+        start_method: multiprocessing start method, defaults to forkserver where available
+        """
+        self.trinet = trinet
+        self.policy = trinet.agent.policy
+        self.env = env
+        self.num_actors = num_actors
+        self.n_steps = n_steps
+        self.segments_per_batch = segments_per_batch
+        self.n_epochs = n_epochs
+        self.batch_size = batch_size
+        self.gamma = gamma
+        self.clip_range = clip_range
+        self.ent_coef = ent_coef
+        self.vf_coef = vf_coef
+        self.max_grad_norm = max_grad_norm
+        self.broadcast_interval = broadcast_interval
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in tmp.get_all_start_methods() else "spawn"
+        self.ctx = tmp.get_context(start_method)
+        self.queue_size = queue_size
+        self.stats = {'samples': 0, 'updates': 0, 'learn_time': 0.0, 'wait_time': 0.0, 'mean_lag': 0.0}
+        self.lags = []
+        self.actors = None
+
+    def _start_actors(self):
+        policy_params = self.policy._get_constructor_parameters()
+        policy_params['lr_schedule'] = _zero_schedule
+        self.shared_state = {key: value.detach().cpu().clone().share_memory_()
+                             for key, value in self.policy.state_dict().items()}
+        self.version = self.ctx.Value('i', 0)
+        self.lock = self.ctx.Lock()
+        self.trajectories = self.ctx.Queue(self.queue_size)
+        self.stop = self.ctx.Event()
+        self.actors = [self.ctx.Process(target=_actor, daemon=True,
+                                        args=(rank, self.env, type(self.policy), policy_params, self.shared_state,
+                                              self.version, self.lock, self.trajectories, self.stop, self.n_steps,
+                                              self.seed + rank))
+                       for rank in range(self.num_actors)]
+        for actor in self.actors:
+            actor.start()
+
+    def close(self):
+        """
+        Stop the actor processes, learn() starts them again if it is called later
+        """
+        if self.actors is None:
+            return
+        self.stop.set()
+        # unblock actors waiting on a full queue
+        while any(actor.is_alive() for actor in self.actors):
+            try:
+                self.trajectories.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for actor in self.actors:
+            actor.join()
+        self.actors = None
+
+    def broadcast(self):
+        """
+        Copy the learner's weights into the shared state the actors load from
+        """
+        with self.lock:
+            for key, value in self.policy.state_dict().items():
+                self.shared_state[key].copy_(value.detach().cpu())
+            self.version.value += 1
+
+    def update(self, segments):
+        """
+        One learner update: V-trace targets for the batch, then PPO epochs against the behaviour policy
+        """
+        device = self.policy.device
+        obs = {key: np.concatenate([segment['obs'][key] for segment in segments]) for key in segments[0]['obs']}
+        next_obs = {key: np.stack([segment['next_obs'][key] for segment in segments]) for key in segments[0]['next_obs']}
+        actions = np.concatenate([segment['actions'] for segment in segments])
+        shape = (len(segments), self.n_steps)
+        behaviour_log_probs = np.stack([segment['log_probs'] for segment in segments])
+        rewards = np.stack([segment['rewards'] for segment in segments])
+        dones = np.stack([segment['dones'] for segment in segments])
+
+        self.policy.set_training_mode(False)
+        with torch.no_grad():
+            obs_tensor = obs_as_tensor(obs, device)
+            actions_tensor = torch.as_tensor(actions, device=device)
+            values, log_probs, _ = self.policy.evaluate_actions(obs_tensor, actions_tensor)
+            bootstrap = self.policy.predict_values(obs_as_tensor(next_obs, device))
+        targets, advantages = vtrace(behaviour_log_probs, log_probs.cpu().numpy().reshape(shape), rewards, dones,
+                                     values.cpu().numpy().reshape(shape), bootstrap.cpu().numpy().ravel(), self.gamma)
+        targets = torch.as_tensor(targets.ravel(), device=device, dtype=torch.float32)
+        advantages = torch.as_tensor(advantages.ravel(), device=device, dtype=torch.float32)
+        advantages = (advantages - advantages.mean()) / (advantages.std() + 1e-8)
+        behaviour = torch.as_tensor(behaviour_log_probs.ravel(), device=device)
+
+        self.policy.set_training_mode(True)
+        num_samples = len(actions)
+        for _ in range(self.n_epochs):
+            permutation = self.rng.permutation(num_samples)
+            for start in range(0, num_samples, self.batch_size):
+                index = torch.as_tensor(permutation[start:start + self.batch_size], device=device)
+                batch_obs = {key: value[index] for key, value in obs_tensor.items()}
+                values, log_probs, entropy = self.policy.evaluate_actions(batch_obs, actions_tensor[index])
+                ratio = torch.exp(log_probs - behaviour[index])
+                policy_loss = -torch.min(advantages[index] * ratio,
+                                         advantages[index] * torch.clamp(ratio, 1 - self.clip_range, 1 + self.clip_range)).mean()
+                value_loss = torch.nn.functional.mse_loss(values.flatten(), targets[index])
+                entropy_loss = -torch.mean(entropy) if entropy is not None else -torch.mean(-log_probs)
+                loss = policy_loss + self.vf_coef * value_loss + self.ent_coef * entropy_loss
+                self.policy.optimizer.zero_grad()
+                loss.backward()
+                torch.nn.utils.clip_grad_norm_(self.policy.parameters(), self.max_grad_norm)
+                self.policy.optimizer.step()
+
+    def learn(self, total_timesteps, callback=None):
+        """
+        Train until total_timesteps transitions have been consumed in total. The actors keep
+        playing between calls until close() is called.
+
+        Parameters:
+        total_timesteps: the number of transitions to learn from
+        callback: optional function called with the stats dictionary after every update,
+        training stops early if it returns False
+
+        Returns:
+        stats: samples, updates, learn_time (seconds in updates), wait_time (seconds waiting
+        for segments) and mean_lag (mean number of broadcasts the consumed segments were behind)
+        """
+        if self.actors is None:
+            self._start_actors()
+        try:
+            while self.stats['samples'] < total_timesteps:
+                start = time.perf_counter()
+                segments = [self.trajectories.get() for _ in range(self.segments_per_batch)]
+                self.stats['wait_time'] += time.perf_counter() - start
+                self.lags.extend(self.version.value - segment['version'] for segment in segments)
+                start = time.perf_counter()
+                self.update(segments)
+                self.stats['learn_time'] += time.perf_counter() - start
+                self.stats['samples'] += len(segments) * self.n_steps
+                self.stats['updates'] += 1
+                self.stats['mean_lag'] = float(np.mean(self.lags))
+                if self.stats['updates'] % self.broadcast_interval == 0:
+                    self.broadcast()
+                if callback is not None and callback(self.stats) is False:
+                    break
+        except BaseException:
+            self.close()
+            raise
+        return self.stats
+
+def evaluate(env, trinet, games, max_turns, seed):
+    """
+    Score of trinet against the random player, moving first in half of the games
+
+    Returns:
+    score: wins plus half the draws, divided by the number of games
+    """
+    from tournament import play_game
+    score = 0.0
+    for game in range(games):
+        seat = game % 2
+        agents = [trinet, None] if seat == 0 else [None, trinet]
+        winner, _ = play_game(env, agents, seed + game, max_turns)
+        score += 0.5 if winner is None else float(winner == seat)
+    return score / games
+
+def train_report(name, env, trinet, train_chunk, budget, eval_games, max_turns, target, seed):
+    """
+    Alternate train_chunk(timesteps) calls with evaluations until budget training seconds are spent.
+    Evaluation time is not counted.
+
+    Returns:
+    samples_per_sec: training samples per training second
+    time_to_target: training seconds until the score against random first reached target, None if it never did
+    curve: a list of (training seconds, samples, score)
+    """
+    elapsed, samples, curve, time_to_target = 0.0, 0, [], None
+    while elapsed < budget:
+        start = time.perf_counter()
+        samples += train_chunk()
+        elapsed += time.perf_counter() - start
+        score = evaluate(env, trinet, eval_games, max_turns, seed)
+        curve.append((elapsed, samples, score))
+        print(f"{name:>6s} {elapsed:8.1f}s {samples:8d} samples  score {score:.3f}")
+        if time_to_target is None and score >= target:
+            time_to_target = elapsed
+    return samples / elapsed, time_to_target, curve
+
+if __name__ == "__main__":
+    from risk_env import RiskEnv, Player
+    from risk_env_wrapper import RiskEnvWrapper
+    from trinet import TriNet
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--board", type=str, default="small.json", help="Path to board configuration JSON")
+    parser.add_argument("--budget", type=float, default=120, help="Training seconds per mode")
+    parser.add_argument("--chunk", type=int, default=4096, help="Timesteps between evaluations")
+    parser.add_argument("--actors", type=int, default=2, help="Actor processes of the asynchronous mode")
+    parser.add_argument("--eval-games", type=int, default=20, help="Games against random per evaluation")
+    parser.add_argument("--max-turns", type=int, default=100, help="Turns after which an evaluation game is a draw")
+    parser.add_argument("--target", type=float, default=0.6, help="Score against random to time")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    players = [Player(i) for i in range(2)]
+    env = RiskEnvWrapper(RiskEnv(args.board, players, seed=args.seed), compact_obs=True)
+    eval_env = RiskEnvWrapper(RiskEnv(args.board, players), max_episode_steps=args.max_turns, compact_obs=True)
+    results = {}
+
+    torch.manual_seed(args.seed)
+    trinet = TriNet(env, seed=args.seed)
+    trinet.agent.verbose = 0
+    def sync_chunk():
+        trinet.agent.learn(total_timesteps=args.chunk, reset_num_timesteps=False)
+        return args.chunk
+    results['sync'] = train_report("sync", eval_env, trinet, sync_chunk, args.budget, args.eval_games,
+                                   args.max_turns, args.target, args.seed)
+
+    torch.manual_seed(args.seed)
+    trinet = TriNet(env, seed=args.seed)
+    learner = ActorLearner(trinet, env, num_actors=args.actors, seed=args.seed)
+    def async_chunk():
+        before = learner.stats['samples']
+        learner.learn(before + args.chunk)
+        return learner.stats['samples'] - before
+    results['async'] = train_report("async", eval_env, trinet, async_chunk, args.budget, args.eval_games,
+                                    args.max_turns, args.target, args.seed)
+    learner.close()
+
+    print(f"{'mode':>6s} {'samples/sec':>12s} {'time to ' + str(args.target):>14s} {'final score':>12s}")
+    for name, (samples_per_sec, time_to_target, curve) in results.items():
+        reached = f"{time_to_target:.1f}s" if time_to_target is not None else "not reached"
+        print(f"{name:>6s} {samples_per_sec:12.1f} {reached:>14s} {curve[-1][2]:12.3f}")
+    print(f"policy lag of the consumed segments: {learner.stats['mean_lag']:.2f} broadcasts")
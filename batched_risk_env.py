@@ -0,0 +1,328 @@
+import numpy as np
+
+from board_cache import load_board
+from risk_env import roll_dice_block
+
+class BatchedRiskEnv():
+    def __init__(self, board, players, num_envs, seed=None):
+        """
+        Initialize N independent Risk games on the same board, stored as struct-of-arrays
+        Parameters:
+        board: path to a JSON file representing the board, compiled once and shared through board_cache
+        players: a list of player objects (shared by every game)
+        num_envs: the number of games N to step together
+        seed: seed of the games' generators. Game n gets its own generator, seeded with
+        np.random.SeedSequence(seed).spawn(num_envs)[n], and plays exactly like a RiskEnv
+        seeded with the same SeedSequence
+
+        Class variables:
+        owners: a N x T numpy array with the owner id of every territory in every game
+        units: a N x T numpy array with the number of units on every territory in every game
+        adjacencies: a T x T numpy array representing the adjacency matrix of the territories
+        territories: a dictionary of territories and their corresponding indices
+        continents: a dictionary of continents and their corresponding territories
+        winner: a numpy array of shape (N,) with the winning player id of each game, -1 if none
+        current_player_id: a numpy array of shape (N,) with the player to move in each game
+        rngs: the N np.random.Generators the deals of the games come from
+        dice_states: a numpy array of shape (N,) with the dice counter of every game, seeded from its
+        generator like RiskEnv.dice_state
+
+        Note: every phase mirrors the rules of RiskEnv exactly, only applied to all N games at once
+        """
+        board = load_board(board)
+        self.players = players
+        self.board = board
+        self.num_envs = num_envs
+        self.territories, self.adjacencies, self.continents = board.territories, board.adjacencies, board.continents
+        self.T = board.num_territories
+        self.adjacent = self.adjacencies == 1
+        # the CSR edge list is sorted by source then target, the row-major order of RiskEnv.attack
+        self.edge_sources, self.edge_targets = board.edge_sources, board.edge_targets
+        self.source_incidence = np.zeros((board.num_edges, self.T))
+        self.source_incidence[np.arange(board.num_edges), self.edge_sources] = 1
+        self.seed(np.random.SeedSequence(seed).spawn(num_envs))
+        self.reset()
+
+    def seed(self, seeds):
+        """
+        Seed the generator and dice counter of every game like RiskEnv.seed
+        """
+        self.rngs = [np.random.default_rng(seed) for seed in seeds]
+        self.dice_states = np.array([rng.integers(0, 2 ** 64, dtype=np.uint64) for rng in self.rngs], dtype=np.uint64)
+
+    def reset(self, seeds=None):
+        """
+        Reset every game to a fresh random initial state
+
+        Parameters:
+        seeds: optional list of N seeds. The generator of game n is then reseeded, so that the game
+        plays exactly like RiskEnv.reset(seed=seeds[n])
+        """
+        N, T = self.num_envs, self.T
+        num_players = len(self.players)
+        if seeds is not None:
+            self.seed(seeds)
+        # every game shuffles with its own generator, like RiskEnv.init_game_state
+        indices = np.tile(np.arange(T), (N, 1))
+        for n, rng in enumerate(self.rngs):
+            rng.shuffle(indices[n])
+        self.owners = np.zeros((N, T), dtype=np.int64)
+        self.owners[np.arange(N)[:, None], indices] = np.arange(T) % num_players
+        self.units = np.ones((N, T), dtype=np.int64)
+        self.start_player_id = np.full(N, T % num_players)
+        self.winner = np.full(N, -1)
+        self.turn = np.zeros(N, dtype=np.int64)
+        self.current_player_id = np.zeros(N, dtype=np.int64)
+
+    def check_winner(self):
+        """
+        Check every game for a winner and update the winner variable
+
+        Returns:
+        done: boolean array of shape (N,) indicating which games have a winner
+        winner: array of shape (N,) with the winning player id, -1 where there is none
+        """
+        done = np.all(self.owners == self.owners[:, :1], axis=1)
+        self.winner = np.where(done, self.owners[:, 0], -1)
+        return done, self.winner
+
+    def get_reinforcements(self, player_id):
+        """
+        Get the number of reinforcements for a player in every game
+
+        Parameters:
+        player_id: array of shape (N,) with the player id for each game
+
+        Returns:
+        reinforcements: array of shape (N,) with the number of reinforcements
+        """
+        owned = self.owners == np.asarray(player_id)[:, None]
+        reinforcements = np.zeros(self.num_envs, dtype=np.int64)
+        for continent, (start, end, bonus) in self.continents.items():
+            reinforcements += np.all(owned[:, start:end], axis=1) * bonus
+        reinforcements += np.maximum(3, np.sum(owned, axis=1))
+        return reinforcements
+
+    def reinforce(self, player_id, reinforce_action):
+        """
+        Reinforce territories in every game
+
+        Parameters:
+        player_id: array of shape (N,) with the player id for each game
+        reinforce_action: a N x T numpy array with the number of units to add to each territory.
+        Games that request more than their reinforcements are skipped, as in RiskEnv
+        """
+        owned = self.owners == np.asarray(player_id)[:, None]
+        if np.any((reinforce_action < 0) & owned):
+            raise ValueError("Cannot reinforce territories you do not own")
+        valid = np.sum(reinforce_action, axis=1) <= self.get_reinforcements(player_id)
+        self.units += (reinforce_action * valid[:, None]).astype(self.units.dtype)
+
+    def attack(self, player_id, attack_action):
+        """
+        Attack along edges in every game
+
+        Edges are resolved in the same row-major order as RiskEnv.attack. The k-th edge of
+        every game is fought at the same time, so the Python loop runs over the largest
+        number of attacks in any one game rather than over all attacks in all games.
+        An attack on a territory that was conquered earlier in the same phase is dropped,
+        as in RiskEnv.
+
+        Parameters:
+        player_id: array of shape (N,) with the player id for each game
+        attack_action: a N x T x T numpy array which is the number of units to attack
+        along an edge from i to j in each game
+
+        Returns:
+        winner: boolean array of shape (N,) indicating which games have a winner
+        """
+        game, src, dest = np.nonzero(attack_action > 0)
+        return self._attack(np.asarray(player_id), game, src, dest, attack_action[game, src, dest])
+
+    def _attack(self, player_id, games, sources, targets, units):
+        """
+        Fight a list of attacks, sorted by game and in the order every game fights them
+
+        Parameters:
+        player_id: array of shape (N,) with the player id for each game
+        games, sources, targets, units: arrays with the game, edge and units of every attack
+        """
+        if len(games) == 0:
+            return self.check_winner()[0]
+        owned_before = self.owners == player_id[:, None]
+        counts = np.bincount(games, minlength=self.num_envs)
+        rank = np.arange(len(games)) - (np.cumsum(counts) - counts)[games]
+        for k in range(counts.max()):
+            kth = rank == k
+            game, src, dest = games[kth], sources[kth], targets[kth]
+            pid = player_id[game]
+            if np.any(self.owners[game, src] != pid):
+                raise ValueError("Cannot attack from a territory you do not own")
+            if np.any(owned_before[game, dest]):
+                raise ValueError("Cannot attack a territory you own")
+            if np.any(~self.adjacent[src, dest]):
+                raise ValueError("Cannot attack a non-adjacent territory")
+            if np.any(self.units[game, src] < 2):
+                raise ValueError("Must have at least 2 units to attack")
+            contested = self.owners[game, dest] != pid
+            game, src, dest, pid = game[contested], src[contested], dest[contested], pid[contested]
+            self._battle(game, src, dest, pid, units[kth][contested].astype(np.int64))
+        return self.check_winner()[0]
+
+    def _battle(self, game, src, dest, pid, attack_units):
+        """
+        Roll out one battle per game until the attacker runs out or the defender is wiped out.
+        Every round rolls the fixed block of dice of RiskEnv.roll_dice from each game's own dice
+        counter, for all games in one draw. Unused dice are padded with 7 so that the ascending
+        sort of RiskEnv.attack is preserved.
+        """
+        while len(game):
+            defend_units = self.units[game, dest]
+            # a game fights at most one battle at a time, so its counter is advanced once per round
+            dice, self.dice_states[game] = roll_dice_block(self.dice_states[game])
+            attack_dice, defend_dice = dice[:, :3], dice[:, 3:]
+            attack_dice[np.arange(3) >= np.minimum(attack_units, 3)[:, None]] = 7
+            defend_dice[np.arange(2) >= np.minimum(defend_units, 2)[:, None]] = 7
+            attack_dice = np.sort(attack_dice, axis=1)
+            defend_dice = np.sort(defend_dice, axis=1)
+            comparisons = np.minimum(np.minimum(attack_units, defend_units), 2)
+            for i in range(2):
+                rolled = i < comparisons
+                won = rolled & (attack_dice[:, i] > defend_dice[:, i])
+                lost = rolled & ~won
+                self.units[game, dest] -= won
+                self.units[game, src] -= lost
+                attack_units = attack_units - lost
+            conquered = self.units[game, dest] == 0
+            self.owners[game[conquered], dest[conquered]] = pid[conquered]
+            self.units[game[conquered], dest[conquered]] = attack_units[conquered]
+            active = ~conquered & (attack_units > 0)
+            game, src, dest, pid, attack_units = game[active], src[active], dest[active], pid[active], attack_units[active]
+
+    def fortify(self, player_id, fortify_action):
+        """
+        Fortify a territory in every game
+
+        Parameters:
+        player_id: array of shape (N,) with the player id for each game
+        fortify_action: a N x T x T numpy array, the largest entry of each game is the
+        number of units to move from its row territory to its column territory
+        """
+        flat = fortify_action.reshape(self.num_envs, -1)
+        best = np.argmax(flat, axis=1)
+        quantity = flat[np.arange(self.num_envs), best]
+        game = np.nonzero(quantity != 0)[0]
+        src, dest = np.unravel_index(best[game], (self.T, self.T))
+        self._fortify(np.asarray(player_id), game, src, dest, quantity[game])
+
+    def _fortify(self, player_id, game, src, dest, quantity, check_link=True):
+        """
+        Move quantity units from src to dest in every listed game, at most all units but one
+        """
+        if len(game) == 0:
+            return
+        quantity = quantity.astype(np.int64)
+        pid = player_id[game]
+        if np.any(self.owners[game, src] != pid):
+            raise ValueError("Cannot fortify from a territory you do not own")
+        if np.any(self.owners[game, dest] != pid):
+            raise ValueError("Cannot fortify to a territory you do not own")
+        if check_link and not np.all(self.is_link(game, pid, src, dest)):
+            raise ValueError("Cannot fortify unconnected territories")
+
+        fortify_quantity = np.minimum(quantity, self.units[game, src] - 1)
+        self.units[game, src] -= fortify_quantity
+        self.units[game, dest] += fortify_quantity
+
+    def is_link(self, game, player_id, src, dest):
+        """
+        Check if two territories are connected by a single player, for several games at once
+
+        Parameters:
+        game: array of game indices
+        player_id: array with the player id for each listed game
+        src: array with the index of the source territory for each listed game
+        dest: array with the index of the destination territory for each listed game
+
+        Returns:
+        is_link: boolean array indicating whether the territories are connected
+        """
+        owned = self.owners[game] == player_id[:, None]
+        reached = np.zeros(owned.shape, dtype=bool)
+        reached[np.arange(len(game)), src] = True
+        adjacencies = self.adjacencies.astype(np.float32)
+        while True:
+            expanded = reached | (((reached @ adjacencies) > 0) & owned)
+            if np.array_equal(expanded, reached):
+                return reached[np.arange(len(game)), dest]
+            reached = expanded
+
+    def filter_actions(self, reinforce_action, attack_units, fortify_units):
+        """
+        Vectorized equivalent of RiskEnvWrapper.filter_actions for the current player of every game
+
+        Parameters:
+        reinforce_action: a N x T array with the reinforcement distribution
+        attack_units: a N x T x T integer array of requested attacks
+        fortify_units: a N x T x T integer array of requested fortifications
+
+        Returns:
+        reinforce_action, attack_units, fortify_units restricted to legal moves
+        """
+        reinforce_action, attack_edges, fortify_edges = self._filter_edges(reinforce_action, attack_units, fortify_units)
+        attack_filtered, fortify_filtered = np.zeros_like(attack_units), np.zeros_like(fortify_units)
+        attack_filtered[:, self.edge_sources, self.edge_targets] = attack_edges
+        fortify_filtered[:, self.edge_sources, self.edge_targets] = fortify_edges
+        return reinforce_action, attack_filtered, fortify_filtered
+
+    def _filter_edges(self, reinforce_action, attack_units, fortify_units):
+        """
+        filter_actions on the board's edges, the only entries a legal attack or fortify can use
+
+        Returns:
+        reinforce_action: the filtered N x T reinforcements
+        attack_units, fortify_units: the filtered N x E units of every edge, in the order of the edge list
+        """
+        owned = self.owners == self.current_player_id[:, None]
+        reinforce_action = reinforce_action * owned
+        total = np.sum(reinforce_action, axis=1)
+        reinforce_action = reinforce_action / np.where(total > 0, total, 1)[:, None]
+        reinforce_action = np.nan_to_num(reinforce_action)
+        reinforce_action = (reinforce_action * self.get_reinforcements(self.current_player_id)[:, None]).astype(np.int32)
+
+        # fortify targets are adjacent and owned, so they are always linked
+        sources, targets = self.edge_sources, self.edge_targets
+        movable = (self.units >= 2)[:, sources] & owned[:, sources]
+        attack_units = attack_units[:, sources, targets] * (movable & ~owned[:, targets])
+        fortify_units = fortify_units[:, sources, targets] * (movable & owned[:, targets])
+
+        max_units_available = np.maximum(self.units - 1, 0)[:, sources]
+        for units in (attack_units, fortify_units):
+            # the units requested from the source of every edge, over all its edges
+            total = (units @ self.source_incidence)[:, sources]
+            over = total > max_units_available
+            scaled = (units / np.where(total > 0, total, 1) * max_units_available).astype(np.int32)
+            units[over] = scaled[over]
+        return reinforce_action, attack_units, fortify_units
+
+    def step(self, reinforce_action, attack_units, fortify_units):
+        """
+        Play one full turn (reinforce, attack, fortify) for the current player of every game.
+        Actions are filtered like RiskEnvWrapper.step does before they are applied.
+
+        Returns:
+        done: boolean array of shape (N,) indicating which games have a winner
+        """
+        reinforce_action, attack_units, fortify_units = self._filter_edges(reinforce_action, attack_units, fortify_units)
+        self.reinforce(self.current_player_id, reinforce_action)
+        game, edge = np.nonzero(attack_units > 0)
+        self._attack(self.current_player_id, game, self.edge_sources[edge], self.edge_targets[edge], attack_units[game, edge])
+        # the first largest move in edge order is the first in the row-major order of RiskEnv.fortify
+        best = np.argmax(fortify_units, axis=1)
+        quantity = fortify_units[np.arange(self.num_envs), best]
+        game = np.nonzero(quantity != 0)[0]
+        self._fortify(self.current_player_id, game, self.edge_sources[best[game]], self.edge_targets[best[game]],
+                      quantity[game], check_link=False)
+        self.current_player_id = (self.current_player_id + 1) % len(self.players)
+        self.turn += 1
+        return self.check_winner()[0]
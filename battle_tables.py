@@ -0,0 +1,141 @@
+"""
+Precomputed battle outcome distributions for the "resolved dice" attack mode of RiskEnv
+"""
+
+import os
+import tempfile
+import itertools
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+
+_tables = {}
+
+def round_outcomes():
+    """
+    Enumerate every dice roll of a single round of RiskEnv.attack
+
+    Returns:
+    rounds: a dictionary mapping (attacker dice, defender dice) to a list of
+    (attacker lost, defender lost, probability) tuples
+    """
+    rounds = {}
+    for attack_dice, defend_dice in itertools.product(range(1, 4), range(1, 3)):
+        # RiskEnv.attack sorts both rolls ascending and compares the lowest dice
+        comparisons = min(attack_dice, defend_dice)
+        counts = np.zeros(comparisons + 1)
+        for roll in itertools.product(range(1, 7), repeat=attack_dice + defend_dice):
+            attack_roll = sorted(roll[:attack_dice])
+            defend_roll = sorted(roll[attack_dice:])
+            wins = sum(attack_roll[i] > defend_roll[i] for i in range(comparisons))
+            counts[wins] += 1
+        counts /= counts.sum()
+        rounds[(attack_dice, defend_dice)] = [(comparisons - wins, wins, p) for wins, p in enumerate(counts) if p > 0]
+    return rounds
+
+class BattleTable():
+    """
+    Exact distribution of the final outcome of a battle, indexed by (attacking units, defending units)
+    up to a cap. The outcome of a battle between a attackers and d defenders is a vector of length a + d:
+    entry k < a is the probability that the defender is wiped out after the attacker lost k units,
+    entry a + m is the probability that the attacker runs out after the defender lost m units.
+    """
+    def __init__(self, cap=64, cache_dir=DEFAULT_CACHE_DIR):
+        """
+        Load the table from cache_dir, computing and saving it if it is not there yet
+
+        Parameters:
+        cap: the largest number of attacking or defending units in the table
+        cache_dir: directory of the cached table, None to disable the disk cache
+        """
+        self.cap = cap
+        path = os.path.join(cache_dir, f"battle_table_{cap}.npz") if cache_dir else None
+        if path and os.path.exists(path):
+            data = np.load(path)
+            self.offsets, self.cumulative = data["offsets"], data["cumulative"]
+            return
+        self.offsets, self.cumulative = self._compute()
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+            # write a private file and rename it, so concurrent workers never read a partial table
+            fd, staging = tempfile.mkstemp(dir=cache_dir, suffix=".npz")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    np.savez(f, offsets=self.offsets, cumulative=self.cumulative)
+                os.replace(staging, path)
+            except BaseException:
+                os.remove(staging)
+                raise
+
+    def _compute(self):
+        """
+        Solve the Markov chain of the dice loop for every (a, d) up to the cap. After one round
+        losing (la, ld) the battle continues from (a - la, d - ld), so each outcome vector is a
+        mixture of shifted outcome vectors of smaller battles.
+        """
+        cap = self.cap
+        rounds = round_outcomes()
+        outcomes = {}
+        for a in range(cap + 1):
+            for d in range(cap + 1):
+                outcome = np.zeros(a + d)
+                if a == 0 or d == 0:
+                    if a + d:
+                        outcome[0 if d == 0 else a] = 1.0
+                    outcomes[(a, d)] = outcome
+                    continue
+                for attacker_lost, defender_lost, p in rounds[(min(a, 3), min(d, 2))]:
+                    rest_a, rest_d = a - attacker_lost, d - defender_lost
+                    rest = outcomes[(rest_a, rest_d)]
+                    if rest_d == 0:
+                        outcome[attacker_lost] += p
+                    elif rest_a == 0:
+                        outcome[a + defender_lost] += p
+                    else:
+                        outcome[attacker_lost:attacker_lost + rest_a] += p * rest[:rest_a]
+                        outcome[a + defender_lost:a + defender_lost + rest_d] += p * rest[rest_a:]
+                outcomes[(a, d)] = outcome
+
+        sizes = np.add.outer(np.arange(cap + 1), np.arange(cap + 1))
+        offsets = (np.cumsum(sizes) - sizes.ravel()).reshape(sizes.shape)
+        cumulative = np.concatenate([np.cumsum(outcomes[(a, d)]) for a in range(cap + 1) for d in range(cap + 1)])
+        return offsets, cumulative
+
+    def distribution(self, attack_units, defend_units):
+        """
+        Get the outcome distribution of a battle
+
+        Returns:
+        distribution: a vector of length attack_units + defend_units, see the class docstring
+        """
+        start = self.offsets[attack_units, defend_units]
+        cumulative = self.cumulative[start:start + attack_units + defend_units]
+        return np.diff(cumulative, prepend=0.0)
+
+    def sample(self, attack_units, defend_units, u):
+        """
+        Sample the outcome of a battle with a single uniform draw
+
+        Parameters:
+        attack_units: number of attacking units, at most the cap
+        defend_units: number of defending units, at most the cap
+        u: a uniform random number in [0, 1)
+
+        Returns:
+        attacker_lost: number of units the attacker lost
+        defender_lost: number of units the defender lost
+        """
+        start = self.offsets[attack_units, defend_units]
+        cumulative = self.cumulative[start:start + attack_units + defend_units]
+        k = min(int(np.searchsorted(cumulative, u * cumulative[-1], side="right")), attack_units + defend_units - 1)
+        if k < attack_units:
+            return k, defend_units
+        return attack_units, k - attack_units
+
+def load_battle_table(cap=64, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Get the battle table for cap, shared by every env in the process
+    """
+    if (cap, cache_dir) not in _tables:
+        _tables[(cap, cache_dir)] = BattleTable(cap, cache_dir)
+    return _tables[(cap, cache_dir)]
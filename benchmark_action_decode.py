@@ -0,0 +1,50 @@
+import argparse
+import time
+import numpy as np
+
+from risk_env import RiskEnv, Player
+from risk_env_wrapper import RiskEnvWrapper, split_edge_action
+
+def decode_seconds(env, actions):
+    """
+    Measure the mean seconds to decode and filter one action against the current state
+    """
+    start = time.perf_counter()
+    for action in actions:
+        if env.edge_actions:
+            env.filter_edge_actions(*split_edge_action(action, env.T, env.E))
+        else:
+            T = env.T
+            attack_units = (action[T:T + T * T].reshape((T, T)) * (T + 1)).astype(np.int32)
+            fortify_units = (action[T + T * T:].reshape((T, T)) * (T + 1)).astype(np.int32)
+            env.filter_actions(action[:T], attack_units, fortify_units)
+    return (time.perf_counter() - start) / len(actions)
+
+def play(env, steps, seed):
+    """
+    Play random steps and check that every observation stays inside the observation space
+    """
+    env.action_space.seed(seed)
+    obs, _ = env.reset(seed=seed)
+    for _ in range(steps):
+        assert env.observation_space.contains(obs)
+        obs, _, done, _, _ = env.step(env.action_space.sample())
+        if done:
+            obs, _ = env.reset()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--board", type=str, default="world.json", help="Path to board configuration JSON")
+    parser.add_argument("--steps", type=int, default=200, help="Actions to decode per mode")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    players = [Player(i) for i in range(2)]
+    print(f"{'actions':8s} {'size':>6s} {'decode ms':>10s}")
+    for edge_actions in (False, True):
+        env = RiskEnvWrapper(RiskEnv(args.board, players), action_mask=True, compact_obs=True, edge_actions=edge_actions)
+        play(env, args.steps, args.seed)
+        env.action_space.seed(args.seed)
+        actions = [env.action_space.sample() for _ in range(args.steps)]
+        seconds = decode_seconds(env, actions)
+        print(f"{'edges' if edge_actions else 'dense':8s} {env.action_space.shape[0]:6d} {seconds * 1000:10.3f}")
@@ -0,0 +1,91 @@
+import argparse
+import time
+import numpy as np
+
+from risk_env import RiskEnv, Player
+from risk_env_wrapper import RiskEnvWrapper
+from batched_risk_env import BatchedRiskEnv
+
+def random_actions(rng, num_envs, T):
+    """
+    Sample N raw actions in the same format RiskEnvWrapper.step decodes
+    """
+    action = rng.random((num_envs, T + 2 * T * T)).astype(np.float32)
+    reinforce = action[:, :T]
+    attack_units = (action[:, T:T + T * T].reshape((num_envs, T, T)) * (T + 1)).astype(np.int32)
+    fortify_units = (action[:, T + T * T:].reshape((num_envs, T, T)) * (T + 1)).astype(np.int32)
+    return reinforce, attack_units, fortify_units
+
+def check_parity(args):
+    """
+    Check that every game of the batched env plays exactly like a RiskEnv seeded with its
+    SeedSequence: the same deal, filtered actions and battles, turn by turn
+    """
+    players = [Player(i) for i in range(2)]
+    batched = BatchedRiskEnv(args.board, players, args.num_envs, seed=args.seed)
+    envs = []
+    for n, seed in enumerate(np.random.SeedSequence(args.seed).spawn(args.num_envs)):
+        env = RiskEnvWrapper(RiskEnv(args.board, players, seed=seed))
+        env.risk_env.current_player_id = batched.current_player_id[n]
+        envs.append(env)
+
+    rng = np.random.default_rng(args.seed)
+    for _ in range(args.turns):
+        reinforce, attack_units, fortify_units = random_actions(rng, args.num_envs, batched.T)
+        for n, env in enumerate(envs):
+            risk_env = env.risk_env
+            r, a, f = env.filter_actions(reinforce[n], attack_units[n].copy(), fortify_units[n].copy())
+            risk_env.reinforce(risk_env.current_player_id, r)
+            risk_env.attack(risk_env.current_player_id, a)
+            risk_env.fortify(risk_env.current_player_id, f)
+            risk_env.current_player_id = (risk_env.current_player_id + 1) % len(players)
+        batched.step(reinforce, attack_units, fortify_units)
+        for n, env in enumerate(envs):
+            assert np.array_equal(env.risk_env.game_state[:, 0], batched.owners[n]), f"game {n} owners differ"
+            assert np.array_equal(env.risk_env.game_state[:, 1], batched.units[n]), f"game {n} units differ"
+    print(f"identical to seeded RiskEnv games over {args.turns} turns x {args.num_envs} games")
+
+def benchmark(args):
+    """
+    Time the same number of turns with N separate RiskEnvWrapper instances and with one BatchedRiskEnv
+    """
+    players = [Player(i) for i in range(2)]
+    batched = BatchedRiskEnv(args.board, players, args.num_envs, seed=args.seed)
+    rng = np.random.default_rng(args.seed)
+    actions = [random_actions(rng, args.num_envs, batched.T) for _ in range(args.turns)]
+
+    start = time.perf_counter()
+    for reinforce, attack_units, fortify_units in actions:
+        batched.step(reinforce, attack_units, fortify_units)
+    batched_time = time.perf_counter() - start
+
+    envs = [RiskEnvWrapper(RiskEnv(args.board, players)) for _ in range(args.num_envs)]
+    start = time.perf_counter()
+    for reinforce, attack_units, fortify_units in actions:
+        for n, env in enumerate(envs):
+            env.risk_env.current_player_id = batched.current_player_id[n]
+            r, a, f = env.filter_actions(reinforce[n], attack_units[n].copy(), fortify_units[n].copy())
+            env.risk_env.reinforce(env.risk_env.current_player_id, r)
+            env.risk_env.attack(env.risk_env.current_player_id, a)
+            env.risk_env.fortify(env.risk_env.current_player_id, f)
+    sequential_time = time.perf_counter() - start
+
+    total = args.num_envs * args.turns
+    print(f"{args.board}: {args.num_envs} games x {args.turns} turns")
+    print(f"RiskEnv x N:    {total / sequential_time:10.1f} steps/sec")
+    print(f"BatchedRiskEnv: {total / batched_time:10.1f} steps/sec")
+    print(f"speedup:        {sequential_time / batched_time:10.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--board", type=str, default="world.json", help="Path to board configuration JSON")
+    parser.add_argument("--num_envs", type=int, default=1000, help="Number of games stepped together")
+    parser.add_argument("--turns", type=int, default=10, help="Number of turns to play")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--parity", action="store_true", help="Check results against RiskEnv instead of timing")
+    args = parser.parse_args()
+
+    if args.parity:
+        check_parity(args)
+    else:
+        benchmark(args)
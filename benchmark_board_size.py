@@ -0,0 +1,79 @@
+import os
+import argparse
+import json
+import tempfile
+import time
+import numpy as np
+
+from risk_env import RiskEnv, Player
+from generate_board import generate_board
+
+def random_turn(env, rng):
+    """
+    Build random legal reinforce, attack and fortify actions for the current player as edge lists
+    """
+    player_id = env.current_player_id
+    owners, units = env.game_state[:,0], env.game_state[:,1]
+    owned = owners == player_id
+    sources, targets = env.board.edge_sources, env.board.edge_targets
+
+    reinforce = np.zeros(len(owners), dtype=np.int64)
+    reinforce[owned] = rng.multinomial(env.get_reinforcements(player_id), np.full(owned.sum(), 1 / owned.sum()))
+
+    # every source with spare units attacks one random enemy neighbor with all of them
+    legal = owned[sources] & ~owned[targets] & (units[sources] >= 2)
+    edges = rng.permutation(np.nonzero(legal)[0])
+    edges = np.sort(edges[np.unique(sources[edges], return_index=True)[1]])
+    attack = (sources[edges], targets[edges], units[sources[edges]] - 1)
+
+    legal = owned[sources] & owned[targets] & (units[sources] >= 2)
+    edges = np.nonzero(legal)[0][:1]
+    fortify = (sources[edges], targets[edges], units[sources[edges]] - 1)
+    return reinforce, attack, fortify
+
+def time_board(path, turns, seed):
+    """
+    Play random turns on a board and measure the time per turn of RiskEnv
+
+    Returns:
+    setup: seconds to build the env
+    per_turn: mean seconds per reinforce/attack/fortify turn
+    """
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    env = RiskEnv(path, [Player(0), Player(1)], attack_mode="resolved", seed=seed)
+    setup = time.perf_counter() - start
+    elapsed = 0.0
+    for _ in range(turns):
+        reinforce, attack, fortify = random_turn(env, rng)
+        start = time.perf_counter()
+        env.reinforce(env.current_player_id, reinforce)
+        env.attack(env.current_player_id, attack)
+        env.fortify(env.current_player_id, fortify)
+        env.current_player_id = (env.current_player_id + 1) % len(env.players)
+        elapsed += time.perf_counter() - start
+        if env.check_winner()[0]:
+            env.reset()
+    return setup, elapsed / turns
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3, 42, 100, 500, 1000, 5000], help="Territory counts to generate")
+    parser.add_argument("--continents", type=int, default=6, help="Number of continents")
+    parser.add_argument("--degree", type=str, default="poisson", choices=["fixed", "poisson", "powerlaw"],
+                        help="Distribution of the target degree of each territory")
+    parser.add_argument("--mean-degree", type=float, default=4.0, help="Mean target degree")
+    parser.add_argument("--turns", type=int, default=50, help="Turns to time per board")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    print(f"{'T':>6s} {'edges':>7s} {'setup ms':>9s} {'turn ms':>8s}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            board = generate_board(size, args.continents, args.degree, args.mean_degree, args.seed)
+            path = os.path.join(directory, f"generated_{size}.json")
+            with open(path, "w") as f:
+                json.dump(board, f)
+            setup, per_turn = time_board(path, args.turns, args.seed)
+            num_edges = sum(len(t["neighbors"]) for t in board["Territories"].values())
+            print(f"{size:6d} {num_edges:7d} {setup * 1000:9.2f} {per_turn * 1000:8.3f}")
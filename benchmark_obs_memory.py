@@ -0,0 +1,65 @@
+import argparse
+import numpy as np
+from stable_baselines3.common.buffers import DictRolloutBuffer
+
+from risk_env import RiskEnv, Player
+from risk_env_wrapper import RiskEnvWrapper
+
+def fortify_paths_from_compact(obs):
+    """
+    Rebuild the T x T fortify_paths of the full observation from a compact observation
+    """
+    owned = obs['owners'] == obs['current_player'][0]
+    linked = owned[:, None] & owned[None, :] & (obs['components'][:, None] == obs['components'][None, :])
+    return np.where(linked, obs['units'][:, None].astype(np.float64) - 1, 0.0)
+
+def check_equivalence(board, steps, seed):
+    """
+    Play the same random game with both observation modes and check that the compact
+    observation carries the same per-step information as the full one
+    """
+    players = [Player(i) for i in range(2)]
+    full = RiskEnvWrapper(RiskEnv(board, players))
+    compact = RiskEnvWrapper(RiskEnv(board, players), compact_obs=True)
+    full.action_space.seed(seed)
+    full_obs, _ = full.reset(seed=seed)
+    compact_obs, _ = compact.reset(seed=seed)
+    for _ in range(steps):
+        assert compact.observation_space.contains(compact_obs)
+        assert np.array_equal(full.risk_env.game_state, compact.risk_env.game_state)
+        assert np.array_equal(compact_obs['owners'], full_obs['owners'])
+        assert np.array_equal(fortify_paths_from_compact(compact_obs),
+                              full.risk_env.get_fortify_paths(full.risk_env.current_player_id))
+        action = full.action_space.sample()
+        full_obs, _, done, _, _ = full.step(action)
+        compact_obs, _, _, _, _ = compact.step(action)
+        if done:
+            full_obs, _ = full.reset()
+            compact_obs, _ = compact.reset()
+    print(f"compact observations match the full observations over {steps} steps")
+
+def buffer_bytes(env, n_steps, n_envs):
+    """
+    Get the bytes of observations held by a PPO rollout buffer for this env
+    """
+    buffer = DictRolloutBuffer(n_steps, env.observation_space, env.action_space, device="cpu", n_envs=n_envs)
+    return sum(array.nbytes for array in buffer.observations.values())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--board", type=str, default="world.json", help="Path to board configuration JSON")
+    parser.add_argument("--n-steps", type=int, default=2048, help="Rollout length of PPO")
+    parser.add_argument("--n-envs", type=int, default=1, help="Number of environments per rollout")
+    parser.add_argument("--steps", type=int, default=200, help="Steps to check for equivalence")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    check_equivalence(args.board, args.steps, args.seed)
+    players = [Player(i) for i in range(2)]
+    full = buffer_bytes(RiskEnvWrapper(RiskEnv(args.board, players)), args.n_steps, args.n_envs)
+    compact = buffer_bytes(RiskEnvWrapper(RiskEnv(args.board, players), compact_obs=True), args.n_steps, args.n_envs)
+    steps = args.n_steps * args.n_envs
+    print(f"{'mode':8s} {'bytes/step':>11s} {'buffer MB':>10s}")
+    print(f"{'full':8s} {full / steps:11.0f} {full / 2**20:10.2f}")
+    print(f"{'compact':8s} {compact / steps:11.0f} {compact / 2**20:10.2f}")
+    print(f"reduction: {full / compact:.1f}x")
@@ -0,0 +1,72 @@
+import argparse
+import time
+import numpy as np
+
+from risk_env import RiskEnv, Player
+from risk_env_wrapper import RiskEnvWrapper
+
+def play(env, actions):
+    """
+    Step through a list of actions and return the game states along the way
+    """
+    states = []
+    for action in actions:
+        env.step(action)
+        states.append(env.risk_env.game_state.copy())
+    return states
+
+def check_reproducible(board, steps, seed):
+    """
+    Check that two envs reset with the same seed play identical games, and that
+    restoring a snapshot replays the same dice
+    """
+    players = [Player(i) for i in range(2)]
+    envs = [RiskEnvWrapper(RiskEnv(board, players), max_episode_steps=steps) for _ in range(2)]
+    envs[0].action_space.seed(seed)
+    actions = [envs[0].action_space.sample() for _ in range(steps)]
+    for env in envs:
+        env.reset(seed=seed)
+    first, second = play(envs[0], actions), play(envs[1], actions)
+    assert all(np.array_equal(a, b) for a, b in zip(first, second)), "same seed played different games"
+
+    env = envs[0]
+    env.reset(seed=seed)
+    play(env, actions[:steps // 2])
+    snapshot = env.snapshot()
+    branch = play(env, actions[steps // 2:])
+    for _ in range(2):
+        env.restore(snapshot)
+        assert all(np.array_equal(a, b) for a, b in zip(branch, play(env, actions[steps // 2:]))), \
+            "restored env played a different game"
+    print(f"seeded resets and restored snapshots replay identically over {steps} steps")
+
+def snapshots_per_sec(board, count, seed):
+    """
+    Measure snapshots and restores per second on a game in progress
+    """
+    env = RiskEnvWrapper(RiskEnv(board, [Player(i) for i in range(2)]))
+    env.reset(seed=seed)
+    env.action_space.seed(seed)
+    for _ in range(10):
+        env.step(env.action_space.sample())
+    start = time.perf_counter()
+    snapshots = [env.snapshot() for _ in range(count)]
+    snapshot_rate = count / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for snapshot in snapshots:
+        env.restore(snapshot)
+    restore_rate = count / (time.perf_counter() - start)
+    return snapshot_rate, restore_rate
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--board", type=str, default="world.json", help="Path to board configuration JSON")
+    parser.add_argument("--steps", type=int, default=40, help="Steps to replay for the reproducibility check")
+    parser.add_argument("--count", type=int, default=10000, help="Snapshots to time")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    check_reproducible(args.board, args.steps, args.seed)
+    snapshot_rate, restore_rate = snapshots_per_sec(args.board, args.count, args.seed)
+    print(f"snapshots/sec: {snapshot_rate:10.0f}")
+    print(f"restores/sec:  {restore_rate:10.0f}")
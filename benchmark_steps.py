@@ -0,0 +1,209 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import numpy as np
+
+from risk_env import RiskEnv, Player
+from risk_env_wrapper import RiskEnvWrapper
+from profiler import StepProfiler
+from generate_board import generate_board
+from benchmark_board_size import random_turn
+
+TARGETS = ("env", "wrapper", "wrapper_edge")
+STREAMS = ("fixed", "random")
+PERCENTILES = (50, 90, 99)
+# peak memory growth below this many megabytes is never flagged
+MEMORY_SLACK_MB = 0.5
+
+def make_env(board, target, seed):
+    """
+    Build the env a target steps: RiskEnv itself, or RiskEnvWrapper with flat or edge actions
+    """
+    risk_env = RiskEnv(board, [Player(0), Player(1)], seed=seed)
+    if target == "env":
+        return risk_env
+    # episodes only end when someone wins, so every step is a full turn
+    return RiskEnvWrapper(risk_env, max_episode_steps=np.iinfo(np.int64).max, profiler=StepProfiler(),
+                          edge_actions=target == "wrapper_edge", compact_obs=target == "wrapper_edge")
+
+def sample_action(env, target, rng):
+    if target == "env":
+        return random_turn(env, rng)
+    return rng.random(env.action_space.shape).astype(np.float32)
+
+def timed_step(env, target, action, timings):
+    """
+    Play one turn, appending the seconds spent in each phase to timings. The wrapper targets
+    step through RiskEnvWrapper.step and read its profiling hooks.
+
+    Returns:
+    done: whether the game is over
+    """
+    if target != "env":
+        _, _, done, _, info = env.step(action)
+        for phase, seconds in info['profile'].items():
+            timings[phase].append(seconds)
+        timings['step'].append(sum(info['profile'].values()))
+        return done
+    clock = time.perf_counter
+    player_id = env.current_player_id
+    reinforce, attack, fortify = action
+    start = clock()
+    env.reinforce(player_id, reinforce)
+    reinforced = clock()
+    env.winner = env.attack(player_id, attack)
+    attacked = clock()
+    env.fortify(player_id, fortify)
+    fortified = clock()
+    env.current_player_id = (player_id + 1) % len(env.players)
+    timings['reinforce'].append(reinforced - start)
+    timings['attack'].append(attacked - reinforced)
+    timings['fortify'].append(fortified - attacked)
+    timings['step'].append(fortified - start)
+    return env.check_winner()[0]
+
+def run(board, target, steps, seed):
+    """
+    Step one target with a seeded action stream
+
+    Returns:
+    a dictionary with steps_per_sec and the mean and percentile latency of every phase in microseconds
+    """
+    env = make_env(board, target, seed)
+    rng = np.random.default_rng(seed)
+    phases = ["reinforce", "attack", "fortify", "step"] if target == "env" else \
+             ["filter", "reinforce", "attack", "fortify", "observe", "step"]
+    timings = {phase: [] for phase in phases}
+    if target != "env":
+        env.reset(seed=seed)
+    for _ in range(steps):
+        if timed_step(env, target, sample_action(env, target, rng), timings):
+            env.reset()
+    result = {'steps_per_sec': steps / sum(timings['step']), 'phases': {}}
+    for phase, values in timings.items():
+        values = np.array(values) * 1e6
+        result['phases'][phase] = {'mean_us': float(values.mean()),
+                                   **{f"p{q}_us": float(np.percentile(values, q)) for q in PERCENTILES}}
+    return result
+
+def peak_memory(board, target, steps, seed):
+    """
+    Peak traced allocation in megabytes while building the env and playing steps turns.
+    Measured separately since tracing slows every allocation down.
+    """
+    tracemalloc.start()
+    try:
+        env = make_env(board, target, seed)
+        rng = np.random.default_rng(seed)
+        timings = {phase: [] for phase in ("filter", "reinforce", "attack", "fortify", "observe", "step")}
+        if target != "env":
+            env.reset(seed=seed)
+        for _ in range(steps):
+            if timed_step(env, target, sample_action(env, target, rng), timings):
+                env.reset()
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with a baseline of the same format. A benchmark regresses when its steps/sec
+    falls, or its p50 latency of a phase or its peak memory rises, by more than tolerance.
+    Only the fixed stream entries found in both are compared, the random stream plays different
+    turns every run.
+
+    Returns:
+    regressions: a list of (key, metric, baseline value, new value)
+    """
+    regressions = []
+    for key, result in results.items():
+        if not key.endswith("/fixed") or key not in baseline:
+            continue
+        old = baseline[key]
+        if result['steps_per_sec'] < old['steps_per_sec'] * (1 - tolerance):
+            regressions.append((key, 'steps_per_sec', old['steps_per_sec'], result['steps_per_sec']))
+        for phase, stats in result['phases'].items():
+            if phase in old['phases'] and stats['p50_us'] > old['phases'][phase]['p50_us'] * (1 + tolerance):
+                regressions.append((key, f"{phase} p50_us", old['phases'][phase]['p50_us'], stats['p50_us']))
+        if 'peak_memory_mb' in result and 'peak_memory_mb' in old and \
+                result['peak_memory_mb'] > old['peak_memory_mb'] * (1 + tolerance) + MEMORY_SLACK_MB:
+            regressions.append((key, 'peak_memory_mb', old['peak_memory_mb'], result['peak_memory_mb']))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--boards", type=str, nargs="+", default=["small.json", "two.json", "world.json"],
+                        help="Board configuration JSONs")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[200, 1000], help="Territory counts of generated boards")
+    parser.add_argument("--targets", type=str, nargs="+", default=list(TARGETS), choices=TARGETS,
+                        help="env steps RiskEnv with edge lists, wrapper/wrapper_edge step RiskEnvWrapper with flat/edge actions")
+    parser.add_argument("--streams", type=str, nargs="+", default=list(STREAMS), choices=STREAMS,
+                        help="fixed replays the same seeded actions every run, random draws a fresh seed")
+    parser.add_argument("--max-flat-territories", type=int, default=200,
+                        help="Largest board the flat T + 2T^2 wrapper actions are benchmarked on")
+    parser.add_argument("--steps", type=int, default=200, help="Turns per benchmark")
+    parser.add_argument("--memory-steps", type=int, default=20, help="Turns of the traced peak memory pass, 0 skips it")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the fixed stream and of the generated boards")
+    parser.add_argument("--output", type=str, default="benchmark_results.json", help="Where to write the JSON results")
+    parser.add_argument("--baseline", type=str, default="benchmark_baseline.json",
+                        help="Results of this machine to compare against, if present (not committed, timings are machine specific)")
+    parser.add_argument("--save-baseline", action="store_true", help="Also write the results to --baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Relative change flagged as a regression")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'benchmark':40s} {'steps/sec':>10s} {'p50 ms':>8s} {'p99 ms':>8s} {'peak MB':>8s}")
+    with tempfile.TemporaryDirectory() as directory:
+        boards = [(os.path.basename(path), path) for path in args.boards]
+        for size in args.sizes:
+            path = os.path.join(directory, f"generated_{size}.json")
+            with open(path, "w") as f:
+                json.dump(generate_board(size, 6, seed=args.seed), f)
+            boards.append((f"generated_{size}", path))
+
+        for name, path in boards:
+            for target in args.targets:
+                T = len(RiskEnv(path, [Player(0), Player(1)]).game_state)
+                if target == "wrapper" and T > args.max_flat_territories:
+                    continue
+                for stream in args.streams:
+                    seed = args.seed if stream == "fixed" else int(np.random.SeedSequence().entropy % 2 ** 32)
+                    key = f"{name}/{target}/{stream}"
+                    result = run(path, target, args.steps, seed)
+                    if args.memory_steps > 0:
+                        result['peak_memory_mb'] = peak_memory(path, target, args.memory_steps, seed)
+                    result.update({'territories': T, 'steps': args.steps, 'seed': seed})
+                    results[key] = result
+                    step = result['phases']['step']
+                    print(f"{key:40s} {result['steps_per_sec']:10.1f} {step['p50_us'] / 1000:8.3f} "
+                          f"{step['p99_us'] / 1000:8.3f} {result.get('peak_memory_mb', float('nan')):8.2f}")
+
+    report = {
+        'meta': {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+                 'time': time.strftime("%Y-%m-%dT%H:%M:%S"), 'args': vars(args)},
+        'results': results
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=1)
+    print(f"results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=1)
+        print(f"baseline written to {args.baseline}")
+    elif not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}, record one on this machine with --save-baseline")
+    elif os.path.abspath(args.baseline) != os.path.abspath(args.output):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)['results'], args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions against {args.baseline} (tolerance {args.tolerance:.0%}):")
+            for key, metric, old, new in regressions:
+                print(f"  {key:40s} {metric:20s} {old:12.2f} -> {new:12.2f}")
+            sys.exit(1)
+        print(f"no regressions against {args.baseline}")
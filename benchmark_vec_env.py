@@ -0,0 +1,39 @@
+import argparse
+import time
+import numpy as np
+
+from risk_env import RiskEnv, Player
+from risk_env_wrapper import RiskEnvWrapper
+from shared_vec_env import make_vec_env, VEC_BACKENDS
+
+def env_steps_per_sec(board, n_envs, vec_backend, steps, seed):
+    """
+    Step n_envs environments with random actions and measure the total env-steps per second
+    """
+    env = RiskEnvWrapper(RiskEnv(board, [Player(i) for i in range(2)]))
+    vec_env = make_vec_env(env, n_envs=n_envs, vec_backend=vec_backend, seed=seed)
+    vec_env.action_space.seed(seed)
+    vec_env.reset()
+    actions = [np.stack([vec_env.action_space.sample() for _ in range(n_envs)]) for _ in range(steps)]
+    start = time.perf_counter()
+    for action in actions:
+        vec_env.step(action)
+    elapsed = time.perf_counter() - start
+    vec_env.close()
+    return n_envs * steps / elapsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--board", type=str, default="world.json", help="Path to board configuration JSON")
+    parser.add_argument("--n-envs", type=int, nargs="+", default=[1, 2, 4, 8], help="Numbers of environments to try")
+    parser.add_argument("--vec-backend", type=str, nargs="+", default=list(VEC_BACKENDS), choices=VEC_BACKENDS,
+                        help="Vectorized env backends to compare")
+    parser.add_argument("--steps", type=int, default=200, help="Vectorized steps per measurement")
+    parser.add_argument("--seed", type=int, default=0, help="Base seed of the worker RNGs")
+    args = parser.parse_args()
+
+    print(f"{'backend':8s} {'n_envs':>6s} {'env-steps/sec':>14s}")
+    for vec_backend in args.vec_backend:
+        for n_envs in args.n_envs:
+            rate = env_steps_per_sec(args.board, n_envs, vec_backend, args.steps, args.seed)
+            print(f"{vec_backend:8s} {n_envs:6d} {rate:14.1f}")
@@ -0,0 +1,165 @@
+"""
+Compiled board format: the board JSON is parsed once into flat numpy arrays that are
+memory-mapped read-only by every env and process that uses the same board.
+Adjacency is stored as CSR neighbor lists, so boards with thousands of territories stay small.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "boards")
+# bump when the compiled layout changes so stale caches are not reused
+FORMAT_VERSION = b"2"
+
+_boards = {}
+
+class CompiledBoard():
+    """
+    Read-only view of a compiled board
+
+    Class variables:
+    key: sha256 of the format version and the board JSON content
+    territories: a dictionary of territories and their corresponding indices
+    continents: a dictionary of continents and their corresponding indices in territories (start and end index) and bonus
+    positions: a dictionary of territory index to (x, y) for the territories that have a position
+    indptr, indices: CSR neighbor lists, the sorted neighbors of territory i are indices[indptr[i]:indptr[i+1]]
+    edge_sources, edge_targets: the E directed edges of the board in CSR order
+    continent_starts, continent_ends, continent_bonuses: continent ranges and bonuses in continent order
+    """
+    def __init__(self, directory):
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        self.key = meta["key"]
+        # plain ndarray views over the read-only mapping, memmap indexing is slow in the game's inner loops
+        arrays = {name: np.load(os.path.join(directory, name + ".npy"), mmap_mode="r").view(np.ndarray)
+                  for name in ("indptr", "indices", "continent_starts", "continent_ends",
+                               "continent_bonuses", "positions")}
+        self.indptr = arrays["indptr"]
+        self.indices = arrays["indices"]
+        self.edge_sources = np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+        self.edge_targets = self.indices
+        self._adjacencies = None
+        self.continent_starts = arrays["continent_starts"]
+        self.continent_ends = arrays["continent_ends"]
+        self.continent_bonuses = arrays["continent_bonuses"]
+        self.territories = {name: idx for idx, name in enumerate(meta["territories"])}
+        self.continents = {name: (int(start), int(end), int(bonus)) for name, start, end, bonus in
+                           zip(meta["continents"], self.continent_starts, self.continent_ends, self.continent_bonuses)}
+        self.positions = {idx: (float(x), float(y)) for idx, (x, y) in enumerate(arrays["positions"])
+                          if not np.isnan(x)}
+
+    @property
+    def num_territories(self):
+        return len(self.territories)
+
+    @property
+    def num_edges(self):
+        return len(self.indices)
+
+    @property
+    def adjacencies(self):
+        """
+        A T x T numpy array representing the adjacency matrix of the territories. It is only built
+        (once) when something asks for it, the game itself only uses the neighbor lists.
+        """
+        if self._adjacencies is None:
+            adjacencies = np.zeros((self.num_territories, self.num_territories))
+            adjacencies[self.edge_sources, self.edge_targets] = 1
+            adjacencies.flags.writeable = False
+            self._adjacencies = adjacencies
+        return self._adjacencies
+
+    def is_adjacency_matrix(self, matrix):
+        """
+        Check whether matrix is this board's own dense adjacency, without building it
+        """
+        return matrix is not None and matrix is self._adjacencies
+
+    def neighbors(self, territory):
+        """
+        Get the indices of the neighbors of a territory
+        """
+        return self.indices[self.indptr[territory]:self.indptr[territory + 1]]
+
+    def has_edge(self, src, dest):
+        """
+        Check whether there is an edge from src to dest with a binary search of the neighbor list
+        """
+        neighbors = self.neighbors(src)
+        position = np.searchsorted(neighbors, dest)
+        return position < len(neighbors) and neighbors[position] == dest
+
+def compile_board(board, key, directory):
+    """
+    Write the compiled form of a board
+
+    Parameters:
+    board: a JSON object representing the board
+    key: the hash of the board JSON content
+    directory: the directory to write the compiled arrays to
+    """
+    names = []
+    continent_names, starts, ends, bonuses = [], [], [], []
+    for continent, contents in board['Continents'].items():
+        continent_names.append(continent)
+        starts.append(len(names))
+        names.extend(contents['territories'])
+        ends.append(len(names))
+        bonuses.append(contents['bonus'])
+    index = {name: idx for idx, name in enumerate(names)}
+
+    neighbor_lists = [sorted(index[n] for n in board['Territories'][name]['neighbors']) for name in names]
+    indptr = np.zeros(len(names) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(neighbors) for neighbors in neighbor_lists])
+    indices = np.array([n for neighbors in neighbor_lists for n in neighbors], dtype=np.int64)
+    positions = np.full((len(names), 2), np.nan)
+    for idx, name in enumerate(names):
+        if 'position' in board['Territories'][name]:
+            positions[idx] = board['Territories'][name]['position']
+
+    arrays = {"indptr": indptr, "indices": indices,
+              "continent_starts": np.array(starts, dtype=np.int64), "continent_ends": np.array(ends, dtype=np.int64),
+              "continent_bonuses": np.array(bonuses, dtype=np.int64), "positions": positions}
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, name + ".npy"), array)
+    with open(os.path.join(directory, "meta.json"), "w") as f:
+        json.dump({"key": key, "territories": names, "continents": continent_names}, f)
+
+def load_board(path, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Load a board, compiling it on first use. The compiled board is keyed by a hash of the JSON
+    content, so every process that loads the same board maps the same read-only files.
+
+    Parameters:
+    path: path to the board JSON
+    cache_dir: directory holding the compiled boards
+
+    Returns:
+    board: a CompiledBoard, shared by every env in the process
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, cache_dir)
+    if memo_key in _boards:
+        return _boards[memo_key]
+
+    with open(path, "rb") as f:
+        content = f.read()
+    key = hashlib.sha256(FORMAT_VERSION + content).hexdigest()
+    directory = os.path.join(cache_dir, key)
+    if not os.path.exists(os.path.join(directory, "meta.json")):
+        os.makedirs(cache_dir, exist_ok=True)
+        # compile into a private directory and rename it, so concurrent workers never see a partial board
+        staging = tempfile.mkdtemp(dir=cache_dir)
+        compile_board(json.loads(content), key, staging)
+        try:
+            os.rename(staging, directory)
+        except OSError:
+            # another process finished compiling first
+            for name in os.listdir(staging):
+                os.remove(os.path.join(staging, name))
+            os.rmdir(staging)
+    _boards[memo_key] = CompiledBoard(directory)
+    return _boards[memo_key]
@@ -0,0 +1,257 @@
+"""
+Data-parallel PPO training for TriNet with torch.distributed (gloo, CPU). Every rank collects
+rollouts on its own RiskEnvWrapper envs and runs SB3's PPO update on them, and the gradients
+of every minibatch are averaged across the ranks before the optimizer step, so all ranks keep
+identical weights. The saved checkpoint is a plain SB3 PPO model that TriNet.load_model reads.
+
+Ranks can be started on one machine (launch, or this script's --world-size), or one per
+command on any number of nodes (--rank with --master-addr, or torchrun, which sets RANK,
+WORLD_SIZE, MASTER_ADDR and MASTER_PORT).
+"""
+
+import os
+import time
+import queue
+import socket
+import argparse
+import numpy as np
+import torch
+import torch.distributed as dist
+from stable_baselines3.common.callbacks import BaseCallback
+
+class GradientAveragingOptimizer():
+    """
+    Wraps the policy optimizer so that step() first averages the gradients of all ranks with
+    one all_reduce over the flattened gradients. SB3 clips the gradient norm of every rank before
+    step(), so the averaged step is never longer than max_grad_norm either.
+    Everything else is forwarded to the wrapped optimizer.
+
+    Class variables:
+    comm_seconds: the time spent in all_reduce
+    """
+    def __init__(self, optimizer, parameters, world_size):
+        self.optimizer = optimizer
+        self.parameters = [p for p in parameters if p.requires_grad]
+        self.world_size = world_size
+        self.comm_seconds = 0.0
+
+    def __getattr__(self, name):
+        return getattr(self.optimizer, name)
+
+    def step(self, closure=None):
+        grads = [p.grad if p.grad is not None else torch.zeros_like(p) for p in self.parameters]
+        flat = torch.cat([grad.reshape(-1) for grad in grads])
+        start = time.perf_counter()
+        dist.all_reduce(flat)
+        self.comm_seconds += time.perf_counter() - start
+        flat /= self.world_size
+        offset = 0
+        for p in self.parameters:
+            size = p.numel()
+            p.grad = flat[offset:offset + size].view_as(p).clone()
+            offset += size
+        return self.optimizer.step(closure)
+
+def average_running_stats(rms, world_size):
+    """
+    Replace a RunningMeanStd by the pooled statistics of all ranks. The count is the mean count
+    of the ranks, so that data pooled at an earlier call is not weighted world_size times over.
+    """
+    mean, var = np.asarray(rms.mean, dtype=np.float64), np.asarray(rms.var, dtype=np.float64)
+    packed = torch.from_numpy(np.concatenate(([rms.count], (rms.count * mean).ravel(),
+                                              (rms.count * (var + mean ** 2)).ravel())))
+    dist.all_reduce(packed)
+    packed = packed.numpy()
+    total, size = packed[0], mean.size
+    pooled_mean = packed[1:1 + size] / total
+    rms.mean = pooled_mean.reshape(mean.shape)
+    rms.var = np.maximum(packed[1 + size:] / total - pooled_mean ** 2, 0).reshape(var.shape)
+    rms.count = total / world_size
+
+class DistributedCallback(BaseCallback):
+    """
+    Starts every rank from the weights of rank 0 and pools the VecNormalize statistics of all
+    ranks after every rollout, so that every rank normalizes its next rollout the same way
+    """
+    def __init__(self, world_size):
+        super().__init__()
+        self.world_size = world_size
+
+    def _on_training_start(self):
+        with torch.no_grad():
+            for tensor in self.model.policy.state_dict().values():
+                dist.broadcast(tensor, 0)
+
+    def _on_step(self):
+        return True
+
+    def _on_rollout_end(self):
+        vec_normalize = self.model.get_vec_normalize_env()
+        if vec_normalize is None:
+            return
+        if vec_normalize.norm_obs:
+            obs_rms = vec_normalize.obs_rms
+            for key in sorted(obs_rms) if isinstance(obs_rms, dict) else [None]:
+                average_running_stats(obs_rms[key] if key is not None else obs_rms, self.world_size)
+        if vec_normalize.norm_reward:
+            average_running_stats(vec_normalize.ret_rms, self.world_size)
+
+def make_trinet(config, rank):
+    """
+    Build the TriNet of one rank from a training config (see train_rank)
+    """
+    from risk_env import RiskEnv, Player
+    from risk_env_wrapper import RiskEnvWrapper
+    from trinet import TriNet
+    seed = config['seed'] + rank * config['n_envs']
+    players = [Player(i) for i in range(len(config['opponents']) if config.get('opponents') else 2)]
+    env = RiskEnvWrapper(RiskEnv(config['board'], players, seed=seed), compact_obs=config['compact_obs'],
+                         edge_actions=config['edge_actions'], opponents=config.get('opponents'))
+    return TriNet(env, model_path=config.get('model_path'), n_envs=config['n_envs'], seed=seed, policy=config['policy'])
+
+def parameter_spread(policy):
+    """
+    Get the largest difference between the ranks of the sum of the policy weights, 0 when every
+    rank holds the same weights
+    """
+    total = torch.tensor([sum(float(p.detach().double().sum()) for p in policy.parameters())], dtype=torch.float64)
+    high, low = total.clone(), -total
+    dist.all_reduce(high, op=dist.ReduceOp.MAX)
+    dist.all_reduce(low, op=dist.ReduceOp.MAX)
+    return float(high + low)
+
+def train_rank(rank, world_size, config, init_method="env://"):
+    """
+    Train one rank. Rank 0 saves the model to config['save_path'] if it is set.
+
+    Parameters:
+    rank, world_size: the rank of this process and the number of ranks
+    config: a dictionary with board, compact_obs, edge_actions, policy, opponents (see RiskEnvWrapper),
+    n_envs (envs per rank), model_path (a checkpoint to start from or None), total_timesteps
+    (split evenly over the ranks), seed, threads (torch threads per rank), verbose and save_path
+    init_method: the torch.distributed init method, "tcp://host:port" or "env://"
+
+    Returns:
+    stats: a dictionary with the rank, samples collected, training seconds, seconds spent averaging
+    gradients and the parameter spread between the ranks at the end
+    """
+    torch.set_num_threads(config.get('threads', 1))
+    dist.init_process_group("gloo", init_method=init_method, rank=rank, world_size=world_size)
+    try:
+        torch.manual_seed(config['seed'] + rank)
+        trinet = make_trinet(config, rank)
+        agent = trinet.agent
+        agent.verbose = config.get('verbose', 0) if rank == 0 else 0
+        # early stopping on the kl of one rank would leave the others waiting in all_reduce
+        agent.target_kl = None
+        optimizer = agent.policy.optimizer
+        averaging = GradientAveragingOptimizer(optimizer, agent.policy.parameters(), world_size)
+        agent.policy.optimizer = averaging
+        timesteps = -(-config['total_timesteps'] // world_size)
+        start = time.perf_counter()
+        agent.learn(total_timesteps=timesteps, callback=DistributedCallback(world_size))
+        elapsed = time.perf_counter() - start
+        agent.policy.optimizer = optimizer
+        spread = parameter_spread(agent.policy)
+        if rank == 0 and config.get('save_path'):
+            trinet.save_model(config['save_path'])
+        return {'rank': rank, 'samples': int(agent.num_timesteps), 'seconds': elapsed,
+                'comm_seconds': averaging.comm_seconds, 'spread': spread}
+    finally:
+        dist.destroy_process_group()
+
+def _launch_rank(rank, world_size, config, init_method, results):
+    results.put(train_rank(rank, world_size, config, init_method))
+
+def _free_port(host):
+    with socket.socket() as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+def launch(config, world_size, master_addr="127.0.0.1", master_port=None, start_method=None):
+    """
+    Train with world_size ranks on this machine
+
+    Returns:
+    stats: the stats of every rank (see train_rank), by rank
+    """
+    from worker_pool import get_context, HEADLESS_MODULES
+    master_port = master_port or _free_port(master_addr)
+    ctx = get_context(start_method, HEADLESS_MODULES + ("trinet", "distributed_ppo"))
+    results = ctx.Queue()
+    init_method = f"tcp://{master_addr}:{master_port}"
+    processes = [ctx.Process(target=_launch_rank, args=(rank, world_size, config, init_method, results), daemon=True)
+                 for rank in range(world_size)]
+    for process in processes:
+        process.start()
+    stats = []
+    try:
+        while len(stats) < world_size:
+            try:
+                stats.append(results.get(timeout=1))
+            except queue.Empty:
+                # a rank that died leaves the others blocked in their collectives
+                if any(process.exitcode not in (None, 0) for process in processes):
+                    raise ValueError("A training rank exited with an error")
+    finally:
+        for process in processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+    return sorted(stats, key=lambda s: s['rank'])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--board", type=str, default="world.json", help="Path to board configuration JSON")
+    parser.add_argument("--compact-obs", action="store_true", help="Observe narrow per-territory fields instead of T x T matrices")
+    parser.add_argument("--edge-actions", action="store_true", help="Index attacks by board edge")
+    parser.add_argument("--policy", type=str, default="mlp", choices=["mlp", "gnn"], help="Policy of the TriNet")
+    parser.add_argument("--opponents", type=str, nargs="+", help="Opponents of seats 1, 2, ... (see train.py)")
+    parser.add_argument("--n-envs", type=int, default=1, help="Envs per rank")
+    parser.add_argument("--timesteps", type=int, default=16384, help="Timesteps over all ranks")
+    parser.add_argument("--load", type=str, help="Checkpoint to start from")
+    parser.add_argument("--save", type=str, help="Where rank 0 saves the trained model")
+    parser.add_argument("--seed", type=int, default=0, help="Base seed")
+    parser.add_argument("--threads", type=int, default=1, help="Torch threads per rank")
+    parser.add_argument("--world-size", type=int, nargs="+",
+                        help="Ranks to train with on this machine, several values report the scaling (default 1 2 4). "
+                             "With --rank, the number of ranks of the whole job")
+    parser.add_argument("--rank", type=int, help="Run only this rank of a multi-node job, with --master-addr and --master-port")
+    parser.add_argument("--master-addr", type=str, default="127.0.0.1", help="Address of rank 0")
+    parser.add_argument("--master-port", type=int, default=None, help="Port of rank 0")
+    args = parser.parse_args()
+
+    config = {
+        'board': args.board, 'compact_obs': args.compact_obs, 'edge_actions': args.edge_actions,
+        'policy': args.policy, 'opponents': [None] + [None if s == "self" else s for s in args.opponents] if args.opponents else None,
+        'n_envs': args.n_envs, 'model_path': args.load, 'total_timesteps': args.timesteps, 'seed': args.seed,
+        'threads': args.threads, 'verbose': 0, 'save_path': args.save
+    }
+
+    if args.rank is not None or "RANK" in os.environ:
+        # one rank of a job started on every node by hand or by torchrun
+        if args.rank is not None:
+            if args.master_port is None:
+                raise ValueError("--rank needs --master-port")
+            if args.world_size is None or len(args.world_size) != 1:
+                raise ValueError("--rank needs the --world-size of the job")
+            rank, world_size = args.rank, args.world_size[0]
+            init_method = f"tcp://{args.master_addr}:{args.master_port}"
+        else:
+            rank, world_size, init_method = int(os.environ["RANK"]), int(os.environ["WORLD_SIZE"]), "env://"
+        stats = train_rank(rank, world_size, config, init_method)
+        print(f"rank {rank}: {stats['samples']} samples in {stats['seconds']:.1f}s, parameter spread {stats['spread']:.2e}")
+    else:
+        print(f"{'ranks':>5s} {'samples':>8s} {'seconds':>8s} {'samples/sec':>12s} {'speedup':>8s} {'efficiency':>10s} {'comm':>6s} {'spread':>9s}")
+        baseline = None
+        for world_size in args.world_size or [1, 2, 4]:
+            stats = launch(config, world_size, args.master_addr, args.master_port)
+            samples = sum(s['samples'] for s in stats)
+            seconds = max(s['seconds'] for s in stats)
+            throughput = samples / seconds
+            baseline = baseline or throughput / world_size
+            speedup = throughput / baseline
+            comm = max(s['comm_seconds'] / s['seconds'] for s in stats)
+            print(f"{world_size:5d} {samples:8d} {seconds:8.1f} {throughput:12.1f} {speedup:8.2f} "
+                  f"{speedup / world_size:10.2f} {comm:6.1%} {max(s['spread'] for s in stats):9.2e}")
+        print(f"{os.cpu_count()} cpus")
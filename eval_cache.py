@@ -0,0 +1,140 @@
+"""
+Transposition cache for policy/value evaluations, keyed by RiskEnv.position_hash
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from collections import OrderedDict
+import numpy as np
+
+class EvaluationCache():
+    """
+    Bounded least-recently-used cache with hit statistics
+
+    Class variables:
+    max_size: the largest number of entries kept
+    hits, misses: lookups that found or missed an entry
+    """
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Get the entry of key, or None, and mark it as recently used
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        """
+        Store an entry, evicting the least recently used one when the cache is full
+        """
+        if self.max_size <= 0:
+            return
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate, 'size': len(self.entries)}
+
+class PolicyCache():
+    """
+    Evaluate positions with a TriNet, reusing earlier evaluations of the same position.
+    The observation and the forward pass are only computed on a miss.
+
+    The policy gets the raw observation, like TriNet.predict, the tournament and the inference broker,
+    since the VecNormalize statistics are not saved with checkpoints.
+
+    Note: the cached outputs depend on the network weights, call clear() after the model is trained further.
+    """
+    def __init__(self, trinet, max_size=100000):
+        self.trinet = trinet
+        self.cache = EvaluationCache(max_size)
+
+    def evaluate(self, env):
+        """
+        Evaluate the position of a RiskEnvWrapper
+
+        Returns:
+        mean: the mean of the policy's action distribution
+        std: the standard deviation of the policy's action distribution
+        value: the value estimate for the player to move
+        """
+        key = env.risk_env.position_hash()
+        entry = self.cache.get(key)
+        if entry is None:
+            import torch
+            policy = self.trinet.agent.policy
+            obs, _ = policy.obs_to_tensor(env._get_obs())
+            with torch.no_grad():
+                distribution = policy.get_distribution(obs).distribution
+                value = policy.predict_values(obs)
+            entry = (distribution.mean.cpu().numpy()[0], distribution.stddev.cpu().numpy()[0], value.item())
+            self.cache.put(key, entry)
+        return entry
+
+    def sample(self, env, rng, count):
+        """
+        Sample actions from the cached policy distribution, the mean action first.
+        Actions are clipped to the action space like PPO.predict does.
+        """
+        mean, std, _ = self.evaluate(env)
+        actions = mean + std * rng.standard_normal((count, len(mean)))
+        actions[0] = mean
+        return list(np.clip(actions, env.action_space.low, env.action_space.high).astype(np.float32))
+
+    def clear(self):
+        self.cache.clear()
+
+if __name__ == "__main__":
+    from risk_env import RiskEnv, Player
+    from risk_env_wrapper import RiskEnvWrapper
+    from trinet import TriNet
+    from mcts import MCTSPlanner
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--board", type=str, default="world.json", help="Path to board configuration JSON")
+    parser.add_argument("--simulations", type=int, default=200, help="MCTS simulations per decision")
+    parser.add_argument("--decisions", type=int, default=5, help="Decisions to time")
+    parser.add_argument("--cache-size", type=int, default=100000, help="Entries of the evaluation cache")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    players = [Player(i) for i in range(2)]
+    wrapper_kwargs = {'edge_actions': True, 'compact_obs': True}
+    env = RiskEnvWrapper(RiskEnv(args.board, players), **wrapper_kwargs)
+    with tempfile.TemporaryDirectory() as directory:
+        model_path = os.path.join(directory, "trinet")
+        TriNet(env).save_model(model_path)
+        print(f"{'cache':>8s} {'ms/decision':>12s} {'hit rate':>9s}")
+        for cache_size in (0, args.cache_size):
+            planner = MCTSPlanner(args.board, players, model_path=model_path + ".zip", num_simulations=args.simulations,
+                                  value="policy", cache_size=cache_size, wrapper_kwargs=wrapper_kwargs, seed=args.seed)
+            env.reset(seed=args.seed)
+            start = time.perf_counter()
+            for _ in range(args.decisions):
+                planner.plan(env)
+            elapsed = (time.perf_counter() - start) / args.decisions
+            stats = planner.last_stats['cache']
+            print(f"{cache_size:8d} {elapsed * 1000:12.1f} {stats['hit_rate']:9.3f}")
+            planner.close()
@@ -0,0 +1,243 @@
+"""
+Export a saved TriNet checkpoint as a standalone deterministic policy: TorchScript (.pt) or ONNX
+(.onnx), optionally with dynamic int8 quantization of the linear layers, or distilled into a
+smaller student network first. exported_policy.ExportedPolicy runs the result without
+stable_baselines3.
+"""
+
+import os
+import json
+import time
+import argparse
+import numpy as np
+import torch
+import torch.nn as nn
+
+from risk_env import RiskEnv, Player
+from risk_env_wrapper import RiskEnvWrapper
+
+class DeterministicPolicy(nn.Module):
+    """
+    The mean action of an SB3 policy, clipped to [0, 1] like PPO.predict, as a function of the
+    observation tensors in a fixed key order
+    """
+    def __init__(self, policy, keys):
+        super().__init__()
+        self.policy = policy
+        self.keys = keys
+
+    def forward(self, *tensors):
+        obs = dict(zip(self.keys, tensors))
+        return torch.clamp(self.policy.get_distribution(obs).mode(), 0.0, 1.0)
+
+class StudentPolicy(nn.Module):
+    """
+    A small MLP over the flattened observation, trained to imitate a teacher's mean actions
+
+    Parameters:
+    input_dims: the flattened size of every observation key, in key order
+    action_dim: the size of the action
+    hidden_dims: sizes of the hidden layers
+    """
+    def __init__(self, input_dims, action_dim, hidden_dims=(64,)):
+        super().__init__()
+        layers, size = [], sum(input_dims)
+        for hidden in hidden_dims:
+            layers += [nn.Linear(size, hidden), nn.ReLU()]
+            size = hidden
+        layers.append(nn.Linear(size, action_dim))
+        self.net = nn.Sequential(*layers)
+
+    def forward(self, *tensors):
+        x = torch.cat([tensor.flatten(1).float() for tensor in tensors], dim=1)
+        return torch.clamp(self.net(x), 0.0, 1.0)
+
+def observation_keys(env):
+    return sorted(env.observation_space.spaces)
+
+def collect_states(env, teacher, steps, seed, noise=0.3):
+    """
+    Play games with the teacher's actions plus uniform exploration noise and record the observations
+    and the teacher's mean actions
+
+    Returns:
+    observations: a dictionary of stacked observations
+    actions: a steps x action_dim numpy array of teacher actions
+    """
+    rng = np.random.default_rng(seed)
+    obs, _ = env.reset(seed=seed)
+    observations, actions = {key: [] for key in obs}, []
+    for _ in range(steps):
+        action = teacher(obs)
+        for key, value in obs.items():
+            observations[key].append(value)
+        actions.append(action)
+        explore = np.where(rng.random(action.shape) < noise, rng.random(action.shape), action).astype(np.float32)
+        obs, _, done, _, _ = env.step(explore)
+        if done:
+            obs, _ = env.reset()
+    return {key: np.stack(values) for key, values in observations.items()}, np.stack(actions)
+
+def distill(env, teacher, hidden_dims=(64,), steps=20000, epochs=20, batch_size=256, lr=1e-3, seed=0):
+    """
+    Train a StudentPolicy on the teacher's mean actions
+
+    Parameters:
+    env: a RiskEnvWrapper matching the teacher
+    teacher: a function from observation to action
+    hidden_dims: hidden layer sizes of the student
+    steps: states to collect
+    epochs, batch_size, lr: training settings
+
+    Returns:
+    student: the trained StudentPolicy
+    loss: the final mean squared error on the collected states
+    """
+    torch.manual_seed(seed)
+    keys = observation_keys(env)
+    observations, actions = collect_states(env, teacher, steps, seed)
+    inputs = [torch.as_tensor(observations[key]) for key in keys]
+    targets = torch.as_tensor(actions)
+    student = StudentPolicy([int(np.prod(env.observation_space[key].shape)) for key in keys], actions.shape[1], hidden_dims)
+    optimizer = torch.optim.Adam(student.parameters(), lr=lr)
+    generator = torch.Generator().manual_seed(seed)
+    for _ in range(epochs):
+        for index in torch.randperm(len(targets), generator=generator).split(batch_size):
+            loss = torch.mean((student(*(tensor[index] for tensor in inputs)) - targets[index]) ** 2)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+    with torch.no_grad():
+        loss = torch.mean((student(*inputs) - targets) ** 2).item()
+    return student, loss
+
+def export_policy(module, env, path, quantize=False, meta=None):
+    """
+    Write a deterministic policy module as TorchScript (.pt) or ONNX (.onnx, needs the onnx package)
+
+    Parameters:
+    module: a module from the observation tensors in observation_keys order to the action
+    env: the RiskEnvWrapper the policy plays
+    path: the output file
+    quantize: convert the linear layers to dynamic int8 first (TorchScript only)
+    meta: extra metadata to store
+    """
+    keys = observation_keys(env)
+    obs, _ = env.reset(seed=0)
+    example = tuple(torch.as_tensor(np.asarray(obs[key], dtype=env.observation_space[key].dtype)[None]) for key in keys)
+    module = module.cpu().eval()
+    if quantize:
+        module = torch.ao.quantization.quantize_dynamic(module, {nn.Linear}, dtype=torch.qint8)
+    meta = {
+        'observation_keys': keys,
+        'observation_dtypes': [str(env.observation_space[key].dtype) for key in keys],
+        'observation_shapes': [list(env.observation_space[key].shape) for key in keys],
+        'action_dim': int(env.action_space.shape[0]),
+        'compact_obs': env.compact_obs, 'edge_actions': env.edge_actions, 'quantized': quantize,
+        **(meta or {})
+    }
+    if path.endswith(".onnx"):
+        if quantize:
+            raise ValueError("Dynamic int8 quantization is only exported as TorchScript")
+        try:
+            import onnx
+        except ImportError:
+            raise ValueError("Exporting .onnx needs the onnx package, export a .pt instead")
+        torch.onnx.export(module, example, path, input_names=keys, output_names=['action'],
+                          dynamic_axes={name: {0: 'batch'} for name in keys + ['action']}, dynamo=False)
+        with open(path + ".json", "w") as f:
+            json.dump(meta, f)
+    else:
+        with torch.no_grad():
+            traced = torch.jit.trace(module, example, check_trace=False)
+        torch.jit.save(traced, path, _extra_files={"meta.json": json.dumps(meta)})
+
+def benchmark(env, policies, steps, seed, warmup=10):
+    """
+    Compare policies with the first one (the teacher) on the states the teacher visits. Every policy
+    acts on the first warmup states untimed first, since TorchScript optimizes its graph during the first calls.
+
+    Returns:
+    rows: a list of (name, mean latency in microseconds per single observation, mean absolute action
+    error, fraction of turns that end in the same state as the teacher's from the same dice)
+    """
+    teacher = policies[0][1]
+    obs, _ = env.reset(seed=seed)
+    states = []
+    for _ in range(steps):
+        states.append((obs, env.snapshot()))
+        obs, _, done, _, _ = env.step(teacher(obs))
+        if done:
+            obs, _ = env.reset()
+    rows = []
+    for name, act in policies:
+        for obs, _ in states[:warmup]:
+            act(obs)
+        start = time.perf_counter()
+        actions = [act(obs) for obs, _ in states]
+        latency = (time.perf_counter() - start) / steps * 1e6
+        # the accuracy pass replays the teacher and the env outside the timed loop
+        errors, same = [], 0
+        for (obs, snapshot), action in zip(states, actions):
+            expected = teacher(obs)
+            errors.append(np.mean(np.abs(action - expected)))
+            env.restore(snapshot)
+            env.step(expected)
+            reference = env.risk_env.game_state.copy()
+            env.restore(snapshot)
+            env.step(action)
+            same += np.array_equal(reference, env.risk_env.game_state)
+        rows.append((name, latency, float(np.mean(errors)), same / steps))
+    return rows
+
+if __name__ == "__main__":
+    from trinet import TriNet
+    from exported_policy import ExportedPolicy
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("model", type=str, help="Path of the saved TriNet checkpoint")
+    parser.add_argument("--board", type=str, default="world.json", help="Path to board configuration JSON")
+    parser.add_argument("--compact-obs", action="store_true", help="The checkpoint uses compact observations")
+    parser.add_argument("--edge-actions", action="store_true", help="The checkpoint uses edge-indexed actions")
+    parser.add_argument("--policy", type=str, default="mlp", choices=["mlp", "gnn"], help="Policy of the checkpoint")
+    parser.add_argument("--output", type=str, default=None, help="Output .pt or .onnx, default next to the checkpoint")
+    parser.add_argument("--quantize", action="store_true", help="Dynamic int8 quantization of the linear layers")
+    parser.add_argument("--distill", type=int, nargs="*", default=None, help="Distill into a student with these hidden sizes")
+    parser.add_argument("--distill-steps", type=int, default=20000, help="States the student is trained on")
+    parser.add_argument("--benchmark", type=int, default=0, help="Compare every variant with the checkpoint on this many states")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    players = [Player(i) for i in range(2)]
+    env = RiskEnvWrapper(RiskEnv(args.board, players, seed=args.seed), compact_obs=args.compact_obs,
+                         edge_actions=args.edge_actions)
+    trinet = TriNet(env, model_path=args.model, policy=args.policy)
+    if trinet.random:
+        raise ValueError("The random policy cannot be exported")
+    teacher = lambda obs: trinet.agent.predict(obs, deterministic=True)[0]
+    keys = observation_keys(env)
+    module, meta = DeterministicPolicy(trinet.agent.policy, keys), {'source': os.path.abspath(args.model)}
+    if args.distill is not None:
+        module, loss = distill(env, teacher, tuple(args.distill) or (64,), steps=args.distill_steps, seed=args.seed)
+        meta['distilled'] = {'hidden_dims': list(args.distill) or [64], 'mse': loss}
+        print(f"student {args.distill or [64]}: mse {loss:.5f} on {args.distill_steps} states")
+    output = args.output or os.path.splitext(args.model)[0] + (".student" if args.distill is not None else "") + \
+        (".int8" if args.quantize else "") + ".pt"
+    export_policy(module, env, output, quantize=args.quantize, meta=meta)
+    print(f"exported to {output}")
+
+    if args.benchmark:
+        variants = [("sb3 eager", lambda obs: trinet.agent.predict(obs, deterministic=True))]
+        directory = os.path.dirname(os.path.abspath(output))
+        for name, variant, quantize in (("torchscript", DeterministicPolicy(trinet.agent.policy, keys), False),
+                                        ("torchscript int8", DeterministicPolicy(trinet.agent.policy, keys), True)):
+            path = os.path.join(directory, f".benchmark_{quantize:d}.pt")
+            export_policy(variant, env, path, quantize=quantize)
+            variants.append((name, ExportedPolicy(path).predict))
+        variants.append((os.path.basename(output), ExportedPolicy(output).predict))
+        print(f"{'policy':>28s} {'us/obs':>8s} {'abs err':>8s} {'same turn':>10s}")
+        for name, latency, error, same in benchmark(env, [(name, lambda obs, p=p: p(obs)[0]) for name, p in variants],
+                                                    args.benchmark, args.seed):
+            print(f"{name:>28s} {latency:8.1f} {error:8.4f} {same:10.3f}")
+        for quantize in (0, 1):
+            os.remove(os.path.join(directory, f".benchmark_{quantize:d}.pt"))
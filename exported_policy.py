@@ -0,0 +1,58 @@
+"""
+Run a policy written by export.py without stable_baselines3. TorchScript files only need torch,
+ONNX files only need onnxruntime.
+"""
+
+import json
+import numpy as np
+
+class ExportedPolicy():
+    """
+    A deterministic exported policy with the predict interface of TriNet
+
+    Parameters:
+    path: a .pt (TorchScript) or .onnx file written by export.py
+
+    Class variables:
+    meta: the export metadata (observation keys and dtypes, action size, env settings, source checkpoint)
+    """
+    def __init__(self, path):
+        self.path = path
+        if path.endswith(".onnx"):
+            import onnxruntime
+            with open(path + ".json") as f:
+                self.meta = json.load(f)
+            self.session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+            self.module = None
+        else:
+            import torch
+            extra_files = {"meta.json": ""}
+            self.module = torch.jit.load(path, _extra_files=extra_files, map_location="cpu")
+            self.meta = json.loads(extra_files["meta.json"])
+            self.session = None
+            self._torch = torch
+        self.keys = self.meta['observation_keys']
+        self.dtypes = [np.dtype(dtype) for dtype in self.meta['observation_dtypes']]
+
+    def _inputs(self, obs):
+        single = np.ndim(obs[self.keys[0]]) == len(self.meta['observation_shapes'][0])
+        arrays = [np.asarray(obs[key], dtype=dtype) for key, dtype in zip(self.keys, self.dtypes)]
+        if single:
+            arrays = [array[None] for array in arrays]
+        return arrays, single
+
+    def predict(self, obs, deterministic=True):
+        """
+        Get the action for an observation (or a batch of observations stacked along a first axis)
+
+        Returns:
+        action: the action, clipped to the action space like PPO.predict
+        state: None, for compatibility with SB3's predict
+        """
+        arrays, single = self._inputs(obs)
+        if self.session is not None:
+            action = self.session.run(None, dict(zip(self.keys, arrays)))[0]
+        else:
+            with self._torch.no_grad():
+                action = self.module(*(self._torch.from_numpy(array) for array in arrays)).numpy()
+        return (action[0] if single else action), None
@@ -0,0 +1,146 @@
+"""
+Procedurally generate world.json-style boards of any size
+"""
+
+import argparse
+import json
+import numpy as np
+
+def sample_degrees(rng, num_territories, distribution, mean_degree):
+    """
+    Sample a target degree for every territory
+
+    Parameters:
+    distribution: "fixed", "poisson" or "powerlaw"
+    mean_degree: the mean target degree
+
+    Returns:
+    degrees: a numpy array of shape (T,) of target degrees, at least 1
+    """
+    if distribution == "fixed":
+        degrees = np.full(num_territories, round(mean_degree))
+    elif distribution == "poisson":
+        degrees = rng.poisson(mean_degree, num_territories)
+    elif distribution == "powerlaw":
+        # pareto tail with exponent 2.5, scaled so that the mean matches
+        degrees = np.round((rng.pareto(1.5, num_territories) + 1) * mean_degree / 3)
+    else:
+        raise ValueError(f"Unknown degree distribution {distribution}")
+    return np.clip(degrees, 1, num_territories - 1).astype(np.int64)
+
+def nearest_neighbors(positions, k, chunk=1024):
+    """
+    Get the k nearest territories of every territory, in chunks to bound memory
+
+    Returns:
+    neighbors: a T x k numpy array of territory indices sorted by distance
+    """
+    neighbors = np.empty((len(positions), k), dtype=np.int64)
+    for start in range(0, len(positions), chunk):
+        block = positions[start:start + chunk]
+        distances = np.sum((block[:, None, :] - positions[None, :, :]) ** 2, axis=2)
+        distances[np.arange(len(block)), np.arange(start, start + len(block))] = np.inf
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        order = np.argsort(np.take_along_axis(distances, nearest, axis=1), axis=1)
+        neighbors[start:start + chunk] = np.take_along_axis(nearest, order, axis=1)
+    return neighbors
+
+def connect_components(positions, edges):
+    """
+    Add edges between the closest territories of different components until the board is connected
+
+    Parameters:
+    positions: a T x 2 numpy array of positions
+    edges: a set of (i, j) pairs with i < j, updated in place
+    """
+    num_territories = len(positions)
+    while True:
+        parent = np.arange(num_territories)
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for i, j in edges:
+            parent[find(i)] = find(j)
+        roots = np.array([find(i) for i in range(num_territories)])
+        if len(np.unique(roots)) == 1:
+            return
+        # join the component of territory 0 to its closest outside territory
+        inside = np.nonzero(roots == roots[0])[0]
+        outside = np.nonzero(roots != roots[0])[0]
+        best = (np.inf, None, None)
+        for start in range(0, len(inside), 1024):
+            block = inside[start:start + 1024]
+            distances = np.sum((positions[block][:, None, :] - positions[outside][None, :, :]) ** 2, axis=2)
+            i, j = np.unravel_index(np.argmin(distances), distances.shape)
+            if distances[i, j] < best[0]:
+                best = (distances[i, j], block[i], outside[j])
+        edges.add((min(best[1], best[2]), max(best[1], best[2])))
+
+def generate_board(num_territories, num_continents, distribution="poisson", mean_degree=4.0, seed=0):
+    """
+    Generate a connected board. Territories are scattered in the plane, grouped into continents
+    around random centers and linked to their nearest territories.
+
+    Parameters:
+    num_territories: the number of territories T
+    num_continents: the number of continents
+    distribution: degree distribution, "fixed", "poisson" or "powerlaw"
+    mean_degree: the mean target degree of a territory
+    seed: random seed
+
+    Returns:
+    board: a JSON object in the format of world.json
+    """
+    rng = np.random.default_rng(seed)
+    num_continents = max(1, min(num_continents, num_territories))
+    positions = rng.random((num_territories, 2)) * np.sqrt(num_territories)
+    centers = positions[rng.choice(num_territories, num_continents, replace=False)]
+    continent = np.argmin(np.sum((positions[:, None, :] - centers[None, :, :]) ** 2, axis=2), axis=1)
+
+    degrees = sample_degrees(rng, num_territories, distribution, mean_degree)
+    edges = set()
+    if num_territories > 1:
+        nearest = nearest_neighbors(positions, int(degrees.max()))
+        for i in range(num_territories):
+            for j in nearest[i, :degrees[i]]:
+                edges.add((min(i, j), max(i, j)))
+        connect_components(positions, edges)
+
+    names = [f"Territory {i}" for i in range(num_territories)]
+    neighbors = [[] for _ in range(num_territories)]
+    for i, j in sorted(edges):
+        neighbors[i].append(names[j])
+        neighbors[j].append(names[i])
+    territories = {}
+    continents = {}
+    for c in range(num_continents):
+        members = np.nonzero(continent == c)[0]
+        if len(members) == 0:
+            continue
+        name = f"Continent {c}"
+        continents[name] = {"territories": [names[i] for i in members], "bonus": max(1, len(members) // 3)}
+        for i in members:
+            territories[names[i]] = {"neighbors": neighbors[i], "continent": name,
+                                     "position": [round(float(x), 4) for x in positions[i]]}
+    return {"Territories": territories, "Continents": continents}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--territories", type=int, required=True, help="Number of territories")
+    parser.add_argument("--continents", type=int, default=6, help="Number of continents")
+    parser.add_argument("--degree", type=str, default="poisson", choices=["fixed", "poisson", "powerlaw"],
+                        help="Distribution of the target degree of each territory")
+    parser.add_argument("--mean-degree", type=float, default=4.0, help="Mean target degree")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--output", type=str, required=True, help="Path of the board JSON to write")
+    args = parser.parse_args()
+
+    board = generate_board(args.territories, args.continents, args.degree, args.mean_degree, args.seed)
+    with open(args.output, "w") as f:
+        json.dump(board, f)
+    num_edges = sum(len(t["neighbors"]) for t in board["Territories"].values()) // 2
+    print(f"wrote {args.output}: {args.territories} territories, {len(board['Continents'])} continents, {num_edges} edges")
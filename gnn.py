@@ -0,0 +1,252 @@
+"""
+Message-passing policy for TriNet over the board's edge list. Every weight is shared across
+territories or across edges, so parameters do not depend on the board and the forward cost grows
+with T + E instead of T^2. One checkpoint can be loaded on any board.
+Needs compact observations and edge actions (see RiskEnvWrapper).
+
+The forward pass is much cheaper than the MLP over the full T x T observation, but it is still
+slower than the MLP over compact observations, which is tied to the board it was trained on.
+Run this module to compare the three.
+"""
+
+import time
+import argparse
+import numpy as np
+import torch
+import torch.nn as nn
+from stable_baselines3.common.policies import ActorCriticPolicy
+from stable_baselines3.common.torch_layers import BaseFeaturesExtractor
+
+NODE_FEATURES = 5
+
+class GraphFeatureExtractor(BaseFeaturesExtractor):
+    """
+    Territory embeddings from num_layers rounds of message passing. Every round a territory adds
+    relu(W_self h_v + mean of W_neighbor h_u over its neighbors u) to its embedding. W_neighbor is
+    applied once per territory and the mean is one sparse product with the degree-normalized
+    adjacency, so a round costs O(T) matrix products and O(E) additions. Embeddings are kept
+    territory-major (T x B x hidden_dim), so that per-territory rows are contiguous.
+
+    Parameters:
+    observation_space: the compact observation space of RiskEnvWrapper
+    hidden_dim: size of the territory embeddings
+    num_layers: rounds of message passing
+    """
+    def __init__(self, observation_space, hidden_dim=32, num_layers=2):
+        super().__init__(observation_space, features_dim=hidden_dim)
+        self.hidden_dim = hidden_dim
+        self.embed = nn.Sequential(nn.Linear(NODE_FEATURES, hidden_dim), nn.ReLU())
+        # W_self and W_neighbor of a round as one linear map of h
+        self.layers = nn.ModuleList(nn.Linear(hidden_dim, 2 * hidden_dim) for _ in range(num_layers))
+        self.edge_sources = None
+        self.edge_targets = None
+
+    def set_board(self, edge_sources, edge_targets, num_territories, device=None):
+        """
+        Set the directed edge list the messages are passed along
+        """
+        self.edge_sources = torch.tensor(np.array(edge_sources), dtype=torch.long, device=device)
+        self.edge_targets = torch.tensor(np.array(edge_targets), dtype=torch.long, device=device)
+        degree = torch.bincount(self.edge_targets, minlength=num_territories).clamp(min=1).float()
+        self.inverse_degree = (1.0 / degree)[:, None]
+        # row v holds 1 / degree(v) at every neighbor u, so a product with it averages the neighbors
+        self.mean_adjacency = torch.sparse_coo_tensor(torch.stack((self.edge_targets, self.edge_sources)),
+                                                      1.0 / degree[self.edge_targets], (num_territories, num_territories),
+                                                      check_invariants=False).coalesce()
+
+    def node_features(self, obs):
+        """
+        Per-territory inputs: owned by the player to move, log units, share of the units on the
+        board, log reinforcements and the size of the territory's component as a fraction of T
+        """
+        owners, units = obs['owners'].float(), obs['units'].float()
+        T = owners.shape[1]
+        mine = (owners == obs['current_player'].float()).float()
+        components = obs['components'].long()
+        sizes = torch.zeros_like(units).scatter_add_(1, components, torch.ones_like(units)).gather(1, components)
+        return torch.stack((
+            mine, torch.log1p(units), units / units.sum(dim=1, keepdim=True).clamp(min=1),
+            torch.log1p(obs['reinforcement_max'].float()).expand(-1, T), sizes / T
+        ), dim=-1)
+
+    def neighbor_mean(self, x):
+        """
+        Average the rows of a T x N tensor over the neighbors of every territory. TorchScript cannot
+        trace sparse products, so a traced policy gathers and adds the rows along the edges instead,
+        which gives the same result more slowly.
+        """
+        if not torch.jit.is_tracing():
+            return torch.sparse.mm(self.mean_adjacency.to(x.device), x)
+        sources, targets = self.edge_sources.to(x.device), self.edge_targets.to(x.device)
+        return torch.zeros_like(x).index_add_(0, targets, x.index_select(0, sources)) * self.inverse_degree.to(x.device)
+
+    def forward(self, obs):
+        """
+        Returns:
+        h: a T x B x hidden_dim tensor of territory embeddings
+        """
+        h = self.embed(self.node_features(obs).transpose(0, 1))
+        T, B, hidden_dim = h.shape
+        for layer in self.layers:
+            projected = layer(h)
+            neighbors = self.neighbor_mean(projected[..., hidden_dim:].reshape(T, B * hidden_dim))
+            h = h + torch.relu(projected[..., :hidden_dim] + neighbors.view(T, B, hidden_dim))
+        return h
+
+class GraphPolicy(ActorCriticPolicy):
+    """
+    Actor-critic over territory embeddings. The action means of RiskEnvWrapper's edge action space
+    come from per-territory (reinforce), per-edge (attack) and pooled (fortify) heads, and the
+    log standard deviation is one parameter per head, so nothing depends on T or E.
+
+    Parameters (besides those of ActorCriticPolicy):
+    edge_sources, edge_targets: the directed edges of the board, in the order of the attack slots
+    hidden_dim, num_layers: size of the message passing network (see GraphFeatureExtractor)
+    """
+    def __init__(self, observation_space, action_space, lr_schedule, edge_sources=(), edge_targets=(),
+                 hidden_dim=32, num_layers=2, **kwargs):
+        self.edge_list = (np.asarray(edge_sources), np.asarray(edge_targets))
+        self.hidden_dim = hidden_dim
+        self.num_layers = num_layers
+        kwargs['features_extractor_class'] = GraphFeatureExtractor
+        kwargs['features_extractor_kwargs'] = {'hidden_dim': hidden_dim, 'num_layers': num_layers}
+        kwargs['share_features_extractor'] = True
+        super().__init__(observation_space, action_space, lr_schedule, **kwargs)
+        T = observation_space['owners'].shape[0]
+        if action_space.shape[0] != T + len(self.edge_list[0]) + 3:
+            raise ValueError("GraphPolicy needs the edge action space of the board it is given")
+
+    def _get_constructor_parameters(self):
+        data = super()._get_constructor_parameters()
+        for key in ('features_extractor_class', 'features_extractor_kwargs', 'share_features_extractor'):
+            data.pop(key, None)
+        data.update(edge_sources=self.edge_list[0], edge_targets=self.edge_list[1],
+                    hidden_dim=self.hidden_dim, num_layers=self.num_layers)
+        return data
+
+    def _build(self, lr_schedule):
+        hidden_dim = self.hidden_dim
+        self.features_extractor.set_board(*self.edge_list, self.observation_space['owners'].shape[0])
+        self.reinforce_head = nn.Linear(hidden_dim, 1)
+        # the per-edge attack layer is narrower than the embeddings, as it runs E times
+        self.attack_dim = max(hidden_dim // 4, 1)
+        self.attack_hidden = nn.Linear(hidden_dim, 2 * self.attack_dim)
+        self.attack_head = nn.Linear(self.attack_dim, 1)
+        self.fortify_head = nn.Linear(2 * hidden_dim, 3)
+        self.value_head = nn.Sequential(nn.Linear(2 * hidden_dim, hidden_dim), nn.ReLU(), nn.Linear(hidden_dim, 1))
+        self.head_log_std = nn.Parameter(torch.full((3,), float(self.log_std_init)))
+        self.optimizer = self.optimizer_class(self.parameters(), lr=lr_schedule(1), **self.optimizer_kwargs)
+
+    def _heads(self, obs):
+        """
+        Returns:
+        mean: a B x (T + E + 3) tensor of action means
+        log_std: the matching (T + E + 3,) log standard deviations
+        value: a B x 1 tensor of values
+        """
+        extractor = self.features_extractor
+        h = extractor(obs)
+        pooled = torch.cat((h.mean(dim=0), h.max(dim=0).values), dim=-1)
+        reinforce = self.reinforce_head(h).squeeze(-1).t()
+        sources, targets = extractor.edge_sources.to(h.device), extractor.edge_targets.to(h.device)
+        # both ends are projected per territory, then whole territory rows are gathered per edge
+        projected = self.attack_hidden(h)
+        from_source = projected[..., :self.attack_dim].contiguous().index_select(0, sources)
+        to_target = projected[..., self.attack_dim:].contiguous().index_select(0, targets)
+        attack = self.attack_head(torch.relu(from_source + to_target)).squeeze(-1).t()
+        mean = torch.cat((reinforce, attack, self.fortify_head(pooled)), dim=-1)
+        sizes = torch.tensor([reinforce.shape[1], attack.shape[1], 3], device=mean.device)
+        log_std = torch.repeat_interleave(self.head_log_std, sizes)
+        return mean, log_std, self.value_head(pooled)
+
+    def forward(self, obs, deterministic=False):
+        mean, log_std, values = self._heads(obs)
+        distribution = self.action_dist.proba_distribution(mean, log_std)
+        actions = distribution.get_actions(deterministic=deterministic)
+        return actions, values, distribution.log_prob(actions)
+
+    def evaluate_actions(self, obs, actions):
+        mean, log_std, values = self._heads(obs)
+        distribution = self.action_dist.proba_distribution(mean, log_std)
+        return values, distribution.log_prob(actions), distribution.entropy()
+
+    def get_distribution(self, obs):
+        mean, log_std, _ = self._heads(obs)
+        return self.action_dist.proba_distribution(mean, log_std)
+
+    def predict_values(self, obs):
+        return self._heads(obs)[2]
+
+if __name__ == "__main__":
+    import os
+    import json
+    import tempfile
+    from risk_env import RiskEnv, Player
+    from risk_env_wrapper import RiskEnvWrapper
+    from generate_board import generate_board
+    from trinet import TriNet
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--boards", type=str, nargs="+", default=["small.json", "world.json"], help="Board configuration JSONs")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[200, 1000], help="Territory counts of generated boards")
+    parser.add_argument("--batch-size", type=int, default=64, help="Observations per forward pass")
+    parser.add_argument("--repeats", type=int, default=20, help="Forward passes to time")
+    parser.add_argument("--max-dense-territories", type=int, default=200,
+                        help="Largest board the dense T x T observation MLP is built for")
+    parser.add_argument("--train-steps", type=int, default=2048, help="Timesteps to train the checkpoint moved across boards")
+    args = parser.parse_args()
+
+    players = [Player(i) for i in range(2)]
+
+    def forward_ms(trinet, env):
+        """
+        Mean milliseconds of a forward pass over a batch of observations
+        """
+        obs, _ = env.reset(seed=0)
+        batch = trinet.agent.policy.obs_to_tensor({key: np.stack([value] * args.batch_size) for key, value in obs.items()})[0]
+        with torch.no_grad():
+            trinet.agent.policy(batch)
+            start = time.perf_counter()
+            for _ in range(args.repeats):
+                trinet.agent.policy(batch)
+        return (time.perf_counter() - start) / args.repeats * 1000
+
+    with tempfile.TemporaryDirectory() as directory:
+        boards = list(args.boards)
+        for size in args.sizes:
+            path = os.path.join(directory, f"generated_{size}.json")
+            with open(path, "w") as f:
+                json.dump(generate_board(size, 6, seed=0), f)
+            boards.append(path)
+
+        # the dense MLP sees the T x T observations and emits T + 2T^2 actions,
+        # the compact MLP and the gnn see compact observations and emit T + E + 3 actions
+        print(f"{'board':>22s} {'T':>5s} {'E':>6s}" + "".join(f" {name + ' params':>18s} {'ms':>8s}"
+                                                            for name in ("dense mlp", "compact mlp", "gnn")))
+        for board in boards:
+            risk_env = RiskEnv(board, players)
+            row = f"{os.path.basename(board):>22s} {len(risk_env.game_state):5d} {risk_env.board.num_edges:6d}"
+            for policy, compact in (("mlp", False), ("mlp", True), ("gnn", True)):
+                if not compact and len(risk_env.game_state) > args.max_dense_territories:
+                    row += f" {'-':>18s} {'-':>8s}"
+                    continue
+                env = RiskEnvWrapper(risk_env, compact_obs=compact, edge_actions=compact)
+                trinet = TriNet(env, policy=policy)
+                params = sum(p.numel() for p in trinet.agent.policy.parameters())
+                row += f" {params:18d} {forward_ms(trinet, env):8.2f}"
+            print(row)
+
+        # train on the first board, play the checkpoint on every board
+        model_path = os.path.join(directory, "gnn")
+        env = RiskEnvWrapper(RiskEnv(boards[0], players), compact_obs=True, edge_actions=True)
+        trinet = TriNet(env, policy="gnn")
+        trinet.agent.verbose = 0
+        trinet.train(args.train_steps)
+        trinet.save_model(model_path)
+        for board in boards:
+            env = RiskEnvWrapper(RiskEnv(board, players), compact_obs=True, edge_actions=True)
+            trinet = TriNet(env, model_path=model_path + ".zip", policy="gnn")
+            obs, _ = env.reset(seed=0)
+            for _ in range(5):
+                obs, _, done, _, _ = env.step(trinet.predict(obs)[0])
+            print(f"checkpoint from {os.path.basename(boards[0])} played 5 turns on {os.path.basename(board)}")
@@ -0,0 +1,194 @@
+"""
+In-process batched policy inference. Games running in their own threads submit observations,
+a broker thread runs them through the PPO policy in batches and hands each game its action.
+"""
+
+import time
+import queue
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import Future
+import numpy as np
+
+class InferenceBroker():
+    def __init__(self, trinet, max_batch_size=64, max_wait=0.002, deterministic=False, latency_window=10000):
+        """
+        Parameters:
+        trinet: the TriNet whose policy is evaluated
+        max_batch_size: the largest number of observations per forward pass
+        max_wait: seconds the broker waits for more requests after the first one of a batch arrives
+        deterministic: return the mean action instead of sampling
+        latency_window: the number of most recent requests the latency percentiles are taken over
+
+        Class variables:
+        requests: the number of observations evaluated
+        batches: the number of forward passes
+        """
+        self.trinet = trinet
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.deterministic = deterministic
+        self.latencies = deque(maxlen=latency_window)
+        self.requests = 0
+        self.batches = 0
+        self.pending = queue.Queue()
+        self.thread = None
+        self.start_time = None
+        self.busy_time = 0.0
+
+    def start(self):
+        if self.thread is None:
+            self.start_time = time.perf_counter()
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        if self.thread is not None:
+            self.pending.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def submit(self, obs):
+        """
+        Queue an observation of one game
+
+        Returns:
+        future: a concurrent.futures.Future that resolves to the action
+        """
+        future = Future()
+        self.pending.put((obs, future, time.perf_counter()))
+        return future
+
+    def predict(self, obs):
+        """
+        Get the action for one observation, blocking until its batch has been evaluated
+        """
+        return self.submit(obs).result()
+
+    def _collect(self):
+        """
+        Wait for a first request, then gather more until the batch is full or max_wait has passed
+
+        Returns:
+        batch: a list of (obs, future, submitted) requests, None once the broker is stopped
+        """
+        first = self.pending.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                request = self.pending.get(timeout=timeout) if timeout > 0 else self.pending.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                # finish this batch, then stop
+                self.pending.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            start = time.perf_counter()
+            try:
+                stacked = {key: np.stack([obs[key] for obs, _, _ in batch]) for key in batch[0][0]}
+                actions, _ = self.trinet.agent.predict(stacked, deterministic=self.deterministic)
+            except Exception as error:
+                for _, future, _ in batch:
+                    future.set_exception(error)
+                continue
+            done = time.perf_counter()
+            self.busy_time += done - start
+            self.requests += len(batch)
+            self.batches += 1
+            for (_, future, submitted), action in zip(batch, actions):
+                self.latencies.append(done - submitted)
+                future.set_result(action)
+
+    def stats(self):
+        """
+        Get the throughput and latency counters
+
+        Returns:
+        a dictionary with requests, batches, mean_batch_size, throughput (observations per second
+        since start), utilization (fraction of the time spent in forward passes) and the p50 and
+        p99 latency in seconds over the latency window
+        """
+        elapsed = time.perf_counter() - self.start_time if self.start_time is not None else 0.0
+        latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+        return {
+            'requests': self.requests, 'batches': self.batches,
+            'mean_batch_size': self.requests / max(self.batches, 1),
+            'throughput': self.requests / elapsed if elapsed > 0 else 0.0,
+            'utilization': self.busy_time / elapsed if elapsed > 0 else 0.0,
+            'p50_latency': float(np.percentile(latencies, 50)), 'p99_latency': float(np.percentile(latencies, 99))
+        }
+
+def play_games(envs, act, turns):
+    """
+    Play turns in every env from its own thread, choosing actions with act(obs)
+
+    Returns:
+    steps: the total number of steps played
+    """
+    def play(env):
+        obs, _ = env.reset()
+        for _ in range(turns):
+            obs, _, done, _, _ = env.step(act(obs))
+            if done:
+                obs, _ = env.reset()
+
+    threads = [threading.Thread(target=play, args=(env,)) for env in envs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(envs) * turns
+
+if __name__ == "__main__":
+    from risk_env import RiskEnv, Player
+    from risk_env_wrapper import RiskEnvWrapper
+    from trinet import TriNet
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--board", type=str, default="world.json", help="Path to board configuration JSON")
+    parser.add_argument("--model", type=str, default=None, help="Path to a trained model, an untrained one is used otherwise")
+    parser.add_argument("--games", type=int, default=64, help="Games played concurrently")
+    parser.add_argument("--turns", type=int, default=20, help="Turns per game")
+    parser.add_argument("--max-batch-size", type=int, nargs="+", default=[1, 16, 64], help="Batch sizes to compare")
+    parser.add_argument("--max-wait", type=float, default=0.002, help="Seconds to wait for a batch to fill")
+    parser.add_argument("--compact-obs", action="store_true", help="Use compact observations")
+    parser.add_argument("--edge-actions", action="store_true", help="Use edge-indexed actions")
+    args = parser.parse_args()
+
+    players = [Player(i) for i in range(2)]
+    wrapper_kwargs = {'compact_obs': args.compact_obs, 'edge_actions': args.edge_actions}
+    envs = [RiskEnvWrapper(RiskEnv(args.board, players, seed=i), **wrapper_kwargs) for i in range(args.games)]
+    trinet = TriNet(envs[0], model_path=args.model)
+
+    print(f"{'mode':>12s} {'steps/sec':>10s} {'batch':>6s} {'p50 ms':>7s} {'p99 ms':>7s}")
+    start = time.perf_counter()
+    steps = play_games(envs, lambda obs: trinet.predict(obs)[0], args.turns)
+    print(f"{'direct':>12s} {steps / (time.perf_counter() - start):10.1f}")
+    for max_batch_size in args.max_batch_size:
+        with InferenceBroker(trinet, max_batch_size=max_batch_size, max_wait=args.max_wait) as broker:
+            start = time.perf_counter()
+            steps = play_games(envs, broker.predict, args.turns)
+            elapsed = time.perf_counter() - start
+            stats = broker.stats()
+        print(f"{f'broker {max_batch_size}':>12s} {steps / elapsed:10.1f} {stats['mean_batch_size']:6.1f} "
+              f"{stats['p50_latency'] * 1000:7.2f} {stats['p99_latency'] * 1000:7.2f}")
@@ -0,0 +1,281 @@
+"""
+Monte Carlo tree search over whole turns. Every edge of the tree is one flat action of
+RiskEnvWrapper (a reinforce/attack/fortify plan). Dice make the game stochastic, so the
+search is open-loop: a node is a sequence of plans, and every simulation replays it from
+the root snapshot with fresh dice. Root-parallel workers search independent trees from the
+same root candidates and their visit counts are summed.
+"""
+
+import time
+import argparse
+import numpy as np
+
+from risk_env import RiskEnv, Player
+from risk_env_wrapper import RiskEnvWrapper
+from eval_cache import PolicyCache
+from worker_pool import get_context, HEADLESS_MODULES
+
+class Node():
+    """
+    A node of the open-loop tree
+
+    Class variables:
+    candidates: the list of candidate plans, None until the node is expanded
+    visits: a numpy array with the visit count of each candidate
+    values: a numpy array with the summed value of each candidate, from the point of view
+    of the player making that move
+    children: a dictionary of candidate index to child Node
+    """
+    def __init__(self, candidates=None):
+        self.candidates = None
+        self.children = {}
+        if candidates is not None:
+            self.expand(candidates)
+
+    def expand(self, candidates):
+        self.candidates = candidates
+        self.visits = np.zeros(len(candidates))
+        self.values = np.zeros(len(candidates))
+
+    def select(self, c_puct):
+        """
+        Pick a candidate with PUCT. Candidates are sampled from the prior, so the prior
+        of each sampled candidate is uniform.
+        """
+        unvisited = np.nonzero(self.visits == 0)[0]
+        if len(unvisited):
+            return unvisited[0]
+        q = self.values / self.visits
+        u = c_puct * np.sqrt(self.visits.sum()) / (len(self.candidates) * (1 + self.visits))
+        return int(np.argmax(q + u))
+
+class Search():
+    """
+    Runs simulations from a root snapshot. One Search lives in every worker process.
+
+    Parameters:
+    config: the dictionary built by MCTSPlanner (board, players, env and search settings)
+    """
+    def __init__(self, config):
+        self.config = config
+        risk_env = RiskEnv(config['board'], config['players'], **config['env_kwargs'])
+        self.env = RiskEnvWrapper(risk_env, **config['wrapper_kwargs'])
+        self.trinet = None
+        self.cache = None
+        if config['model_path'] is not None:
+            from trinet import TriNet
+            self.trinet = TriNet(self.env, model_path=config['model_path'])
+            if not self.trinet.random:
+                self.cache = PolicyCache(self.trinet, config['cache_size'])
+
+    def candidates(self, rng, count):
+        """
+        Sample candidate plans for the player to move: from the PPO policy if there is one
+        (its deterministic plan first), otherwise random plans of random density, so that
+        candidates range from cautious (few slots set) to all-out
+        """
+        if self.cache is None:
+            shape = self.env.action_space.shape
+            return [(rng.random(shape) * (rng.random(shape) < rng.random())).astype(np.float32) for _ in range(count)]
+        return self.cache.sample(self.env, rng, count)
+
+    def evaluate(self, rng, root_player):
+        """
+        Estimate the value of the current position for root_player, in [-1, 1]
+        """
+        risk_env = self.env.risk_env
+        done = risk_env.check_winner()[0]
+        if not done and self.cache is not None and self.config['value'] == "policy":
+            value = np.tanh(self.cache.evaluate(self.env)[2])
+            return value if risk_env.current_player_id == root_player else -value
+        for _ in range(self.config['rollout_depth']):
+            if done:
+                break
+            _, _, done, _, _ = self.env.step(rng.random(self.env.action_space.shape).astype(np.float32))
+        if risk_env.check_winner()[0]:
+            return 1.0 if risk_env.winner == root_player else -1.0
+        return 2 * risk_env.territory_counts[root_player] / len(risk_env.game_state) - 1
+
+    def run(self, snapshot, root_candidates, seed):
+        """
+        Search from a root snapshot until the simulation or time budget is spent
+
+        Returns:
+        visits: a numpy array with the visit count of each root candidate
+        values: a numpy array with the summed value of each root candidate
+        simulations: the number of simulations run
+        cache_stats: the hit statistics of this worker's evaluation cache, None without a model
+        """
+        rng = np.random.default_rng(seed)
+        start = time.perf_counter()
+        root = Node(root_candidates)
+        self.env.restore(snapshot)
+        root_player = self.env.risk_env.current_player_id
+        simulations = 0
+        while simulations < self.config['num_simulations']:
+            if self.config['time_limit'] is not None and time.perf_counter() - start >= self.config['time_limit']:
+                break
+            self.env.restore(snapshot)
+            self.env.risk_env.seed(rng.integers(2 ** 63))
+            node, path, done = root, [], False
+            while not done and len(path) < self.config['max_depth']:
+                if node.candidates is None:
+                    node.expand(self.candidates(rng, self.config['num_candidates']))
+                    break
+                index = node.select(self.config['c_puct'])
+                path.append((node, index, self.env.risk_env.current_player_id))
+                _, _, done, _, _ = self.env.step(node.candidates[index])
+                node = node.children.setdefault(index, Node())
+            value = self.evaluate(rng, root_player)
+            for parent, index, mover in path:
+                parent.visits[index] += 1
+                parent.values[index] += value if mover == root_player else -value
+            simulations += 1
+        self.env.restore(snapshot)
+        return root.visits, root.values, simulations, self.cache.cache.stats() if self.cache is not None else None
+
+_search = None
+
+def _init_worker(config):
+    global _search
+    _search = Search(config)
+
+def _run_worker(args):
+    return _search.run(*args)
+
+class MCTSPlanner():
+    def __init__(self, board, players, model_path=None, num_simulations=200, time_limit=None, num_candidates=8,
+                 c_puct=1.4, max_depth=4, rollout_depth=2, value="rollout", num_workers=1, env_kwargs=None,
+                 wrapper_kwargs=None, cache_size=100000, seed=0, start_method=None):
+        """
+        Plan turns with Monte Carlo tree search
+
+        Parameters:
+        board: path to the board JSON, the same board as the env that is planned for
+        players: a list of player objects
+        model_path: a saved TriNet model used as the prior over plans (and optionally as the value),
+        or None to sample plans uniformly
+        num_simulations: simulations per worker per decision
+        time_limit: seconds per decision, the search stops at whichever budget runs out first
+        num_candidates: plans sampled at every node
+        c_puct: exploration constant
+        max_depth: turns per simulation before the leaf is evaluated
+        rollout_depth: random turns played from a leaf before scoring territory share
+        value: "rollout" to score leaves by random rollouts, or "policy" to use the PPO value head
+        num_workers: processes searching independent trees from the same root (root parallelism)
+        env_kwargs: keyword arguments of RiskEnv (e.g. attack_mode)
+        wrapper_kwargs: keyword arguments of RiskEnvWrapper (e.g. edge_actions), must match the planned env
+        cache_size: entries of the policy/value cache of every worker, keyed by position hash (0 disables it)
+        seed: base seed of the search
+        start_method: multiprocessing start method, defaults to forkserver where available
+        """
+        if value not in ("rollout", "policy"):
+            raise ValueError("value must be 'rollout' or 'policy'")
+        self.config = {
+            'board': board, 'players': players, 'model_path': model_path,
+            'env_kwargs': env_kwargs or {}, 'wrapper_kwargs': wrapper_kwargs or {},
+            'num_simulations': num_simulations, 'time_limit': time_limit, 'num_candidates': num_candidates,
+            'c_puct': c_puct, 'max_depth': max_depth, 'rollout_depth': rollout_depth, 'value': value,
+            'cache_size': cache_size
+        }
+        self.num_workers = num_workers
+        self.rng = np.random.default_rng(seed)
+        # the root candidates are sampled here so that every worker searches the same root moves
+        self.search = Search(self.config)
+        self.pool = None
+        if num_workers > 1:
+            preload = HEADLESS_MODULES + ("mcts",) + (("trinet",) if model_path else ())
+            ctx = get_context(start_method, preload)
+            self.pool = ctx.Pool(num_workers, initializer=_init_worker, initargs=(self.config,))
+        self.last_stats = None
+
+    def plan(self, env):
+        """
+        Choose the plan for the player to move in env
+
+        Parameters:
+        env: a RiskEnvWrapper, left unchanged
+
+        Returns:
+        action: the flat action of the most visited root candidate
+        """
+        snapshot = env.snapshot()
+        self.search.env.restore(snapshot)
+        root_candidates = self.search.candidates(self.rng, self.config['num_candidates'])
+        seeds = self.rng.integers(2 ** 63, size=self.num_workers)
+        tasks = [(snapshot, root_candidates, seed) for seed in seeds]
+        if self.pool is None:
+            results = [self.search.run(*task) for task in tasks]
+        else:
+            results = self.pool.map(_run_worker, tasks)
+        visits = sum(result[0] for result in results)
+        values = sum(result[1] for result in results)
+        best = int(np.argmax(visits))
+        self.last_stats = {
+            'visits': visits, 'values': values, 'simulations': sum(result[2] for result in results),
+            'best_value': values[best] / max(visits[best], 1)
+        }
+        if results[0][3] is not None:
+            # cumulative over the life of the planner, summed over the workers
+            hits = sum(result[3]['hits'] for result in results)
+            misses = sum(result[3]['misses'] for result in results)
+            self.last_stats['cache'] = {'hits': hits, 'misses': misses, 'hit_rate': hits / max(hits + misses, 1)}
+        return root_candidates[best]
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--board", type=str, default="world.json", help="Path to board configuration JSON")
+    parser.add_argument("--model", type=str, default=None, help="Path to a trained model used as the prior")
+    parser.add_argument("--simulations", type=int, default=100, help="Simulations per worker per decision")
+    parser.add_argument("--time-limit", type=float, default=None, help="Seconds per decision")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Worker counts to time")
+    parser.add_argument("--games", type=int, default=4, help="Games against a random player")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    players = [Player(i) for i in range(2)]
+    wrapper_kwargs = {'edge_actions': True}
+    env = RiskEnvWrapper(RiskEnv(args.board, players), **wrapper_kwargs)
+
+    def play_games(planner):
+        """
+        Play player 0 (planner, or random if None) against a random player 1
+
+        Returns:
+        share: mean territory share of player 0 at the end of the games
+        simulations: total simulations run
+        elapsed: seconds spent planning
+        """
+        env.action_space.seed(args.seed)
+        share, simulations, elapsed = 0.0, 0, 0.0
+        for game in range(args.games):
+            env.reset(seed=args.seed + game)
+            done = False
+            while not done:
+                if planner is not None and env.risk_env.current_player_id == 0:
+                    start = time.perf_counter()
+                    action = planner.plan(env)
+                    elapsed += time.perf_counter() - start
+                    simulations += planner.last_stats['simulations']
+                else:
+                    action = env.action_space.sample()
+                _, _, done, _, _ = env.step(action)
+            share += env.risk_env.territory_counts[0] / env.T / args.games
+        return share, simulations, elapsed
+
+    print(f"{'player 0':>10s} {'sims/sec':>9s} {'territory share':>16s}")
+    share, _, _ = play_games(None)
+    print(f"{'random':>10s} {'':9s} {share:16.3f}")
+    for num_workers in args.workers:
+        planner = MCTSPlanner(args.board, players, model_path=args.model, num_simulations=args.simulations,
+                              time_limit=args.time_limit, num_workers=num_workers,
+                              wrapper_kwargs=wrapper_kwargs, seed=args.seed)
+        share, simulations, elapsed = play_games(planner)
+        planner.close()
+        print(f"{f'mcts x{num_workers}':>10s} {simulations / elapsed:9.1f} {share:16.3f}")
@@ -0,0 +1,292 @@
+"""
+Opponents that RiskEnvWrapper moves itself (see its opponents parameter), so that only the
+learner's turns reach PPO. The scripted bots read game_state and the board's edge list with
+a few vectorized numpy operations per turn. CheckpointPool plays frozen TriNet checkpoints.
+"""
+
+import time
+import argparse
+import numpy as np
+
+class Opponent():
+    """
+    A player moved by the wrapper. act returns the turn of the player to move as
+    (reinforce_units, attack_action, fortify_action), in the form that RiskEnv.reinforce,
+    RiskEnv.attack and RiskEnv.fortify take, with edge lists for the attacks and the fortify move.
+    """
+    def reset(self, env):
+        """
+        Called by the wrapper at the start of every episode
+        """
+        pass
+
+    def act(self, env):
+        raise NotImplementedError
+
+def _distribute(weights, total):
+    """
+    Split total units in proportion to non-negative weights, the remainder going to the largest weight
+    """
+    units = np.zeros(len(weights), dtype=np.int32)
+    weight_sum = weights.sum()
+    if weight_sum <= 0 or total <= 0:
+        return units
+    units[:] = np.floor(weights / weight_sum * total)
+    units[np.argmax(weights)] += total - units.sum()
+    return units
+
+def _no_edges():
+    return (np.array([], dtype=np.int64),) * 3
+
+class ScriptedBot(Opponent):
+    """
+    Common turn structure of the scripted bots: reinforce by reinforce_weights, attack the weakest
+    enemy neighbor of every frontier territory with all spare units when they outnumber its
+    defenders by attack_ratio, then move the largest interior stack to the most threatened border
+    territory of its component.
+
+    Class variables:
+    attack_ratio: spare units per defender needed to attack, np.inf never attacks
+    """
+    attack_ratio = 1.0
+
+    def reinforce_weights(self, owned, units, frontier, weakest, threat):
+        """
+        Parameters:
+        owned: a (T,) mask of the bot's territories
+        units: the (T,) units on the board
+        frontier: the (T,) mask of owned territories with an enemy neighbor
+        weakest: the (T,) fewest defenders among the enemy neighbors of a territory (inf for none)
+        threat: the (T,) sum of the enemy units next to a territory
+
+        Returns:
+        weights: a (T,) non-negative array, zero outside of the owned territories
+        """
+        raise NotImplementedError
+
+    def act(self, env):
+        risk_env = env.risk_env
+        player_id = risk_env.current_player_id
+        owners, units = risk_env.game_state[:, 0], risk_env.game_state[:, 1]
+        sources, targets = risk_env.board.edge_sources, risk_env.board.edge_targets
+        T = len(owners)
+        owned = owners == player_id
+        enemy_edges = owned[sources] & ~owned[targets]
+        frontier_sources, frontier_targets = sources[enemy_edges], targets[enemy_edges]
+        frontier = np.bincount(frontier_sources, minlength=T) > 0
+        weakest = np.full(T, np.inf)
+        np.minimum.at(weakest, frontier_sources, units[frontier_targets])
+        threat = np.bincount(frontier_sources, weights=units[frontier_targets], minlength=T)
+
+        reinforce = _distribute(self.reinforce_weights(owned, units, frontier, weakest, threat),
+                                risk_env.get_reinforcements(player_id))
+        units = units + reinforce
+        spare = np.maximum(units - 1, 0)
+
+        # one attack per frontier territory, on its weakest neighbor
+        order = np.lexsort((units[frontier_targets], frontier_sources))
+        _, first = np.unique(frontier_sources[order], return_index=True)
+        attack_sources, attack_targets = frontier_sources[order][first], frontier_targets[order][first]
+        attacking = spare[attack_sources] >= self.attack_ratio * units[attack_targets]
+        attack = (attack_sources[attacking], attack_targets[attacking], spare[attack_sources][attacking])
+
+        # territories that attacked keep their units, the planned state is only an estimate after the battles
+        stacks = np.where(owned & ~frontier, spare, 0)
+        stacks[attack[0]] = 0
+        fortify = _no_edges()
+        if stacks.max() > 0:
+            src = int(np.argmax(stacks))
+            components = risk_env.get_components()
+            candidates = np.flatnonzero(frontier & (components == components[src]))
+            if len(candidates):
+                dest = candidates[np.argmax(threat[candidates] - units[candidates])]
+                fortify = (np.array([src]), np.array([dest]), np.array([stacks[src]]))
+        return reinforce, attack, fortify
+
+class GreedyAttacker(ScriptedBot):
+    """
+    Piles every reinforcement on the frontier territory with the largest lead over its weakest
+    neighbor and attacks wherever the spare units outnumber the defenders
+    """
+    attack_ratio = 1.0
+
+    def reinforce_weights(self, owned, units, frontier, weakest, threat):
+        if not frontier.any():
+            return owned.astype(float)
+        lead = np.where(frontier, units - weakest, -np.inf)
+        return (np.arange(len(units)) == np.argmax(lead)).astype(float)
+
+class BorderReinforcer(ScriptedBot):
+    """
+    Spreads reinforcements over the frontier in proportion to the enemy units it faces and attacks
+    only with a two to one advantage
+    """
+    attack_ratio = 2.0
+
+    def reinforce_weights(self, owned, units, frontier, weakest, threat):
+        if not frontier.any():
+            return owned.astype(float)
+        return np.where(frontier, threat, 0.0)
+
+class Turtle(ScriptedBot):
+    """
+    Shores up the frontier territory that is most outnumbered and attacks only with a three to one advantage
+    """
+    attack_ratio = 3.0
+
+    def reinforce_weights(self, owned, units, frontier, weakest, threat):
+        if not frontier.any():
+            return owned.astype(float)
+        deficit = np.where(frontier, threat - units, -np.inf)
+        return (np.arange(len(units)) == np.argmax(deficit)).astype(float)
+
+class RandomOpponent(Opponent):
+    """
+    Plays uniformly random actions of the wrapper's action space, drawn from the env's own generator
+    """
+    def act(self, env):
+        action = env.risk_env.rng.random(env.action_space.shape[0]).astype(np.float32)
+        return env.decode_action(action)
+
+class CheckpointPool(Opponent):
+    """
+    Frozen TriNet checkpoints, one drawn at the start of every episode. The checkpoints must use
+    the observation and action settings of the wrapper they play in. They are loaded when first
+    played and are not pickled with the wrapper, so every vectorized env worker loads its own copies.
+
+    Parameters:
+    model_paths: paths of the saved checkpoints
+    policy: "mlp" or "gnn", the policy of the checkpoints (see TriNet)
+    gnn_kwargs: hidden_dim and num_layers of gnn checkpoints
+    seed: seed of the draws
+
+    Class variables:
+    current: the path of the checkpoint playing the current episode
+    """
+    def __init__(self, model_paths, policy="mlp", gnn_kwargs=None, seed=None):
+        if not model_paths:
+            raise ValueError("A checkpoint pool needs at least one checkpoint")
+        self.model_paths = list(model_paths)
+        self.policy = policy
+        self.gnn_kwargs = gnn_kwargs
+        self.rng = np.random.default_rng(seed)
+        self.agents = {}
+        self.current = self.model_paths[0]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['agents'] = {}
+        return state
+
+    def add(self, model_path):
+        """
+        Add a checkpoint to the draws of later episodes
+        """
+        self.model_paths.append(model_path)
+
+    def reset(self, env):
+        self.current = self.model_paths[self.rng.integers(len(self.model_paths))]
+
+    def _load(self, env, model_path):
+        if model_path not in self.agents:
+            from stable_baselines3 import PPO
+            custom_objects = None
+            if self.policy == "gnn":
+                # graph checkpoints are rebuilt for the board of the env they play on, like TriNet.load_model
+                board = env.board_structure()
+                custom_objects = {'observation_space': env.observation_space, 'action_space': env.action_space,
+                                  'policy_kwargs': {'edge_sources': board['edge_sources'],
+                                                    'edge_targets': board['edge_targets'], **(self.gnn_kwargs or {})}}
+            self.agents[model_path] = PPO.load(model_path, device="cpu", custom_objects=custom_objects)
+        return self.agents[model_path]
+
+    def act(self, env):
+        action, _ = self._load(env, self.current).predict(env._get_obs())
+        return env.decode_action(action)
+
+BOTS = {'greedy': GreedyAttacker, 'border': BorderReinforcer, 'turtle': Turtle, 'random': RandomOpponent}
+
+def make_opponent(spec):
+    """
+    Build the opponent of one seat
+
+    Parameters:
+    spec: an Opponent, the name of a scripted bot (see BOTS), the path of a TriNet checkpoint,
+    or a list of checkpoint paths to draw from
+
+    Returns:
+    opponent: the Opponent
+    """
+    if isinstance(spec, Opponent):
+        return spec
+    if isinstance(spec, str):
+        if spec in BOTS:
+            return BOTS[spec]()
+        return CheckpointPool([spec])
+    if isinstance(spec, (list, tuple)):
+        return CheckpointPool(spec)
+    raise ValueError(f"Unknown opponent {spec!r}, expected an Opponent, one of {sorted(BOTS)} or checkpoint paths")
+
+if __name__ == "__main__":
+    from risk_env import RiskEnv, Player
+    from risk_env_wrapper import RiskEnvWrapper
+    from trinet import TriNet
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--board", type=str, default="world.json", help="Path to board configuration JSON")
+    parser.add_argument("--games", type=int, default=20, help="Games per pairing of bots")
+    parser.add_argument("--max-turns", type=int, default=200, help="Turns after which a game is a draw")
+    parser.add_argument("--steps", type=int, default=500, help="Learner steps to time")
+    args = parser.parse_args()
+
+    players = [Player(i) for i in range(2)]
+
+    # every bot against every other, each moving first in half of the games
+    names = list(BOTS)
+    print(f"{'win rate of row vs column':>26s}" + "".join(f" {name:>8s}" for name in names))
+    for first in names:
+        row = f"{first:>26s}"
+        for second in names:
+            if first == second:
+                row += f" {'-':>8s}"
+                continue
+            wins = 0
+            for game in range(args.games):
+                seats = [first, second] if game % 2 == 0 else [second, first]
+                risk_env = RiskEnv(args.board, players, seed=game)
+                bots = [make_opponent(name) for name in seats]
+                env = RiskEnvWrapper(risk_env, edge_actions=True, compact_obs=True)
+                env.reset(seed=game)
+                for _ in range(args.max_turns):
+                    if env.play_turn(*bots[risk_env.current_player_id].act(env)):
+                        break
+                winner = risk_env.check_winner()[1]
+                wins += winner is not None and seats[winner] == first
+            row += f" {wins / args.games:8.2f}"
+        print(row)
+
+    # the cost of one opponent decision, and learner steps per second, when the opponent is the
+    # policy itself (self-play, every step is one player's turn) or a scripted bot (every step is a round)
+    print(f"{'opponent':>26s} {'us/decision':>12s} {'learner steps/sec':>18s}")
+    env = RiskEnvWrapper(RiskEnv(args.board, players, seed=0), edge_actions=True, compact_obs=True)
+    trinet = TriNet(env)
+    for name in ("policy", "greedy", "border", "turtle"):
+        env = RiskEnvWrapper(RiskEnv(args.board, players, seed=0), edge_actions=True, compact_obs=True,
+                             opponents=None if name == "policy" else [None, name])
+        opponent = None if name == "policy" else env.opponents[1]
+        obs, _ = env.reset(seed=0)
+        decision, steps = 0.0, 0
+        start = time.perf_counter()
+        while steps < args.steps:
+            begin = time.perf_counter()
+            if opponent is None:
+                env.decode_action(trinet.predict(obs)[0])
+            else:
+                opponent.act(env)
+            decision += time.perf_counter() - begin
+            obs, _, done, _, _ = env.step(trinet.predict(obs)[0])
+            steps += 1
+            if done:
+                obs, _ = env.reset()
+        elapsed = time.perf_counter() - start - decision
+        print(f"{name:>26s} {decision / steps * 1e6:12.1f} {steps / elapsed:18.1f}")
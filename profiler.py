@@ -0,0 +1,115 @@
+"""
+Opt-in per-phase profiling of environment steps and training. Code marks the start of a step
+with begin() and the end of every phase with lap(name), the profiler keeps call counts, totals
+and a rolling window of recent samples per phase.
+"""
+
+import sys
+import csv
+import time
+from collections import deque
+import numpy as np
+
+class StepProfiler():
+    """
+    Parameters:
+    window: the number of most recent samples per phase the percentiles are taken over
+    track_allocations: also record the net change in the interpreter's allocated memory blocks
+    over every phase (sys.getallocatedblocks, which counts Python objects such as array headers
+    but not the numpy data buffers themselves)
+
+    Class variables:
+    last: a dictionary of phase to seconds for the most recent step
+    calls, totals: dictionaries of phase to the number of samples and the summed seconds
+    """
+    def __init__(self, window=1000, track_allocations=False):
+        self.window = window
+        self.track_allocations = track_allocations
+        self.last = {}
+        self.calls = {}
+        self.totals = {}
+        self.samples = {}
+        self.allocations = {}
+        self._mark = None
+        self._blocks = 0
+
+    def begin(self):
+        """
+        Start timing a step, the first lap is measured from here
+        """
+        self.last = {}
+        if self.track_allocations:
+            self._blocks = sys.getallocatedblocks()
+        self._mark = time.perf_counter()
+
+    def lap(self, phase):
+        """
+        End a phase: record the time (and blocks) since begin() or the previous lap
+        """
+        now = time.perf_counter()
+        if self.track_allocations:
+            blocks = sys.getallocatedblocks()
+            self.last[phase + '_blocks'] = blocks - self._blocks
+            self._add(phase, now - self._mark, blocks - self._blocks)
+            self._blocks = blocks
+        else:
+            self._add(phase, now - self._mark)
+        self.last[phase] = now - self._mark
+        self._mark = time.perf_counter()
+
+    def record(self, timings):
+        """
+        Add phase timings measured elsewhere, e.g. the info['profile'] of an env in a worker process
+        """
+        for phase, seconds in timings.items():
+            if not phase.endswith('_blocks'):
+                self._add(phase, seconds, timings.get(phase + '_blocks'))
+
+    def _add(self, phase, seconds, blocks=None):
+        if phase not in self.calls:
+            self.calls[phase] = 0
+            self.totals[phase] = 0.0
+            self.samples[phase] = deque(maxlen=self.window)
+            self.allocations[phase] = deque(maxlen=self.window)
+        self.calls[phase] += 1
+        self.totals[phase] += seconds
+        self.samples[phase].append(seconds)
+        if blocks is not None:
+            self.allocations[phase].append(blocks)
+
+    def summary(self):
+        """
+        Get the rolling aggregate of every phase
+
+        Returns:
+        a dictionary of phase to calls, total_s, share (of the total time of all phases),
+        mean_us, p50_us and p99_us over the window and, with track_allocations, mean_blocks
+        """
+        overall = sum(self.totals.values())
+        summary = {}
+        for phase, samples in self.samples.items():
+            window = np.array(samples) * 1e6
+            summary[phase] = {
+                'calls': self.calls[phase], 'total_s': self.totals[phase],
+                'share': self.totals[phase] / overall if overall > 0 else 0.0,
+                'mean_us': float(window.mean()),
+                'p50_us': float(np.percentile(window, 50)), 'p99_us': float(np.percentile(window, 99)),
+            }
+            if self.allocations[phase]:
+                summary[phase]['mean_blocks'] = float(np.mean(self.allocations[phase]))
+        return summary
+
+    def dump_csv(self, path):
+        """
+        Write the summary with one row per phase
+        """
+        summary = self.summary()
+        fields = ['phase', 'calls', 'total_s', 'share', 'mean_us', 'p50_us', 'p99_us', 'mean_blocks']
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            for phase, row in summary.items():
+                writer.writerow({'phase': phase, **row})
+
+    def reset(self):
+        self.__init__(self.window, self.track_allocations)
@@ -1,5 +1,62 @@
 import numpy as np
-import json
+
+from battle_tables import load_battle_table
+from board_cache import load_board
+
+# Zobrist keys are drawn from a fixed seed so that every env and process hashes a position the same way
+ZOBRIST_SEED = 20240515
+# unit counts below the cap have their own random key, larger counts are mixed from a per-territory key
+ZOBRIST_UNIT_CAP = 64
+MASK64 = (1 << 64) - 1
+GOLDEN64 = 0x9E3779B97F4A7C15
+# every battle round rolls a fixed block of dice, 3 for the attacker then 2 for the defender
+DICE_PER_ROUND = 5
+
+_zobrist_tables = {}
+
+def zobrist_tables(num_territories, num_players):
+    """
+    Get the random 64-bit keys of the Zobrist hash, shared by every env with the same shape
+
+    Returns:
+    owner_keys: a T x P uint64 numpy array, the key of each territory being owned by each player
+    unit_keys: a T x ZOBRIST_UNIT_CAP uint64 numpy array, the key of each territory holding each number of units
+    player_keys: a (P,) uint64 numpy array, the key of each player being the one to move
+    """
+    shape = (num_territories, num_players)
+    if shape not in _zobrist_tables:
+        rng = np.random.default_rng(ZOBRIST_SEED)
+        keys = rng.integers(0, 2 ** 64, (num_territories, num_players + ZOBRIST_UNIT_CAP), dtype=np.uint64)
+        _zobrist_tables[shape] = (keys[:, :num_players], keys[:, num_players:],
+                                  rng.integers(0, 2 ** 64, num_players, dtype=np.uint64))
+    return _zobrist_tables[shape]
+
+def mix64(x):
+    """
+    splitmix64 finalizer, used for the keys of unit counts above ZOBRIST_UNIT_CAP
+    """
+    x = (x + GOLDEN64) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+def roll_dice_block(dice_states):
+    """
+    Roll one battle round for many dice counters at once, the vectorized RiskEnv.roll_dice
+
+    Parameters:
+    dice_states: a uint64 numpy array of dice counters
+
+    Returns:
+    dice: a len(dice_states) x DICE_PER_ROUND int64 array of rolls from 1 to 6
+    dice_states: the counters after the round
+    """
+    x = dice_states[:, None] + np.arange(1, DICE_PER_ROUND + 1, dtype=np.uint64) * np.uint64(GOLDEN64)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    dice = (((x >> np.uint64(32)) * np.uint64(6)) >> np.uint64(32)).astype(np.int64) + 1
+    return dice, dice_states + np.uint64(DICE_PER_ROUND * GOLDEN64 & MASK64)
 
 class Player():
     def __init__(self, player_id, name=None, policy=None):
@@ -58,35 +115,76 @@ def game_state_from_board(board):
     return game_state
 
 class RiskEnv():
-    def __init__(self, board, players):
+    def __init__(self, board, players, attack_mode="dice", battle_cap=64, debug=False, seed=None):
         """
         Initialize the Risk environment
         Parameters:
-        board: a JSON object representing the board
+        board: path to a JSON file representing the board, compiled once and shared through board_cache
         players: a list of player objects
+        attack_mode: "dice" to roll every battle one round at a time, or "resolved" to sample
+        the final outcome of each battle in one draw from precomputed distributions
+        battle_cap: the largest stack size covered by the resolved distributions, larger
+        battles are rolled until both stacks fit
+        debug: cross-check the incremental ownership counters against a full recount on every query
+        seed: seed of the env's own random generator, used for dealing territories and rolling dice
 
         Class variables:
-        board: a JSON object representing the board
+        board: the compiled board (see board_cache.CompiledBoard)
         game_state: a T x 2 numpy array representing the game state (owner id, number of units)
-        adjacencies: a T x T numpy array representing the adjacency matrix of the territories
+        adjacencies: a T x T numpy array representing the adjacency matrix of the territories,
+        built on first access (the game itself uses the board's CSR neighbor lists)
         territories: a dictionary of territories and their corresponding indices
         continents: a dictionary of continents and their corresponding territories
         winner: the winner of the game (player name)
         players: a dictionary of player objects referenced by their name
+        neighbors: a list of T numpy arrays with the neighbor indices of each territory
+        components: a numpy array of shape (T,) labeling each territory with the connected
+        component of its owner's subgraph, two territories with the same owner are linked
+        if and only if they have the same label
+        territory_counts: a numpy array of shape (P,) with the number of territories owned by each player
+        continent_counts: a C x P numpy array with the number of territories of each continent owned by each player
+        continent_bonus: a numpy array of shape (P,) with the continent bonus currently earned by each player
+        rng: the np.random.Generator every random draw of this env comes from, the dice through dice_state
+        dice_state: the splitmix64 counter the dice are rolled from (see roll_dice), seeded from rng
+        board_hash: Zobrist hash of the owners and units of every territory, updated incrementally
+        by reinforce, attack and fortify (see position_hash)
+        battle_log: None, or a list that attack appends (src, dest, units, attacker_lost, defender_lost,
+        conquered) to for every battle fought
+        fortify_log: None, or a list that fortify appends (src, dest, units moved) to
         
         Note: for efficiency, territories should be grouped by continent for faster ownership checks
 
         """
-        board = json.load(open(board))
+        board = load_board(board)
         self.players = players
         self.board = board # keep a copy for reset
-        self.game_state = np.array(game_state_from_board(board))
+        self.seed(seed)
+        self.game_state = np.array([(0, 1)] * board.num_territories)
         self.start_player_id = self.init_game_state()
-        self.territories, self.adjacencies, self.continents = parse_board_layout(board)
-        self.positions = self._extract_positions(board, self.territories)
+        self.territories, self.continents = board.territories, board.continents
+        self.neighbors = [board.neighbors(i) for i in range(board.num_territories)]
+        self.positions = board.positions
+        self.continent_sizes = board.continent_ends - board.continent_starts
+        self.continent_bonuses = board.continent_bonuses
+        self.territory_continent = np.repeat(np.arange(len(self.continents)), self.continent_sizes)
+        self.debug = debug
+        self.owner_keys, self.unit_keys, self.player_keys = zobrist_tables(board.num_territories, len(players))
+        self.label_components()
+        self.count_ownership()
+        self.rehash()
+        if attack_mode not in ("dice", "resolved"):
+            raise ValueError("attack_mode must be 'dice' or 'resolved'")
+        self.attack_mode = attack_mode
+        self.battle_table = load_battle_table(battle_cap) if attack_mode == "resolved" else None
         self.winner = None
         self.turn = 0
         self.current_player_id = self.start_player_id
+        self.battle_log = None
+        self.fortify_log = None
+
+    @property
+    def adjacencies(self):
+        return self.board.adjacencies
 
     def init_game_state(self):
         """
@@ -97,32 +195,101 @@ class RiskEnv():
         num_players = len(self.players)
         num_territories = len(self.game_state)
         indices = np.arange(num_territories)
-        np.random.shuffle(indices)
+        self.rng.shuffle(indices)
         for i in range(num_territories):
             self.game_state[indices[i]] = (i % num_players, 1)
             last_player_id = i % num_players
 
         return (last_player_id + 1) % num_players 
     
-    def _extract_positions(self, board_data, territories):
-        positions = {}
-        # territories is {territory_name: index}
-        for t_name, t_index in territories.items():
-            # Each territory in the JSON has a "position" field: [x, y]
-            pos = board_data["Territories"][t_name]["position"]
-            positions[t_index] = (pos[0], pos[1])
-        return positions
-
-    def reset(self):
+    def reset(self, seed=None):
         """
         Reset the game state to the initial state
+
+        Parameters:
+        seed: if given, reseed the env's random generator first, so that the deal and every
+        later dice roll are reproducible
         """
-        self.game_state = np.array(game_state_from_board(self.board))
+        if seed is not None:
+            self.seed(seed)
+        self.game_state = np.array([(0, 1)] * self.board.num_territories)
         self.start_player_id = self.init_game_state()
+        self.label_components()
+        self.count_ownership()
+        self.rehash()
         self.winner = None
         self.turn = 0
         self.current_player_id = 0
 
+    def seed(self, seed=None):
+        """
+        Replace the env's random generator with a new one seeded with seed
+        """
+        self.rng = np.random.default_rng(seed)
+        self.dice_state = int(self.rng.integers(0, 2 ** 64, dtype=np.uint64))
+
+    def roll_dice(self):
+        """
+        Roll the dice of one battle round. Every round rolls DICE_PER_ROUND dice from the splitmix64
+        counter dice_state, whatever the stacks: the attacker uses the first min(units, 3), the
+        defender the first min(units, 2) of the last 2. A fixed block lets BatchedRiskEnv roll the
+        same dice for all its games in one vectorized draw (see roll_dice_block).
+
+        Returns:
+        dice: a list of DICE_PER_ROUND rolls from 1 to 6
+        """
+        state = self.dice_state
+        self.dice_state = (state + DICE_PER_ROUND * GOLDEN64) & MASK64
+        return [(((mix64((state + i * GOLDEN64) & MASK64) >> 32) * 6) >> 32) + 1 for i in range(DICE_PER_ROUND)]
+
+    def snapshot(self):
+        """
+        Copy the mutable state of the game, including the random generator. The board is
+        shared and never copied, so a snapshot is a few small arrays.
+
+        Returns:
+        snapshot: a dictionary that can be passed to restore, any number of times
+        """
+        return {
+            'game_state': self.game_state.copy(),
+            'current_player_id': self.current_player_id,
+            'start_player_id': self.start_player_id,
+            'turn': self.turn,
+            'winner': self.winner,
+            'components': self.components.copy(),
+            'next_component': self._next_component,
+            'labeled_owners': self._labeled_owners.copy(),
+            'territory_counts': self.territory_counts.copy(),
+            'continent_counts': self.continent_counts.copy(),
+            'continent_bonus': self.continent_bonus.copy(),
+            'board_hash': self.board_hash,
+            'rng_state': self.rng.bit_generator.state,
+            'dice_state': self.dice_state
+        }
+
+    def restore(self, snapshot):
+        """
+        Return the game to a state taken by snapshot. Random draws after a restore repeat
+        the draws made after the snapshot was taken.
+
+        Parameters:
+        snapshot: a dictionary returned by snapshot
+        """
+        self.game_state = snapshot['game_state'].copy()
+        self.current_player_id = snapshot['current_player_id']
+        self.start_player_id = snapshot['start_player_id']
+        self.turn = snapshot['turn']
+        self.winner = snapshot['winner']
+        self.components = snapshot['components'].copy()
+        self._next_component = snapshot['next_component']
+        self._labeled_owners = snapshot['labeled_owners'].copy()
+        self.territory_counts = snapshot['territory_counts'].copy()
+        self.continent_counts = snapshot['continent_counts'].copy()
+        self.continent_bonus = snapshot['continent_bonus'].copy()
+        self.board_hash = snapshot['board_hash']
+        self.rng.bit_generator.state = snapshot['rng_state']
+        self.dice_state = snapshot['dice_state']
+
     def check_winner(self):
         """
         Check if there is a winner and update the winner variable
@@ -130,8 +297,10 @@ class RiskEnv():
         Returns:
         winner: boolean indicating whether there is a winner
         """
-        if len(np.unique(self.game_state[:,0])) == 1:
-            self.winner = np.unique(self.game_state[:,0])[0]
+        self._check_counters()
+        owner = self.game_state[0,0]
+        if self.territory_counts[owner] == len(self.game_state):
+            self.winner = owner
             return (True, self.winner)
         return (False, None)
 
@@ -176,12 +345,9 @@ class RiskEnv():
         Returns:
         reinforcements: the number of reinforcements
         """
-        reinforcements = 0
-        for continent, (start, end, bonus) in self.continents.items():
-            if np.all(self.game_state[start:end, 0] == player_id):
-                reinforcements += bonus
-        
-        reinforcements += max(3, np.sum(self.game_state[:,0] == player_id), 1 // 3)
+        self._check_counters()
+        reinforcements = self.continent_bonus[player_id]
+        reinforcements += max(3, self.territory_counts[player_id], 1 // 3)
         return reinforcements
     
     def reinforce(self, player_id, reinforce_action):
@@ -205,7 +371,10 @@ class RiskEnv():
             raise ValueError("Cannot reinforce territories you do not own")
 
         # reinforce the territories
+        changed = np.nonzero(reinforce_action)[0]
+        self.toggle_hash(changed)
         self.game_state[:,1] += reinforce_action[:]
+        self.toggle_hash(changed)
 
     def attack(self, player_id, attack_action):
         """
@@ -214,31 +383,42 @@ class RiskEnv():
         Parameters:
         player_id: the id of the player
         attack_action: a numpy array of shape (T,T) which is the
-        number of units to attack along an edge from i to j
+        number of units to attack along an edge from i to j, or an edge list
+        (sources, targets, units) of arrays of equal length
         
         Returns:
         winner: boolean indicating whether there is a winner
         """
-        # find indices of all non-zero attacks
-        indices = np.argwhere(attack_action > 0)
-        for index in indices:
-            attack_units = attack_action[index[0], index[1]]
+        # find all non-zero attacks, in row-major order for a T x T action
+        if isinstance(attack_action, tuple):
+            sources, targets, units = (np.asarray(a) for a in attack_action)
+            attacking = units > 0
+            attacks = zip(sources[attacking], targets[attacking], units[attacking])
+        else:
+            indices = np.argwhere(attack_action > 0)
+            attacks = ((src, dest, attack_action[src, dest]) for src, dest in indices)
+        self.get_components()
+        owned_before = self.game_state[:,0] == player_id
+        for src, dest, attack_units in attacks:
             # check if the player is attacking from a territory they own
-            if self.game_state[index[0],0] != player_id:
+            if self.game_state[src,0] != player_id:
                 raise ValueError("Cannot attack from a territory you do not own")
+            # an attack on a territory conquered earlier this phase is dropped
+            if self.game_state[dest,0] == player_id and not owned_before[dest]:
+                continue
             # check if the player is attacking a territory they own
-            if self.game_state[index[1],0] == player_id:
-                # print(self.game_state[index[0]])
-                # print("Player ", player_id, " attacking from ", index[0], " to ", index[1])
+            if self.game_state[dest,0] == player_id:
+                # print(self.game_state[src])
+                # print("Player ", player_id, " attacking from ", src, " to ", dest)
                 # print("with ", attack_units, " units")
-                # print(self.game_state[index[1]])
+                # print(self.game_state[dest])
                 #return
                 raise ValueError("Cannot attack a territory you own")
             # check if the player is attacking an adjacent territory
-            if self.adjacencies[index[0], index[1]] == 0:
+            if not self.board.has_edge(src, dest):
                 raise ValueError("Cannot attack a non-adjacent territory")
             # check if the player is attacking with enough units
-            if self.game_state[index[0], 1] < 2:
+            if self.game_state[src, 1] < 2:
                 raise ValueError("Must have at least 2 units to attack")        
             # attack the territories, for each attack roll the maximum number of dice
             # for the attacker and defender and compare the results, subtract eliminated
@@ -246,27 +426,75 @@ class RiskEnv():
             # and repeat until the attacker has reached their attack target at each
             # territory in the attack action or the defender has no units left
 
+            self.toggle_hash((src, dest))
+            if self.battle_log is not None:
+                before = (self.game_state[src,1], self.game_state[dest,1], attack_units)
+            if self.battle_table is not None:
+                self.resolve_battle(player_id, src, dest, attack_units)
+                self.toggle_hash((src, dest))
+                if self.battle_log is not None:
+                    self._log_battle(player_id, src, dest, *before)
+                continue
+
             while attack_units > 0:
-                attack_dice = np.random.randint(1, 7, min(attack_units, 3))
-                defend_dice = np.random.randint(1, 7, min(self.game_state[index[1],1], 2))
-                attack_dice = np.sort(attack_dice)
-                defend_dice = np.sort(defend_dice)
-                for i in range(min(attack_units, self.game_state[index[1],1], 2)):
+                dice = self.roll_dice()
+                attack_dice = sorted(dice[:min(attack_units, 3)])
+                defend_dice = sorted(dice[3:3 + min(self.game_state[dest,1], 2)])
+                for i in range(min(attack_units, self.game_state[dest,1], 2)):
                     if attack_dice[i] > defend_dice[i]:
-                        self.game_state[index[1],1] -= 1
+                        self.game_state[dest,1] -= 1
                     else:
                         attack_units -= 1
-                        self.game_state[index[0],1] -= 1
-                if self.game_state[index[1],1] == 0:
-                    self.game_state[index[1],0] = player_id
-                    self.game_state[index[1],1] = attack_units
+                        self.game_state[src,1] -= 1
+                if self.game_state[dest,1] == 0:
+                    self.change_owner(dest, player_id)
+                    self.game_state[dest,1] = attack_units
                     break
-                if self.game_state[index[1],0] == player_id:
-                    self.game_state[index[1],1] += attack_units
+                if self.game_state[dest,0] == player_id:
+                    self.game_state[dest,1] += attack_units
                     break
+            self.toggle_hash((src, dest))
+            if self.battle_log is not None:
+                self._log_battle(player_id, src, dest, *before)
         # check if the player has conquered all territories
         return self.check_winner()[0]
     
+    def _log_battle(self, player_id, src, dest, src_units, dest_units, attack_units):
+        conquered = self.game_state[dest,0] == player_id
+        defender_lost = dest_units if conquered else dest_units - self.game_state[dest,1]
+        self.battle_log.append((src, dest, attack_units, src_units - self.game_state[src,1], defender_lost, conquered))
+
+    def resolve_battle(self, player_id, src, dest, attack_units):
+        """
+        Fight a battle like the dice loop of attack, but sample the final outcome in one draw.
+        Rounds are only rolled while either stack is larger than the battle table cap.
+
+        Parameters:
+        player_id: the id of the attacking player
+        src: the index of the attacking territory
+        dest: the index of the defending territory
+        attack_units: the number of units to attack with
+        """
+        cap = self.battle_table.cap
+        while attack_units > 0 and self.game_state[dest,1] > 0 and (attack_units > cap or self.game_state[dest,1] > cap):
+            dice = self.roll_dice()
+            attack_dice = sorted(dice[:min(attack_units, 3)])
+            defend_dice = sorted(dice[3:3 + min(self.game_state[dest,1], 2)])
+            for i in range(min(attack_units, self.game_state[dest,1], 2)):
+                if attack_dice[i] > defend_dice[i]:
+                    self.game_state[dest,1] -= 1
+                else:
+                    attack_units -= 1
+                    self.game_state[src,1] -= 1
+        if attack_units > 0 and self.game_state[dest,1] > 0:
+            attacker_lost, defender_lost = self.battle_table.sample(attack_units, self.game_state[dest,1], self.rng.random())
+            attack_units -= attacker_lost
+            self.game_state[src,1] -= attacker_lost
+            self.game_state[dest,1] -= defender_lost
+        if self.game_state[dest,1] == 0:
+            self.game_state[dest,1] = attack_units
+            self.change_owner(dest, player_id)
+
     def fortify(self, player_id, fortify_action):
         """
         Fortify a territory
@@ -274,11 +502,19 @@ class RiskEnv():
         Parameters:
         player_id: the id of the player
         fortify_action: a numpy array of shape (T,2) where the first column is the number
-        of units to fortify with and the second column is the index of the territory to fortify
+        of units to fortify with and the second column is the index of the territory to fortify,
+        or an edge list (sources, targets, units) of arrays of equal length
         """
         # find the index of the greatest value in the fortify action across both axes
-        src, dest = np.unravel_index(np.argmax(fortify_action), fortify_action.shape)
-        quantity = fortify_action[src, dest]
+        if isinstance(fortify_action, tuple):
+            sources, targets, units = fortify_action
+            if len(units) == 0:
+                return
+            best = np.argmax(units)
+            src, dest, quantity = sources[best], targets[best], units[best]
+        else:
+            src, dest = np.unravel_index(np.argmax(fortify_action), fortify_action.shape)
+            quantity = fortify_action[src, dest]
         if quantity == 0:
             return
 
@@ -291,25 +527,48 @@ class RiskEnv():
             raise ValueError("Cannot fortify to a territory you do not own")
             
         # check that the player is fortifying connected territories
-        if not self.is_link(player_id, self.adjacencies, src, dest):
+        if not self.is_link(player_id, None, src, dest):
             raise ValueError("Cannot fortify unconnected territories")
         
         fortify_quantity = min(quantity, self.game_state[src,1] - 1)
+        self.toggle_hash((src, dest))
         self.game_state[src,1] -= fortify_quantity
         self.game_state[dest,1] += fortify_quantity
+        self.toggle_hash((src, dest))
+        if self.fortify_log is not None:
+            self.fortify_log.append((src, dest, fortify_quantity))
              
     def is_link(self, player_id, adjacencies, src, dest):
         """
         Check if two territories are connected by a single player in the graph
 
         Parameters:
-        adjacencies: a T x T numpy array representing the adjacency matrix of the territories
+        adjacencies: a T x T numpy array representing the adjacency matrix of the territories,
+        or None for the board's own neighbor lists
         src: the index of the source territory
         dest: the index of the destination territory
 
         Returns:
         is_link: boolean indicating whether the territories are connected
         """
+        if src == dest:
+            return True
+        if adjacencies is not None and not self.board.is_adjacency_matrix(adjacencies):
+            return self._search_link(player_id, adjacencies, src, dest)
+        if self.game_state[dest,0] != player_id:
+            return False
+        components = self.get_components()
+        if self.game_state[src,0] == player_id:
+            return components[src] == components[dest]
+        # an unowned source reaches whatever its owned neighbors reach
+        neighbors = self.neighbors[src]
+        neighbors = neighbors[self.game_state[neighbors,0] == player_id]
+        return bool(np.any(components[neighbors] == components[dest]))
+
+    def _search_link(self, player_id, adjacencies, src, dest):
+        """
+        Depth first search version of is_link for an adjacency matrix other than the board's
+        """
         visited = np.zeros(len(adjacencies))
         stack = [src]
         while stack:
@@ -321,7 +580,172 @@ class RiskEnv():
                 neighbors = np.where(adjacencies[current] == 1)[0]
                 stack.extend([n for n in neighbors if self.game_state[n,0] == player_id])    
         return False
-    
+
+    def label_components(self):
+        """
+        Label every territory with the connected component of its owner's subgraph,
+        using a single sweep over the board. Assumes the adjacency matrix is symmetric.
+        """
+        owners = self.game_state[:,0]
+        components = np.full(len(owners), -1)
+        label = 0
+        for start in range(len(owners)):
+            if components[start] != -1:
+                continue
+            self._flood_component(components, start, label, owners[start], -1)
+            label += 1
+        self.components = components
+        self._next_component = label
+        self._labeled_owners = owners.copy()
+
+    def _flood_component(self, components, start, label, owner, unlabeled):
+        """
+        Assign label to every territory of owner reachable from start that currently has the
+        unlabeled value
+        """
+        components[start] = label
+        stack = [start]
+        while stack:
+            current = stack.pop()
+            for n in self.neighbors[current]:
+                if components[n] == unlabeled and self.game_state[n,0] == owner:
+                    components[n] = label
+                    stack.append(n)
+
+    def get_components(self):
+        """
+        Get the component labels, relabeling the whole board only if ownership was changed
+        outside of attack (e.g. by editing game_state directly)
+
+        Returns:
+        components: a numpy array of shape (T,) of component labels
+        """
+        if not np.array_equal(self._labeled_owners, self.game_state[:,0]):
+            self.label_components()
+            self.count_ownership()
+            self.rehash()
+        return self.components
+
+    def count_ownership(self):
+        """
+        Recount the territories owned by each player, in total and per continent
+        """
+        num_players = len(self.players)
+        owners = self.game_state[:,0]
+        self.territory_counts = np.bincount(owners, minlength=num_players)
+        self.continent_counts = np.zeros((len(self.continents), num_players), dtype=np.int64)
+        np.add.at(self.continent_counts, (self.territory_continent, owners), 1)
+        complete = self.continent_counts == self.continent_sizes[:,None]
+        self.continent_bonus = self.continent_bonuses @ complete
+
+    def change_owner(self, territory, player_id):
+        """
+        Give territory to player_id, updating the ownership counters and component labels
+        of both the old and the new owner
+
+        Parameters:
+        territory: the index of the territory
+        player_id: the id of the new owner
+        """
+        old_owner = self.game_state[territory,0]
+        continent = self.territory_continent[territory]
+        size = self.continent_sizes[continent]
+        if self.continent_counts[continent, old_owner] == size:
+            self.continent_bonus[old_owner] -= self.continent_bonuses[continent]
+        self.continent_counts[continent, old_owner] -= 1
+        self.continent_counts[continent, player_id] += 1
+        if self.continent_counts[continent, player_id] == size:
+            self.continent_bonus[player_id] += self.continent_bonuses[continent]
+        self.territory_counts[old_owner] -= 1
+        self.territory_counts[player_id] += 1
+        self.game_state[territory,0] = player_id
+        self.update_components(territory)
+
+    def territory_keys(self, territories):
+        """
+        Get the Zobrist keys of the current owner and units of some territories
+
+        Parameters:
+        territories: a numpy array of territory indices
+
+        Returns:
+        keys: a uint64 numpy array with one key per territory
+        """
+        territories = np.asarray(territories, dtype=np.int64)
+        owners, units = self.game_state[territories,0], self.game_state[territories,1]
+        capped = units < ZOBRIST_UNIT_CAP
+        keys = self.owner_keys[territories, owners] ^ self.unit_keys[territories, np.where(capped, units, 0)]
+        for i in np.nonzero(~capped)[0]:
+            keys[i] ^= np.uint64(mix64((int(self.unit_keys[territories[i], 0]) + int(units[i])) & MASK64))
+        return keys
+
+    def toggle_hash(self, territories):
+        """
+        XOR the keys of some territories into the board hash. Called once before and once
+        after the territories change, this swaps their old keys for the new ones.
+        """
+        if len(territories):
+            self.board_hash ^= int(np.bitwise_xor.reduce(self.territory_keys(territories)))
+
+    def rehash(self):
+        """
+        Recompute the board hash from scratch
+        """
+        self.board_hash = int(np.bitwise_xor.reduce(self.territory_keys(np.arange(len(self.game_state)))))
+
+    def position_hash(self):
+        """
+        Get the 64-bit Zobrist hash of (owners, units, current player)
+        """
+        self._check_counters()
+        return self.board_hash ^ int(self.player_keys[self.current_player_id])
+
+    def _check_counters(self):
+        """
+        In debug mode, verify the incremental ownership counters and board hash against a full recount
+        """
+        if not self.debug:
+            return
+        board_hash = self.board_hash
+        self.rehash()
+        if board_hash != self.board_hash:
+            raise RuntimeError(f"board_hash out of sync: {board_hash} != {self.board_hash}")
+        counters = (self.territory_counts.copy(), self.continent_counts.copy(), self.continent_bonus.copy())
+        self.count_ownership()
+        for name, kept, recounted in zip(("territory_counts", "continent_counts", "continent_bonus"), counters,
+                                         (self.territory_counts, self.continent_counts, self.continent_bonus)):
+            if not np.array_equal(kept, recounted):
+                raise RuntimeError(f"{name} out of sync: {kept} != {recounted}")
+
+    def update_components(self, territory):
+        """
+        Update the component labels after territory changed owner. The new owner's components
+        touching territory are merged, and only the old component of territory is relabeled.
+
+        Parameters:
+        territory: the index of the territory that changed owner
+        """
+        components = self.components
+        owner = self.game_state[territory,0]
+        old_label = components[territory]
+
+        # merge the conquered territory with the new owner's neighboring components
+        neighbors = self.neighbors[territory]
+        merged = components[neighbors[self.game_state[neighbors,0] == owner]]
+        new_label = self._next_component
+        self._next_component += 1
+        components[territory] = new_label
+        if len(merged):
+            components[np.isin(components, merged)] = new_label
+
+        # the old owner's component may have been split, relabel only that component
+        for start in np.nonzero(components == old_label)[0]:
+            if components[start] != old_label:
+                continue
+            self._flood_component(components, start, self._next_component, self.game_state[start,0], old_label)
+            self._next_component += 1
+        self._labeled_owners[territory] = owner
+
     def is_alive(self, player):
         """
         Check if a player is still alive
@@ -332,7 +756,8 @@ class RiskEnv():
         Returns:
         is_alive: boolean indicating whether the player is alive
         """
-        return np.any(self.game_state[:,0] == player)
+        self._check_counters()
+        return self.territory_counts[player] > 0
     
     def get_player_id(self, player):
         """
@@ -356,13 +781,11 @@ class RiskEnv():
         Returns:
         fortify_paths: a T x T numpy array representing the fortify paths
         """
-        fortify_paths = np.zeros((len(self.game_state), len(self.game_state)))
         # each entry should be the number of units on the source - 1
-        for i in range(len(self.game_state)):
-            if self.game_state[i,0] == player_id:
-                # only add the entry if the destination is owned and connected
-                for j in range(len(self.game_state)):
-                    if self.game_state[j,0] == player_id and self.is_link(player_id, self.adjacencies, i, j):
-                        fortify_paths[i,j] = self.game_state[i,1] - 1
+        # only add the entry if the destination is owned and connected
+        owned = self.game_state[:,0] == player_id
+        components = self.get_components()
+        linked = (components[:,None] == components[None,:]) & owned[:,None] & owned[None,:]
+        fortify_paths = np.where(linked, self.game_state[:,1,None] - 1, 0.0)
 
         return fortify_paths
\ No newline at end of file
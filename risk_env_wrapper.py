@@ -1,43 +1,180 @@
 import numpy as np
 import gymnasium as gym
 from gymnasium import spaces
-import networkx as nx
-import matplotlib.pyplot as plt
 import time
 
+from opponents import make_opponent
+
+def split_edge_action(action, T, num_edges):
+    """
+    Split a flat edge-indexed action into its heads
+
+    Parameters:
+    action: a flat array of size T + E + 3
+    T: the number of territories
+    num_edges: the number of directed edges E of the board
+
+    Returns:
+    reinforce: a (T,) reinforcement distribution
+    attack_fractions: a (E,) array, the fraction of the spare units of its source to attack along each edge with
+    fortify: (src, dest, fraction) territory indices and the fraction of the spare units of src to move
+    """
+    reinforce = action[:T]
+    attack_fractions = action[T:T + num_edges]
+    src, dest = np.minimum((action[T + num_edges:T + num_edges + 2] * T).astype(np.int64), T - 1)
+    return reinforce, attack_fractions, (src, dest, action[T + num_edges + 2])
+
 class RiskEnvWrapper(gym.Env): 
-    def __init__(self, risk_env, visualize=False, max_episode_steps = 50): 
+    def __init__(self, risk_env, visualize=False, max_episode_steps = 50, action_mask=False, compact_obs=False, edge_actions=False, profiler=None, recorder=None, opponents=None): 
+        """
+        Parameters:
+        risk_env: the RiskEnv to play
+        visualize: print the game state before every step
+        max_episode_steps: number of steps after which an episode is truncated
+        action_mask: add the flat mask of legal action slots to the observation
+        compact_obs: observe narrow per-territory fields only (see _get_compact_obs). The static
+        board structure is then available once through board_structure() instead of every step
+        edge_actions: use the edge-indexed action space of size T + E + 3 (see split_edge_action)
+        instead of the dense T + 2T^2 one
+        profiler: a StepProfiler that times the filter, reinforce, attack, fortify, opponents and observe phases
+        of every step, the timings of the step are also returned as info['profile']. None disables it
+        recorder: a trajectory.TrajectoryRecorder that every game played is appended to, None disables it
+        opponents: None for one agent moving every player, or a list with one entry per seat: None for a
+        seat of the agent, or an opponent (see opponents.make_opponent) whose turns are played inside
+        reset and step. The reward of a step is then that of the seat that moved, taken after the
+        opponents replied, and max_episode_steps counts the agent's turns only
+        """
         super(RiskEnvWrapper, self).__init__()
         self.risk_env = risk_env
+        self.action_mask = action_mask
+        self.compact_obs = compact_obs
+        self.edge_actions = edge_actions
         self.T = risk_env.game_state.shape[0]
         self.visualize = visualize
         self.max_episode_steps = max_episode_steps
         self.current_step = 0
+        self.profiler = profiler
+        self.recorder = recorder
+        if recorder is not None:
+            risk_env.battle_log, risk_env.fortify_log = [], []
+        self.opponents = None
+        if opponents is not None:
+            if len(opponents) != len(risk_env.players):
+                raise ValueError("opponents needs one entry per player")
+            self.opponents = [None if spec is None else make_opponent(spec) for spec in opponents]
+            if None not in self.opponents:
+                raise ValueError("At least one seat must be left to the agent")
 
         # self.action_space = spaces.Dict({
         #     'reinforce': spaces.Box(low=0, high=1, shape=(self.T,), dtype=np.float32),
         #     'attack_units': spaces.Box(low=0, high=self.T, shape=(self.T,self.T), dtype=np.int32),
         #     'fortify_units': spaces.Box(low=0, high=self.T, shape=(self.T,self.T), dtype=np.int32)
         # })
-        self.action_space = spaces.Box( low=0, high=1, shape=(self.T + self.T * self.T + self.T * self.T,), dtype=np.float32 )
-        self.observation_space = spaces.Dict({
-            'owners': spaces.Box(low=0, high=len(self.risk_env.players), shape=(self.T,), dtype=np.int32),
-            'units': spaces.Box(low=0, high=100, shape=(self.T,), dtype=np.int32),
-            'reinforcement_max': spaces.Box(low=0, high=50, shape=(1,), dtype=np.int32),
-            'adjacencies': spaces.Box(low=0, high=1, shape=(self.T,self.T), dtype=np.int32),
-            'fortify_paths': spaces.Box(low=0, high=np.inf, shape=(self.T,self.T), dtype=np.int32)
-        })
+        self.E = risk_env.board.num_edges
+        if self.edge_actions:
+            self.action_space = spaces.Box(low=0, high=1, shape=(self.T + self.E + 3,), dtype=np.float32)
+        else:
+            self.action_space = spaces.Box( low=0, high=1, shape=(self.T + self.T * self.T + self.T * self.T,), dtype=np.float32 )
+        if self.compact_obs:
+            if len(self.risk_env.players) > np.iinfo(np.int8).max or self.T > np.iinfo(np.int16).max:
+                raise ValueError("Board is too large for the compact observation dtypes")
+            self.observation_space = spaces.Dict({
+                'owners': spaces.Box(low=0, high=len(self.risk_env.players) - 1, shape=(self.T,), dtype=np.int8),
+                'units': spaces.Box(low=0, high=np.iinfo(np.int16).max, shape=(self.T,), dtype=np.int16),
+                'reinforcement_max': spaces.Box(low=0, high=np.iinfo(np.int16).max, shape=(1,), dtype=np.int16),
+                'current_player': spaces.Box(low=0, high=len(self.risk_env.players) - 1, shape=(1,), dtype=np.int8),
+                'components': spaces.Box(low=0, high=self.T - 1, shape=(self.T,), dtype=np.int16)
+            })
+        else:
+            self.observation_space = spaces.Dict({
+                'owners': spaces.Box(low=0, high=len(self.risk_env.players), shape=(self.T,), dtype=np.int32),
+                'units': spaces.Box(low=0, high=100, shape=(self.T,), dtype=np.int32),
+                'reinforcement_max': spaces.Box(low=0, high=50, shape=(1,), dtype=np.int32),
+                'adjacencies': spaces.Box(low=0, high=1, shape=(self.T,self.T), dtype=np.int32),
+                'fortify_paths': spaces.Box(low=0, high=np.inf, shape=(self.T,self.T), dtype=np.int32)
+            })
+        if self.action_mask:
+            # legal slots of the flat action vector (reinforce, attack, fortify)
+            self.observation_space['action_mask'] = spaces.Box(low=0, high=1, shape=(self.action_space.shape[0],), dtype=np.int8)
 
     def reset(self, seed=None, options=None):
         super().reset(seed=seed)
-        self.risk_env.reset()
+        self.risk_env.reset(seed=seed)
         self.current_step = 0
+        if self.recorder is not None:
+            self.recorder.start_game(self.risk_env)
+        if self.opponents is not None:
+            for opponent in self.opponents:
+                if opponent is not None:
+                    opponent.reset(self)
+            self.play_opponents()
         return self._get_obs(), {}
+
+    def close(self):
+        if self.recorder is not None:
+            self.recorder.close()
+
+    def snapshot(self):
+        """
+        Copy the mutable state of the episode, see RiskEnv.snapshot
+        """
+        return {'risk_env': self.risk_env.snapshot(), 'current_step': self.current_step}
+
+    def restore(self, snapshot):
+        """
+        Return the episode to a state taken by snapshot, see RiskEnv.restore
+        """
+        self.risk_env.restore(snapshot['risk_env'])
+        self.current_step = snapshot['current_step']
     
     def step(self, action):
-        num_initial_territories = np.sum(self.risk_env.game_state[:,0] == self.risk_env.current_player_id)
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.begin()
+        player_id = self.risk_env.current_player_id
+        num_initial_territories = self.risk_env.territory_counts[self.risk_env.current_player_id]
         if self.visualize:
             self.print_game_state()
+        reinforce_action, attack_units, fortify_units = self.decode_action(action)
+        if profiler is not None:
+            profiler.lap('filter')
+        done = self.play_turn(reinforce_action, attack_units, fortify_units, profiler)
+
+        self.current_step += 1
+        if not done and self.current_step >= self.max_episode_steps:
+            done = True
+
+        if self.opponents is None:
+            num_final_territories = self.risk_env.territory_counts[self.risk_env.current_player_id]
+            took_territory = num_final_territories > num_initial_territories
+            obs, reward = self._get_obs(), self.calculate_reward(took_territory)
+            if self.recorder is not None:
+                self.recorder.record_step(self.risk_env, player_id, reinforce_action, reward, done)
+        else:
+            took_territory = self.risk_env.territory_counts[player_id] > num_initial_territories
+            if self.recorder is not None:
+                # the row of the agent's turn precedes the opponents', so it gets the reward before they replied
+                self.recorder.record_step(self.risk_env, player_id, reinforce_action,
+                                          self.calculate_reward(took_territory, player_id), done)
+            if not done:
+                done = self.play_opponents()
+                if profiler is not None:
+                    profiler.lap('opponents')
+            obs, reward = self._get_obs(), self.calculate_reward(took_territory, player_id)
+        if profiler is None:
+            return obs, reward, done, False, {}
+        profiler.lap('observe')
+        return obs, reward, done, False, {'profile': dict(profiler.last)}
+
+    def decode_action(self, action):
+        """
+        Turn a flat action of the action space into the legal turn of the player to move
+
+        Returns:
+        reinforce_action, attack_action, fortify_action: the arguments of RiskEnv.reinforce, attack and fortify
+        """
+        if self.edge_actions:
+            return self.filter_edge_actions(*split_edge_action(action, self.T, self.E))
         # reinforce_action = action['reinforce']
         # attack_units = action['attack_units']
         # fortify_units = action['fortify_units']
@@ -51,29 +188,52 @@ class RiskEnvWrapper(gym.Env):
         # Do the same for attack_units and fortify_units
             
         # reinforce_action, attack_units, fortify_units = self.filter_actions(reinforce_action, attack_units, fortify_units)
-        reinforce_action, attack_units, fortify_units = self.filter_actions(reinforce_action, attack_units, fortify_units)
+        return self.filter_actions(reinforce_action, attack_units, fortify_units)
+
+    def play_turn(self, reinforce_action, attack_action, fortify_action, profiler=None):
+        """
+        Play a decoded turn of the player to move and pass the turn to the next player
 
+        Returns:
+        done: whether the turn won the game
+        """
         self.risk_env.reinforce(self.risk_env.current_player_id, reinforce_action)
+        if profiler is not None:
+            profiler.lap('reinforce')
         # self.print_game_state()
         # print(attack_units)
-        self.risk_env.winner = self.risk_env.attack(self.risk_env.current_player_id, attack_units)
+        self.risk_env.winner = self.risk_env.attack(self.risk_env.current_player_id, attack_action)
+        if profiler is not None:
+            profiler.lap('attack')
         # print(fortify_units)
-        self.risk_env.fortify(self.risk_env.current_player_id, fortify_units)
-        
+        self.risk_env.fortify(self.risk_env.current_player_id, fortify_action)
+        if profiler is not None:
+            profiler.lap('fortify')
 
         # next player
         self.risk_env.current_player_id = (self.risk_env.current_player_id + 1) % len(self.risk_env.players)
+        return self.risk_env.check_winner()[0]
 
-        self.current_step += 1
-        done = self.risk_env.check_winner()[0]
-        if not done and self.current_step >= self.max_episode_steps:
-            done = True
+    def play_opponents(self):
+        """
+        Play the turns of opponent seats until a seat of the agent is to move or the game is won
 
-        num_final_territories = np.sum(self.risk_env.game_state[:,0] == self.risk_env.current_player_id)
-        took_territory = num_final_territories > num_initial_territories
-        return self._get_obs(), self.calculate_reward(took_territory), done, False, {}
+        Returns:
+        done: whether the game was won
+        """
+        while self.opponents[self.risk_env.current_player_id] is not None:
+            player_id = self.risk_env.current_player_id
+            reinforce_action, attack_action, fortify_action = self.opponents[player_id].act(self)
+            done = self.play_turn(reinforce_action, attack_action, fortify_action)
+            if self.recorder is not None:
+                self.recorder.record_step(self.risk_env, player_id, reinforce_action, 0.0, done)
+            if done:
+                return True
+        return False
     
     def _get_obs(self):
+        if self.compact_obs:
+            return self._get_compact_obs()
         obs = {
             'owners': self.risk_env.game_state[:,0],
             'units': self.risk_env.game_state[:,1],
@@ -98,82 +258,167 @@ class RiskEnvWrapper(gym.Env):
         if len(obs['units'].shape) == 0:
             obs['units'] = np.array([obs['units']], dtype=np.float32)
 
+        if self.action_mask:
+            obs['action_mask'] = self.flat_action_mask()
+
         return obs
     
-    def filter_actions(self, reinforce_action, attack_units, fortify_units):
-        # cannot reinforce, attack, or fortify on rows that are not owned
-        reinforce_action = reinforce_action * (self.risk_env.game_state[:,0] == self.risk_env.current_player_id) 
+    def _get_compact_obs(self):
+        """
+        Observation with O(T) narrow fields instead of the T x T adjacency and fortify paths.
+        fortify_paths[i, j] of the full observation is units[i] - 1 exactly when i and j are both
+        owned by current_player and share a component, so nothing the policy could see is lost.
+        Components are identified by their lowest territory index, so ids are stable and below T.
+        """
+        owners, units = self.risk_env.game_state[:,0], self.risk_env.game_state[:,1]
+        labels = self.risk_env.get_components()
+        first = np.full(labels.max() + 1, self.T)
+        np.minimum.at(first, labels, np.arange(self.T))
+        obs = {
+            'owners': owners.astype(np.int8),
+            'units': np.minimum(units, np.iinfo(np.int16).max).astype(np.int16),
+            'reinforcement_max': np.array([self.risk_env.get_reinforcements(self.risk_env.current_player_id)], dtype=np.int16),
+            'current_player': np.array([self.risk_env.current_player_id], dtype=np.int8),
+            'components': first[labels].astype(np.int16)
+        }
+        if self.action_mask:
+            obs['action_mask'] = self.flat_action_mask()
+        return obs
+
+    def board_structure(self):
+        """
+        Get the static board structure that compact observations leave out
+
+        Returns:
+        a dictionary with the directed edge list ('edge_sources', 'edge_targets') and the
+        continent index of every territory ('territory_continent')
+        """
+        return {
+            'edge_sources': self.risk_env.board.edge_sources,
+            'edge_targets': self.risk_env.board.edge_targets,
+            'territory_continent': self.risk_env.territory_continent
+        }
+
+    def legal_action_masks(self):
+        """
+        Get boolean masks of the legal actions for the current player
+
+        Returns:
+        reinforce_mask: a (T,) mask of owned territories
+        attack_mask: a T x T mask of edges from an owned territory with at least 2 units to an adjacent enemy territory
+        fortify_mask: a T x T mask of edges from an owned territory with at least 2 units to an adjacent, connected owned territory
+        """
+        owned = self.risk_env.game_state[:, 0] == self.risk_env.current_player_id
+        components = self.risk_env.get_components()
+        movable = (self.risk_env.adjacencies == 1) & (owned & (self.risk_env.game_state[:, 1] >= 2))[:, None]
+        attack_mask = movable & ~owned[None, :]
+        fortify_mask = movable & owned[None, :] & (components[:, None] == components[None, :])
+        return owned, attack_mask, fortify_mask
+
+    def legal_edge_masks(self):
+        """
+        Get boolean masks of the legal edge-indexed actions for the current player
+
+        Returns:
+        reinforce_mask: a (T,) mask of owned territories
+        attack_mask: a (E,) mask of edges from an owned territory with at least 2 units to an enemy territory
+        """
+        owned = self.risk_env.game_state[:, 0] == self.risk_env.current_player_id
+        sources, targets = self.risk_env.board.edge_sources, self.risk_env.board.edge_targets
+        attack_mask = owned[sources] & ~owned[targets] & (self.risk_env.game_state[sources, 1] >= 2)
+        return owned, attack_mask
+
+    def flat_action_mask(self):
+        """
+        Get the int8 mask of the legal slots of the flat action vector. The three slots
+        of the fortify head of edge actions are always marked legal.
+        """
+        if self.edge_actions:
+            return np.concatenate(self.legal_edge_masks() + (np.ones(3, dtype=bool),)).astype(np.int8)
+        return np.concatenate([mask.ravel() for mask in self.legal_action_masks()]).astype(np.int8)
+
+    def filter_reinforce(self, reinforce_action, reinforce_mask):
+        """
+        Turn a reinforcement distribution into a number of units per owned territory
+        """
+        reinforce_action = reinforce_action * reinforce_mask
         reinforce_action = reinforce_action / np.where(np.sum(reinforce_action) > 0, np.sum(reinforce_action), 1) 
         reinforce_action = np.nan_to_num(reinforce_action) 
-        reinforce_action = (reinforce_action * (self.risk_env.get_reinforcements(self.risk_env.current_player_id))).astype(np.int32)
+        return (reinforce_action * (self.risk_env.get_reinforcements(self.risk_env.current_player_id))).astype(np.int32)
+
+    def filter_edge_actions(self, reinforce_action, attack_fractions, fortify):
+        """
+        Restrict an edge-indexed action to legal moves
+
+        Parameters:
+        reinforce_action: a (T,) reinforcement distribution
+        attack_fractions: a (E,) array of fractions of the spare units of each edge source
+        fortify: (src, dest, fraction) as returned by split_edge_action
+
+        Returns:
+        reinforce_action: a (T,) array of units
+        attack_action, fortify_action: edge lists (sources, targets, units) for RiskEnv.attack and RiskEnv.fortify
+        """
+        reinforce_mask, attack_mask = self.legal_edge_masks()
+        reinforce_action = self.filter_reinforce(reinforce_action, reinforce_mask)
+        units = self.risk_env.game_state[:, 1]
+        spare = np.maximum(units - 1, 0)
+        sources, targets = self.risk_env.board.edge_sources, self.risk_env.board.edge_targets
+
+        # every source spends at most its spare units over all of its attacks
+        attack_fractions = attack_fractions * attack_mask
+        total = np.bincount(sources, weights=attack_fractions, minlength=self.T)
+        attack_fractions = attack_fractions / np.maximum(total, 1)[sources]
+        attack_units = (attack_fractions * spare[sources]).astype(np.int32)
+        attacking = attack_units > 0
+        attack_action = (sources[attacking], targets[attacking], attack_units[attacking])
+
+        src, dest, fraction = fortify
+        quantity = int(fraction * spare[src])
+        owners = self.risk_env.game_state[:, 0]
+        components = self.risk_env.get_components()
+        if (quantity > 0 and src != dest and owners[src] == self.risk_env.current_player_id
+                and owners[dest] == owners[src] and components[src] == components[dest]):
+            fortify_action = (np.array([src]), np.array([dest]), np.array([quantity]))
+        else:
+            fortify_action = (np.array([], dtype=np.int64),) * 3
+        return reinforce_action, attack_action, fortify_action
+
+    def filter_actions(self, reinforce_action, attack_units, fortify_units):
+        # cannot reinforce, attack, or fortify on rows that are not owned
+        reinforce_mask, attack_mask, fortify_mask = self.legal_action_masks()
+        reinforce_action = self.filter_reinforce(reinforce_action, reinforce_mask)
         # also cannot attack or fortify from rows that have under 2 units
         # also cannot attack TO columns that are owned, or fortify TO columns that aren't owned
+        attack_units = attack_units * attack_mask
+        fortify_units = fortify_units * fortify_mask
 
-        # set all values >= 0
-        # reinforce_action = np.maximum(reinforce_action, 0)
-        # attack_units = np.maximum(attack_units, 0)
-        # fortify_units = np.maximum(fortify_units, 0)
-
-        # for i in range(self.T): 
-        #     for j in range(self.T): 
-        #         if self.risk_env.adjacencies[i,j] == 0 or self.risk_env.game_state[i,1] < 2: 
-        #             attack_units[i,j] = 0 
-        #             fortify_units[i,j] = 0 
-        #         elif self.risk_env.game_state[i,0] != self.risk_env.current_player_id: 
-        #             attack_units[i,j] = 0 
-        #             fortify_units[i,j] = 0
-        #         elif self.risk_env.game_state[j,0] == self.risk_env.current_player_id:
-        #             attack_units[i,j] = 0
-        #         if self.risk_env.game_state[j,0] != self.risk_env.current_player_id or not self.risk_env.is_link(self.risk_env.current_player_id, self.risk_env.adjacencies, i, j): 
-        #             fortify_units[i,j] = 0 
-        for i in range(self.T): 
-            for j in range(self.T): 
-                if self.risk_env.adjacencies[i, j] == 0 or self.risk_env.game_state[i, 1] < 2: 
-                    attack_units[i, j] = 0
-                    fortify_units[i, j] = 0 
-                if self.risk_env.game_state[i, 0] != self.risk_env.current_player_id or self.risk_env.game_state[j, 0] == self.risk_env.current_player_id: 
-                    attack_units[i, j] = 0 
-                if (self.risk_env.game_state[i, 0] != self.risk_env.current_player_id 
-                    or self.risk_env.game_state[j, 0] != self.risk_env.current_player_id
-                    or not self.risk_env.is_link(self.risk_env.current_player_id, self.risk_env.adjacencies, i, j)):
-                    fortify_units[i, j] = 0
-
-        # print('attack_units: ', attack_units)
-    
-        # for i in range(self.T): 
-        #     attack_units[i] = np.minimum(attack_units[i], self.risk_env.game_state[i,1] - 1) 
-        #     if np.sum(attack_units[i]) > self.risk_env.game_state[i,1] - 1: 
-        #         attack_units[i] = (attack_units[i] / np.sum(attack_units[i]) * (self.risk_env.game_state[i,1] - 1)).astype(np.int32) 
-        #         fortify_units[i] = np.minimum(fortify_units[i], self.risk_env.game_state[i,1] - 1) 
-        #         if np.sum(fortify_units[i]) > self.risk_env.game_state[i,1] - 1: 
-        #             fortify_units[i] = (fortify_units[i] / np.sum(fortify_units[i]) * (self.risk_env.game_state[i,1] - 1)).astype(np.int32) 
-        for i in range(self.T):
-            # For attacks, cannot use more than (current units - 1)
-            max_units_available = self.risk_env.game_state[i, 1] - 1
-            if max_units_available < 0:
-                max_units_available = 0
-            if np.sum(attack_units[i]) > max_units_available:
-                total = np.sum(attack_units[i])
-                if total > 0:
-                    attack_units[i] = (attack_units[i] / total * max_units_available).astype(np.int32)
-
-            # Similarly for fortify, cannot move more units than (current units - 1)
-            if np.sum(fortify_units[i]) > max_units_available:
-                total = np.sum(fortify_units[i])
-                if total > 0:
-                    fortify_units[i] = (fortify_units[i] / total * max_units_available).astype(np.int32)
-
-        #print('attack_units: ', sum(attack_units))
+        # rows that ask for more than (current units - 1) are scaled down to that budget
+        max_units_available = np.maximum(self.risk_env.game_state[:, 1] - 1, 0)[:, None]
+        attack_units = self._rescale_rows(attack_units, max_units_available)
+        fortify_units = self._rescale_rows(fortify_units, max_units_available)
         return reinforce_action, attack_units, fortify_units
+
+    def _rescale_rows(self, units, max_units_available):
+        total = np.sum(units, axis=1, keepdims=True)
+        scaled = (units / np.where(total > 0, total, 1) * max_units_available).astype(np.int32)
+        return np.where(total > max_units_available, scaled, units).astype(np.int32)
     
-    def calculate_reward(self, took_territory):
-        current_player_id = self.risk_env.current_player_id
-        reward = np.sum(self.risk_env.game_state[:,0] == current_player_id) / self.T
+    def calculate_reward(self, took_territory, player_id=None):
+        """
+        player_id: the player rewarded, by default the player to move. The win bonus then only goes
+        to player_id if it won
+        """
+        if player_id is None:
+            player_id, won = self.risk_env.current_player_id, self.risk_env.winner
+        else:
+            won = self.risk_env.check_winner()[1] == player_id
+        reward = self.risk_env.territory_counts[player_id] / self.T
         if took_territory:
             reward += 0.1
         else:
             reward -= 0.5
-        if self.risk_env.winner:
+        if won:
             reward += 1.0
         return reward
 
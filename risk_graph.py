@@ -2,11 +2,11 @@
 Builds a graph of a risk gameboard given a JSON file
 """
 
-import json
 import numpy as np
 import matplotlib.pyplot as plt
 import networkx as nx
-from networkx.drawing.nx_agraph import graphviz_layout
+
+from board_cache import load_board
 
 class Graph():
     """
@@ -17,31 +17,23 @@ class Graph():
         """
         constructor
         """
-        self.board = json.load(open(board))
+        self.board = load_board(board)
         self.graph = nx.Graph()
         self.plt, self.ax = plt.subplots()
-        self.territories = np.zeros((len(self.board["Territories"]), 2))
+        self.territories = np.zeros((self.board.num_territories, 2))
         self.territories[:,1] = 1 # set all territories to have 1 unit
 
-        idx = 0
-        territory_dict = {}
-        continent_dict = {}
-        for continent,contents in self.board['Continents'].items():
-            continent_dict[continent] = (idx, idx + len(contents['territories']), contents['bonus'])
-            for territory in contents['territories']:
-                territory_dict[territory] = idx
-                idx += 1
-                pos = self.board['Territories'][territory].get('position', (np.random.rand(), np.random.rand())) 
-                self.graph.add_node(territory, position=pos)
-        adjacencies = np.zeros((idx, idx))
-        for territory, contents in self.board['Territories'].items():
-            for neighbor in contents['neighbors']:
-                adjacencies[territory_dict[territory], territory_dict[neighbor]] = 1
-                self.graph.add_edge(territory, neighbor)
+        names = list(self.board.territories)
+        for idx, territory in enumerate(names):
+            pos = self.board.positions.get(idx, (np.random.rand(), np.random.rand()))
+            self.graph.add_node(territory, position=pos)
+        for idx, territory in enumerate(names):
+            for neighbor in self.board.neighbors(idx):
+                self.graph.add_edge(territory, names[neighbor])
 
-        self.adjacencies = adjacencies
-        self.continents = continent_dict
-        self.territory_ids = territory_dict
+        self.adjacencies = self.board.adjacencies
+        self.continents = self.board.continents
+        self.territory_ids = self.board.territories
         self.pos = nx.spring_layout(self.graph)
 
     def get_territory_by_id(self, territory_id):
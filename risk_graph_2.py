@@ -1,5 +1,11 @@
 import networkx as nx
+import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+
+PLAYER_COLORS = ['red', 'blue', 'green', 'yellow', 'purple', 'orange']
 
 def visualize_game_state(env, title="Risk Game State"):
     """
@@ -18,8 +24,7 @@ def visualize_game_state(env, title="Risk Game State"):
     idx_to_name = {v: k for k, v in territories.items()}
 
     # Assign colors based on owner
-    player_colors = ['red', 'blue', 'green', 'yellow', 'purple', 'orange']
-    node_colors = [player_colors[owner % len(player_colors)] for owner in owners]
+    node_colors = [PLAYER_COLORS[owner % len(PLAYER_COLORS)] for owner in owners]
 
     # Labels with territory name and unit count
     node_labels = {i: f"{idx_to_name[i]}\nUnits: {units[i]}" for i in range(len(owners))}
@@ -32,4 +37,122 @@ def visualize_game_state(env, title="Risk Game State"):
 
     plt.title(title)
     plt.axis('off')
-    plt.show()
\ No newline at end of file
+    plt.show()
+
+class GameRenderer():
+    """
+    Persistent renderer of a RiskEnvWrapper game. The figure, the edges, the nodes and the labels
+    are created once, and update() only changes the node colors and the unit labels that changed.
+    """
+    def __init__(self, env, headless=False, figsize=(15, 10), dpi=100, node_size=1200, font_size=8):
+        """
+        Parameters:
+        env: the RiskEnvWrapper to draw
+        headless: draw on an Agg canvas without pyplot, so no display or interactive backend is needed
+        figsize, dpi: size of the figure
+        node_size, font_size: size of the territory markers and labels
+        """
+        self.env = env
+        self.headless = headless
+        risk_env = env.risk_env
+        T = len(risk_env.game_state)
+        positions = dict(risk_env.positions)
+        if len(positions) < T:
+            # territories without coordinates are placed around the ones that have them
+            graph = nx.Graph(list(zip(risk_env.board.edge_sources.tolist(), risk_env.board.edge_targets.tolist())))
+            graph.add_nodes_from(range(T))
+            positions = nx.spring_layout(graph, pos=positions or None, fixed=list(positions) or None, seed=0)
+        xy = np.array([positions[i] for i in range(T)], dtype=float)
+        names = {index: name for name, index in risk_env.territories.items()}
+
+        if headless:
+            self.figure = Figure(figsize=figsize, dpi=dpi)
+            FigureCanvasAgg(self.figure)
+        else:
+            self.figure = plt.figure(figsize=figsize, dpi=dpi)
+        self.ax = self.figure.add_subplot()
+        self.ax.axis('off')
+        sources, targets = risk_env.board.edge_sources, risk_env.board.edge_targets
+        undirected = sources < targets
+        self.ax.add_collection(LineCollection(np.stack((xy[sources[undirected]], xy[targets[undirected]]), axis=1),
+                                              colors='black', alpha=0.7, zorder=1))
+        self.nodes = self.ax.scatter(xy[:, 0], xy[:, 1], s=node_size, zorder=2)
+        self.names = [names[i] for i in range(T)]
+        self.labels = [self.ax.text(x, y, "", ha='center', va='center', fontsize=font_size, color='white', zorder=3)
+                       for x, y in xy]
+        self.title = self.ax.set_title("")
+        self.ax.autoscale_view()
+        self.ax.margins(0.05)
+        self.owners = None
+        self.units = np.full(T, -1)
+        self.update()
+
+    def update(self, title="Risk Game State"):
+        """
+        Redraw the current state of the env
+        """
+        owners, units = self.env.risk_env.game_state[:, 0], self.env.risk_env.game_state[:, 1]
+        if self.owners is None or not np.array_equal(owners, self.owners):
+            self.nodes.set_facecolor([PLAYER_COLORS[owner % len(PLAYER_COLORS)] for owner in owners])
+            self.owners = owners.copy()
+        for i in np.nonzero(units != self.units)[0]:
+            self.labels[i].set_text(f"{self.names[i]}\nUnits: {units[i]}")
+        self.units = units.copy()
+        self.title.set_text(title)
+        if self.headless:
+            self.figure.canvas.draw()
+        else:
+            self.figure.canvas.draw_idle()
+            self.figure.canvas.flush_events()
+
+    def frame(self):
+        """
+        Get the current image as a H x W x 3 uint8 numpy array
+        """
+        self.figure.canvas.draw()
+        return np.asarray(self.figure.canvas.buffer_rgba())[:, :, :3].copy()
+
+    def close(self):
+        if not self.headless:
+            plt.close(self.figure)
+
+def record_game(env, act, path, max_steps=100, fps=2, seed=None, **renderer_kwargs):
+    """
+    Play a game headlessly and write one frame per step to a video
+
+    Parameters:
+    env: a RiskEnvWrapper
+    act: a function from observation to action
+    path: the output file, .gif (Pillow) or .mp4 (needs ffmpeg)
+    max_steps: the most steps to play
+    fps: frames per second of the video
+    seed: seed of env.reset
+
+    Returns:
+    frames: the number of frames written
+    """
+    from matplotlib import animation
+    if path.endswith(".gif"):
+        writer = animation.PillowWriter(fps=fps)
+    elif path.endswith(".mp4"):
+        if not animation.FFMpegWriter.isAvailable():
+            raise ValueError("Writing .mp4 needs ffmpeg, write a .gif instead")
+        writer = animation.FFMpegWriter(fps=fps)
+    else:
+        raise ValueError("The video path must end with .gif or .mp4")
+
+    obs, _ = env.reset(seed=seed)
+    renderer = GameRenderer(env, headless=True, **renderer_kwargs)
+    renderer.update("Initial Game State")
+    frames = 1
+    with writer.saving(renderer.figure, path, renderer.figure.dpi):
+        writer.grab_frame()
+        for step in range(1, max_steps + 1):
+            obs, reward, done, _, _ = env.step(act(obs))
+            renderer.update(f"Step {step}, Reward: {reward:.2f}")
+            writer.grab_frame()
+            frames += 1
+            if done:
+                break
+    renderer.close()
+    return frames
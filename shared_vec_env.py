@@ -0,0 +1,227 @@
+"""
+Multi-process vectorized environment that returns observations through shared memory
+"""
+
+import copy
+from multiprocessing import shared_memory
+import numpy as np
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper, VecEnv
+from worker_pool import get_context, HEADLESS_MODULES
+
+VEC_BACKENDS = ("dummy", "subproc", "shm")
+
+class SeededEnvFn():
+    """
+    Picklable env constructor that seeds the env's own random generator and the global
+    numpy RNG of the process it runs in, so that every worker rolls its own dice
+    """
+    def __init__(self, env, seed):
+        self.env = env
+        self.seed = seed
+
+    def __call__(self):
+        np.random.seed(self.seed)
+        self.env.risk_env.seed(self.seed)
+        return self.env
+
+def _map_buffers(blocks, layout, num_envs):
+    """
+    Map the shared observation blocks into numpy arrays of shape (num_envs, *shape)
+    """
+    return {key: np.ndarray((num_envs, *shape), dtype=dtype, buffer=blocks[key].buf)
+            for key, (shape, dtype) in layout.items()}
+
+def _obs_layout(obs):
+    return {key: (np.shape(value), np.asarray(value).dtype) for key, value in obs.items()}
+
+def _worker(remote, parent_remote, env_fn_wrapper, rank):
+    parent_remote.close()
+    env = env_fn_wrapper.var()
+    blocks, buffers = {}, {}
+
+    def write(obs):
+        for key, buffer in buffers.items():
+            buffer[rank] = obs[key]
+
+    while True:
+        try:
+            cmd, data = remote.recv()
+            if cmd == "step":
+                observation, reward, terminated, truncated, info = env.step(data)
+                done = terminated or truncated
+                info["TimeLimit.truncated"] = truncated and not terminated
+                reset_info = {}
+                if done:
+                    info["terminal_observation"] = observation
+                    observation, reset_info = env.reset()
+                write(observation)
+                remote.send((reward, done, info, reset_info))
+            elif cmd == "reset":
+                maybe_options = {"options": data[1]} if data[1] else {}
+                observation, reset_info = env.reset(seed=data[0], **maybe_options)
+                write(observation)
+                remote.send(reset_info)
+            elif cmd == "get_layout":
+                observation, _ = env.reset()
+                remote.send((env.observation_space, env.action_space, _obs_layout(observation)))
+            elif cmd == "attach":
+                blocks = {key: shared_memory.SharedMemory(name=name) for key, name in data[0].items()}
+                buffers = _map_buffers(blocks, data[1], data[2])
+                remote.send(None)
+            elif cmd == "close":
+                env.close()
+                buffers = {}
+                for block in blocks.values():
+                    block.close()
+                remote.close()
+                break
+            elif cmd == "env_method":
+                method = env.get_wrapper_attr(data[0])
+                remote.send(method(*data[1], **data[2]))
+            elif cmd == "get_attr":
+                remote.send(env.get_wrapper_attr(data))
+            elif cmd == "set_attr":
+                remote.send(setattr(env, data[0], data[1]))
+            elif cmd == "is_wrapped":
+                from stable_baselines3.common.env_util import is_wrapped
+                remote.send(is_wrapped(env, data))
+            else:
+                raise NotImplementedError(f"`{cmd}` is not implemented in the worker")
+        except (EOFError, KeyboardInterrupt):
+            break
+
+class SharedMemoryVecEnv(VecEnv):
+    """
+    Runs every environment in its own process like SubprocVecEnv, but workers write their
+    observations into one shared memory block per observation key instead of pickling them
+    through the pipe. Only rewards, dones and infos travel through the pipe.
+    """
+    def __init__(self, env_fns, start_method=None):
+        """
+        Parameters:
+        env_fns: a list of functions that build the environments, called inside the workers
+        start_method: multiprocessing start method, defaults to forkserver where available
+        """
+        self.waiting = False
+        self.closed = False
+        num_envs = len(env_fns)
+        # the workers run this module, which imports stable_baselines3, so the forkserver imports it once for all
+        ctx = get_context(start_method, HEADLESS_MODULES + ("shared_vec_env",))
+
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(num_envs)])
+        self.processes = []
+        for rank, (work_remote, remote, env_fn) in enumerate(zip(self.work_remotes, self.remotes, env_fns)):
+            process = ctx.Process(target=_worker, args=(work_remote, remote, CloudpickleWrapper(env_fn), rank), daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        self.remotes[0].send(("get_layout", None))
+        observation_space, action_space, layout = self.remotes[0].recv()
+        self.blocks = {}
+        for key, (shape, dtype) in layout.items():
+            size = max(num_envs * int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+            self.blocks[key] = shared_memory.SharedMemory(create=True, size=size)
+        names = {key: block.name for key, block in self.blocks.items()}
+        self.buffers = _map_buffers(self.blocks, layout, num_envs)
+        for remote in self.remotes:
+            remote.send(("attach", (names, layout, num_envs)))
+        for remote in self.remotes:
+            remote.recv()
+
+        super().__init__(num_envs, observation_space, action_space)
+
+    def _get_obs(self):
+        return {key: buffer.copy() for key, buffer in self.buffers.items()}
+
+    def step_async(self, actions):
+        for remote, action in zip(self.remotes, actions):
+            remote.send(("step", action))
+        self.waiting = True
+
+    def step_wait(self):
+        results = [remote.recv() for remote in self.remotes]
+        self.waiting = False
+        rewards, dones, infos, self.reset_infos = zip(*results)
+        return self._get_obs(), np.stack(rewards), np.stack(dones), infos
+
+    def reset(self):
+        for env_idx, remote in enumerate(self.remotes):
+            remote.send(("reset", (self._seeds[env_idx], self._options[env_idx])))
+        self.reset_infos = [remote.recv() for remote in self.remotes]
+        self._reset_seeds()
+        self._reset_options()
+        return self._get_obs()
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for process in self.processes:
+            process.join()
+        self.buffers = {}
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.closed = True
+
+    def get_attr(self, attr_name, indices=None):
+        remotes = [self.remotes[i] for i in self._get_indices(indices)]
+        for remote in remotes:
+            remote.send(("get_attr", attr_name))
+        return [remote.recv() for remote in remotes]
+
+    def set_attr(self, attr_name, value, indices=None):
+        remotes = [self.remotes[i] for i in self._get_indices(indices)]
+        for remote in remotes:
+            remote.send(("set_attr", (attr_name, value)))
+        for remote in remotes:
+            remote.recv()
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        remotes = [self.remotes[i] for i in self._get_indices(indices)]
+        for remote in remotes:
+            remote.send(("env_method", (method_name, method_args, method_kwargs)))
+        return [remote.recv() for remote in remotes]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        remotes = [self.remotes[i] for i in self._get_indices(indices)]
+        for remote in remotes:
+            remote.send(("is_wrapped", wrapper_class))
+        return [remote.recv() for remote in remotes]
+
+def make_vec_env(env, n_envs=1, vec_backend="dummy", seed=0):
+    """
+    Build a vectorized environment of n_envs independent copies of env
+
+    Parameters:
+    env: a RiskEnvWrapper to copy into every slot, a ValueError is raised when several copies
+    would share its recorder
+    n_envs: the number of environments
+    vec_backend: "dummy" to step every copy in this process, "subproc" for SB3's SubprocVecEnv,
+    or "shm" for SharedMemoryVecEnv
+    seed: base seed, env i seeds its random generator with seed + i
+
+    Returns:
+    vec_env: the vectorized environment
+    """
+    if vec_backend not in VEC_BACKENDS:
+        raise ValueError(f"vec_backend must be one of {VEC_BACKENDS}")
+    if n_envs > 1 and getattr(env, 'recorder', None) is not None:
+        # every copy would append to the same log, which has a single writer
+        raise ValueError("A RiskEnvWrapper with a recorder cannot be copied into several envs, use n_envs=1")
+    if vec_backend == "dummy":
+        # every copy lives in this process, a copied generator would roll the same dice, so reseed each one
+        envs = [env] + [copy.deepcopy(env) for _ in range(n_envs - 1)]
+        for i, e in enumerate(envs):
+            e.risk_env.seed(seed + i)
+        return DummyVecEnv([lambda e=e: e for e in envs])
+    env_fns = [SeededEnvFn(env, seed + i) for i in range(n_envs)]
+    if vec_backend == "subproc":
+        return SubprocVecEnv(env_fns)
+    return SharedMemoryVecEnv(env_fns)
@@ -6,7 +6,8 @@ import matplotlib.pyplot as plt
 from risk_env import RiskEnv, Player
 from risk_env_wrapper import RiskEnvWrapper
 from trinet import TriNet
-from risk_graph_2 import visualize_game_state  # Assume you saved visualize_game_state in visualization.py
+from mcts import MCTSPlanner
+from risk_graph_2 import GameRenderer, record_game
 
 def simulate(args):
     # Create players and environment
@@ -22,31 +23,48 @@ def simulate(args):
     else:
         model = None
         print("No model provided, using random actions.")
+    planner = None
+    if args.mcts_simulations > 0:
+        planner = MCTSPlanner(args.board, players, model_path=args.model, num_simulations=args.mcts_simulations,
+                              time_limit=args.mcts_time, num_workers=args.workers, seed=args.seed)
+        print(f"Planning with MCTS, {args.mcts_simulations} simulations x {args.workers} workers per turn.")
+
+    def act(obs):
+        if planner is not None:
+            return planner.plan(env)
+        if model is not None:
+            # Use the trained model to predict actions
+            return model.predict(obs, deterministic=True)[0]
+        # Random action
+        return env.action_space.sample()
+
+    if args.record:
+        frames = record_game(env, act, args.record, max_steps=args.max_steps, fps=args.fps, seed=args.seed)
+        if planner is not None:
+            planner.close()
+        print(f"Wrote {frames} frames to {args.record}")
+        return
 
     obs, info = env.reset(seed=args.seed)
-    visualize_game_state(env, title="Initial Game State")
+    renderer = GameRenderer(env)
+    renderer.update("Initial Game State")
 
     step_count = 0
     done = False
 
     while not done and step_count < args.max_steps:
         step_count += 1
-        if model is not None:
-            # Use the trained model to predict actions
-            action, _ = model.predict(obs, deterministic=True)
-        else:
-            # Random action
-            action = env.action_space.sample()
+        obs, reward, done, truncated, info = env.step(act(obs))
 
-        obs, reward, done, truncated, info = env.step(action)
-        
         # Visualize the new state
-        plt.close('all')  # Close previous plots if needed
-        visualize_game_state(env, title=f"Step {step_count}, Reward: {reward}")
-        
+        renderer.update(f"Step {step_count}, Reward: {reward}")
+
         if args.delay > 0:
             plt.pause(args.delay)
 
+    renderer.close()
+    if planner is not None:
+        planner.close()
     print("Simulation ended.")
     if done:
         print("Episode finished because 'done' = True.")
@@ -60,6 +78,11 @@ if __name__ == "__main__":
     parser.add_argument("--seed", type=int, default=42, help="Random seed for environment reset.")
     parser.add_argument("--max_steps", type=int, default=100, help="Maximum number of steps to simulate.")
     parser.add_argument("--delay", type=float, default=1.0, help="Delay in seconds between steps for visualization.")
+    parser.add_argument("--mcts_simulations", type=int, default=0, help="Plan every turn with MCTS using this many simulations per worker (0 to act directly).")
+    parser.add_argument("--mcts_time", type=float, default=None, help="Seconds of MCTS search per turn.")
+    parser.add_argument("--workers", type=int, default=1, help="Processes searching in parallel for each MCTS decision.")
+    parser.add_argument("--record", type=str, default=None, help="Write the game headlessly to this .gif or .mp4 instead of showing it.")
+    parser.add_argument("--fps", type=int, default=2, help="Frames per second of the recording.")
     args = parser.parse_args()
 
     simulate(args)
\ No newline at end of file
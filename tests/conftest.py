@@ -0,0 +1,11 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    # board paths like "small.json" are relative to the repository root
+    monkeypatch.chdir(ROOT)
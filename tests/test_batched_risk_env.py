@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from risk_env import RiskEnv, Player
+from risk_env_wrapper import RiskEnvWrapper
+from batched_risk_env import BatchedRiskEnv
+
+def random_actions(rng, num_envs, T):
+    action = rng.random((num_envs, T + 2 * T * T)).astype(np.float32)
+    attack_units = (action[:, T:T + T * T].reshape((num_envs, T, T)) * (T + 1)).astype(np.int32)
+    fortify_units = (action[:, T + T * T:].reshape((num_envs, T, T)) * (T + 1)).astype(np.int32)
+    return action[:, :T], attack_units, fortify_units
+
+def play(batched, env, game, turns, seed=0):
+    """
+    Play the same random turns in the batched env and in env, checking game after every turn
+    """
+    risk_env = env.risk_env
+    rng = np.random.default_rng(seed)
+    for _ in range(turns):
+        reinforce, attack_units, fortify_units = random_actions(rng, batched.num_envs, batched.T)
+        r, a, f = env.filter_actions(reinforce[game], attack_units[game].copy(), fortify_units[game].copy())
+        risk_env.reinforce(risk_env.current_player_id, r)
+        risk_env.attack(risk_env.current_player_id, a)
+        risk_env.fortify(risk_env.current_player_id, f)
+        risk_env.current_player_id = (risk_env.current_player_id + 1) % len(risk_env.players)
+        batched.step(reinforce, attack_units, fortify_units)
+        assert np.array_equal(risk_env.game_state[:, 0], batched.owners[game])
+        assert np.array_equal(risk_env.game_state[:, 1], batched.units[game])
+        if risk_env.check_winner()[0]:
+            break
+
+@pytest.mark.parametrize("game", [0, 2])
+def test_seeded_game_matches_risk_env(game):
+    players = [Player(0), Player(1)]
+    batched = BatchedRiskEnv("world.json", players, 3, seed=7)
+    env = RiskEnvWrapper(RiskEnv("world.json", players, seed=np.random.SeedSequence(7).spawn(3)[game]))
+    assert np.array_equal(env.risk_env.game_state[:, 0], batched.owners[game])
+    # RiskEnv starts the game it deals in its constructor with the player after the last one dealt
+    env.risk_env.current_player_id = batched.current_player_id[game]
+    play(batched, env, game, turns=30)
+
+def test_reset_seeds_match_risk_env_reset():
+    players = [Player(0), Player(1)]
+    batched = BatchedRiskEnv("world.json", players, 2)
+    batched.reset(seeds=[11, 12])
+    env = RiskEnvWrapper(RiskEnv("world.json", players))
+    env.risk_env.reset(seed=12)
+    play(batched, env, 1, turns=30)
@@ -0,0 +1,60 @@
+import os
+import numpy as np
+import pytest
+
+from risk_env import RiskEnv, Player
+from battle_tables import BattleTable
+
+CAP = 8
+
+def fight(attack_mode, attack_units, defend_units, battles, seed=0):
+    """
+    Count the outcomes of battles fought by RiskEnv.attack, indexed like BattleTable.distribution
+    """
+    env = RiskEnv("small.json", [Player(0), Player(1)], attack_mode=attack_mode, battle_cap=CAP, seed=seed)
+    src, dest = np.argwhere(env.adjacencies == 1)[0]
+    action = np.zeros(env.adjacencies.shape, dtype=np.int64)
+    action[src, dest] = attack_units
+    counts = np.zeros(attack_units + defend_units)
+    for _ in range(battles):
+        env.game_state[:] = (1, 1)
+        env.game_state[src] = (0, attack_units + 1)
+        env.game_state[dest] = (1, defend_units)
+        env.attack(0, action)
+        if env.game_state[dest, 0] == 0:
+            counts[attack_units + 1 - env.game_state[src, 1]] += 1
+        else:
+            counts[attack_units + defend_units - env.game_state[dest, 1]] += 1
+    return counts
+
+def chi_square(counts, probabilities):
+    """
+    Returns:
+    chi2: the chi-square statistic, outcomes expected fewer than 5 times pooled into one
+    critical: the 0.999 quantile of the chi-square distribution (Wilson-Hilferty approximation)
+    """
+    expected = probabilities * counts.sum()
+    order = np.argsort(expected)
+    pooled = np.cumsum(expected[order]) < 5
+    observed = np.append(counts[order][~pooled], counts[order][pooled].sum())
+    expected = np.append(expected[order][~pooled], expected[order][pooled].sum())
+    keep = expected > 0
+    chi2 = np.sum((observed[keep] - expected[keep]) ** 2 / expected[keep])
+    dof = keep.sum() - 1
+    return chi2, dof * (1 - 2 / (9 * dof) + 3.09 * np.sqrt(2 / (9 * dof))) ** 3
+
+# the last matchup is larger than the cap, so resolved battles roll dice until both stacks fit
+@pytest.mark.parametrize("attack_mode", ["dice", "resolved"])
+@pytest.mark.parametrize("attack_units, defend_units", [(1, 1), (3, 2), (5, 3), (8, 8), (CAP + 6, 4)])
+def test_table_matches_dice(attack_mode, attack_units, defend_units):
+    table = BattleTable(CAP + 6, cache_dir=None)
+    counts = fight(attack_mode, attack_units, defend_units, battles=4000)
+    chi2, critical = chi_square(counts, table.distribution(attack_units, defend_units))
+    assert chi2 < critical
+
+def test_cache_is_written_whole(tmp_path):
+    table = BattleTable(6, cache_dir=str(tmp_path))
+    assert os.listdir(tmp_path) == ["battle_table_6.npz"]
+    cached = BattleTable(6, cache_dir=str(tmp_path))
+    assert np.array_equal(cached.cumulative, table.cumulative)
+    assert np.array_equal(cached.offsets, table.offsets)
@@ -0,0 +1,15 @@
+from benchmark_steps import compare
+
+def result(steps_per_sec, p50_us):
+    return {'steps_per_sec': steps_per_sec, 'phases': {'step': {'p50_us': p50_us}}}
+
+def test_only_the_fixed_stream_is_compared():
+    baseline = {'world.json/env/fixed': result(100.0, 10.0), 'world.json/env/random': result(100.0, 10.0)}
+    results = {'world.json/env/fixed': result(50.0, 20.0), 'world.json/env/random': result(50.0, 20.0)}
+    regressions = compare(results, baseline, tolerance=0.2)
+    assert {key for key, _, _, _ in regressions} == {'world.json/env/fixed'}
+    assert {metric for _, metric, _, _ in regressions} == {'steps_per_sec', 'step p50_us'}
+
+def test_changes_within_tolerance_pass():
+    baseline = {'world.json/env/fixed': result(100.0, 10.0)}
+    assert compare({'world.json/env/fixed': result(90.0, 11.0)}, baseline, tolerance=0.2) == []
@@ -0,0 +1,56 @@
+import numpy as np
+
+from risk_env import RiskEnv, Player
+from risk_env_wrapper import RiskEnvWrapper
+from trinet import TriNet
+from eval_cache import PolicyCache
+
+def make_env(board="small.json", **kwargs):
+    return RiskEnvWrapper(RiskEnv(board, [Player(0), Player(1)], seed=0), **kwargs)
+
+def test_policy_cache_sees_the_observation_predict_sees():
+    # full observations are the ones VecNormalize normalizes
+    env = make_env()
+    trinet = TriNet(env)
+    # statistics a trained model would have, they are not saved with its checkpoint
+    for rms in trinet.env.obs_rms.values():
+        rms.mean += 3.0
+    obs, _ = env.reset(seed=0)
+    mean, _, _ = PolicyCache(trinet).evaluate(env)
+    action, _ = trinet.agent.predict(obs, deterministic=True)
+    assert np.allclose(np.clip(mean, env.action_space.low, env.action_space.high), action, atol=1e-6)
+
+def test_position_hash_is_equal_for_equal_positions():
+    first, second = make_env("world.json").risk_env, make_env("world.json").risk_env
+    assert first.position_hash() == second.position_hash()
+    start = first.position_hash()
+
+    # the same position reached by different moves
+    player_id = first.current_player_id
+    a, b = np.nonzero(first.game_state[:,0] == player_id)[0][:2]
+    for territory in (a, b):
+        reinforce_action = np.zeros(len(first.game_state), dtype=np.int64)
+        reinforce_action[territory] = 1
+        first.reinforce(player_id, reinforce_action)
+    reinforce_action = np.zeros(len(second.game_state), dtype=np.int64)
+    reinforce_action[[b, a]] = 1
+    second.reinforce(player_id, reinforce_action)
+    assert first.position_hash() == second.position_hash() != start
+
+    second.current_player_id = (player_id + 1) % len(second.players)
+    assert first.position_hash() != second.position_hash()
+
+def test_position_hash_changes_after_a_move():
+    env = make_env("world.json")
+    env.reset(seed=0)
+    env.action_space.seed(0)
+    for _ in range(10):
+        before = env.risk_env.position_hash()
+        # every turn places its reinforcements, so it always changes the position
+        _, _, done, _, _ = env.step(env.action_space.sample())
+        assert env.risk_env.position_hash() != before
+        board_hash = env.risk_env.board_hash
+        env.risk_env.rehash()
+        assert env.risk_env.board_hash == board_hash
+        if done:
+            break
@@ -0,0 +1,44 @@
+import numpy as np
+import torch
+
+from risk_env import RiskEnv, Player
+from risk_env_wrapper import RiskEnvWrapper
+from trinet import TriNet
+
+def make_env(board):
+    return RiskEnvWrapper(RiskEnv(board, [Player(0), Player(1)], seed=0), compact_obs=True, edge_actions=True)
+
+def test_neighbor_mean_matches_edge_list():
+    trinet = TriNet(make_env("world.json"), policy="gnn")
+    extractor = trinet.agent.policy.features_extractor
+    h = torch.randn(len(trinet.env.observation_space['owners'].low), 3)
+    mean = torch.sparse.mm(extractor.mean_adjacency, h)
+    sources, targets = extractor.edge_sources.numpy(), extractor.edge_targets.numpy()
+    for territory in range(len(h)):
+        neighbors = sources[targets == territory]
+        expected = h[neighbors].mean(dim=0) if len(neighbors) else torch.zeros(3)
+        assert torch.allclose(mean[territory], expected, atol=1e-6)
+
+def test_checkpoint_runs_on_another_board(tmp_path):
+    trinet = TriNet(make_env("small.json"), policy="gnn")
+    trinet.agent.n_steps, trinet.agent.batch_size = 64, 32
+    trinet.agent._setup_model()
+    trinet.train(64)
+    trinet.save_model(str(tmp_path / "gnn"))
+    env = make_env("world.json")
+    trinet = TriNet(env, model_path=str(tmp_path / "gnn.zip"), policy="gnn")
+    obs, _ = env.reset(seed=0)
+    action = trinet.get_action(obs)
+    assert action.shape == env.action_space.shape and np.all((action >= 0) & (action <= 1))
+    env.step(action)
+
+def test_traced_policy_matches(tmp_path):
+    from export import DeterministicPolicy, export_policy, observation_keys
+    from exported_policy import ExportedPolicy
+    env = make_env("world.json")
+    trinet = TriNet(env, policy="gnn")
+    path = str(tmp_path / "gnn.pt")
+    export_policy(DeterministicPolicy(trinet.agent.policy, observation_keys(env)), env, path)
+    obs, _ = env.reset(seed=1)
+    expected, _ = trinet.agent.predict(obs, deterministic=True)
+    assert np.allclose(ExportedPolicy(path).predict(obs)[0], expected, atol=1e-5)
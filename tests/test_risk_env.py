@@ -0,0 +1,88 @@
+import numpy as np
+
+from risk_env import RiskEnv, Player
+
+def make_env(num_players=3, seed=0):
+    return RiskEnv("world.json", [Player(i) for i in range(num_players)], seed=seed)
+
+def attack_turn(env, rng):
+    """
+    Put all reinforcements on one front territory and attack a random neighbor with every unit
+
+    Returns:
+    attacked: False if the current player has no enemy neighbor left
+    """
+    sources, targets = env.board.edge_sources, env.board.edge_targets
+    player_id = env.current_player_id
+    owners = env.game_state[:,0]
+    front = np.nonzero((owners[sources] == player_id) & (owners[targets] != player_id))[0]
+    if len(front) == 0:
+        return False
+    edge = rng.choice(front)
+    reinforce_action = np.zeros(len(env.game_state), dtype=np.int64)
+    reinforce_action[sources[edge]] = env.get_reinforcements(player_id)
+    env.reinforce(player_id, reinforce_action)
+    env.attack(player_id, (sources[[edge]], targets[[edge]], env.game_state[sources[[edge]],1] - 1))
+    env.current_player_id = (player_id + 1) % len(env.players)
+    return True
+
+def relabeled(env):
+    """
+    The component labels label_components gives the current board, leaving env as it is
+    """
+    snapshot = env.snapshot()
+    env.label_components()
+    components = env.components.copy()
+    env.restore(snapshot)
+    return components
+
+def same_component(components):
+    return components[:, None] == components[None, :]
+
+def test_incremental_components_match_relabeling_after_conquests():
+    env = make_env()
+    rng = np.random.default_rng(0)
+    num_players = len(env.players)
+    for _ in range(300):
+        territory = rng.integers(len(env.game_state))
+        env.change_owner(territory, (env.game_state[territory,0] + rng.integers(1, num_players)) % num_players)
+        assert np.array_equal(same_component(env.components), same_component(relabeled(env)))
+
+def test_incremental_components_match_relabeling_after_attacks():
+    env = make_env()
+    rng = np.random.default_rng(0)
+    for _ in range(100):
+        if not attack_turn(env, rng):
+            break
+        assert np.array_equal(same_component(env.components), same_component(relabeled(env)))
+
+def state(env):
+    return (env.game_state.copy(), env.territory_counts.copy(), env.continent_counts.copy(),
+            env.continent_bonus.copy(), env.board_hash, env.current_player_id)
+
+def assert_same_state(first, second):
+    for a, b in zip(first, second):
+        assert np.array_equal(a, b)
+
+def test_restore_replays_the_same_game():
+    env = make_env()
+    rng = np.random.default_rng(0)
+    for _ in range(10):
+        attack_turn(env, rng)
+    snapshot, before = env.snapshot(), state(env)
+    rng_state = rng.bit_generator.state
+    played = []
+    for _ in range(30):
+        attack_turn(env, rng)
+        played.append(state(env))
+    draws = env.rng.random(5), env.roll_dice()
+
+    env.restore(snapshot)
+    assert_same_state(state(env), before)
+    rng.bit_generator.state = rng_state
+    for expected in played:
+        attack_turn(env, rng)
+        assert_same_state(state(env), expected)
+    replayed = env.rng.random(5), env.roll_dice()
+    assert np.array_equal(draws[0], replayed[0]) and draws[1] == replayed[1]
+    env._check_counters()
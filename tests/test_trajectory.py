@@ -0,0 +1,23 @@
+import pytest
+
+from risk_env import RiskEnv, Player
+from risk_env_wrapper import RiskEnvWrapper
+from shared_vec_env import make_vec_env
+from trajectory import TrajectoryRecorder, TrajectoryLog
+
+def make_env(path):
+    risk_env = RiskEnv("small.json", [Player(0), Player(1)], seed=0)
+    recorder = TrajectoryRecorder(str(path), "small.json", len(risk_env.game_state))
+    return RiskEnvWrapper(risk_env, recorder=recorder)
+
+@pytest.mark.parametrize("vec_backend", ["dummy", "subproc"])
+def test_recorder_is_not_copied_into_several_envs(tmp_path, vec_backend):
+    with pytest.raises(ValueError):
+        make_vec_env(make_env(tmp_path), n_envs=2, vec_backend=vec_backend)
+
+def test_recorder_with_one_env(tmp_path):
+    vec_env = make_vec_env(make_env(tmp_path), n_envs=1)
+    vec_env.reset()
+    vec_env.step(vec_env.action_space.sample()[None])
+    vec_env.close()
+    assert len(TrajectoryLog(str(tmp_path))) >= 1
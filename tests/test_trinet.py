@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from risk_env import RiskEnv, Player
+from risk_env_wrapper import RiskEnvWrapper
+from trinet import TriNet
+
+def make_env(**kwargs):
+    return RiskEnvWrapper(RiskEnv("small.json", [Player(0), Player(1)], seed=0), **kwargs)
+
+@pytest.mark.parametrize("edge_actions", [False, True])
+@pytest.mark.parametrize("model_path", [None, "random"])
+def test_get_action_steps_the_env(edge_actions, model_path):
+    env = make_env(compact_obs=edge_actions, edge_actions=edge_actions)
+    trinet = TriNet(env, model_path=model_path)
+    obs, _ = env.reset(seed=0)
+    for _ in range(3):
+        action = trinet.get_action(obs)
+        assert action.shape == env.action_space.shape
+        obs, _, done, _, _ = env.step(action)
+        if done:
+            obs, _ = env.reset()
+
+def shorten_rollouts(trinet, n_steps=64):
+    trinet.agent.n_steps, trinet.agent.batch_size = n_steps, n_steps // 2
+    trinet.agent._setup_model()
+
+@pytest.mark.parametrize("compact_obs", [False, True])
+def test_trains_with_action_mask(compact_obs):
+    env = make_env(action_mask=True, compact_obs=compact_obs, edge_actions=compact_obs)
+    trinet = TriNet(env)
+    assert 'action_mask' not in trinet.env.norm_obs_keys
+    shorten_rollouts(trinet)
+    trinet.train(64)
+    assert trinet.agent.num_timesteps == 64
+
+def test_compact_obs_are_scaled_by_the_policy():
+    env = make_env(compact_obs=True, action_mask=True)
+    trinet = TriNet(env)
+    obs, _ = env.reset(seed=0)
+    tensors, _ = trinet.agent.policy.obs_to_tensor(obs)
+    features = trinet.agent.policy.extract_features(tensors, trinet.agent.policy.pi_features_extractor)
+    assert features.shape == (1, trinet.agent.policy.features_dim)
+    assert features.min() >= 0 and features.max() <= 1
+    assert features.max() > 0
@@ -0,0 +1,256 @@
+"""
+Headless round-robin tournament between TriNet checkpoints and the random baseline,
+rated with Elo. Games are played to completion across a process pool, one round of every
+ordered pairing at a time, until the rating intervals separate or the game budget runs out.
+"""
+
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+from risk_env import RiskEnv, Player
+from risk_env_wrapper import RiskEnvWrapper
+from worker_pool import get_context, HEADLESS_MODULES
+
+ELO_SCALE = 400 / np.log(10)
+
+def resolve_checkpoint(model_path):
+    """
+    Get the path of a saved model, with or without the .zip suffix SB3 adds.
+    "random" is the random baseline.
+    """
+    if model_path == "random":
+        return model_path
+    for path in (model_path, model_path + ".zip"):
+        if os.path.exists(path):
+            return path
+    raise ValueError(f"Checkpoint {model_path} not found")
+
+def play_game(env, agents, seed, max_turns):
+    """
+    Play one game to completion
+
+    Parameters:
+    env: a RiskEnvWrapper
+    agents: one TriNet per seat, or None for a random player
+    seed: seed of the deal, the dice and the random players
+    max_turns: turns after which the game is scored as a draw
+
+    Returns:
+    winner: the seat of the winner, or None for a draw
+    turns: the number of turns played
+    """
+    obs, _ = env.reset(seed=seed)
+    env.action_space.seed(seed)
+    if any(agent is not None for agent in agents):
+        # the policies sample their actions from torch's global generator
+        import torch
+        torch.manual_seed(seed)
+    for turn in range(max_turns):
+        agent = agents[env.risk_env.current_player_id]
+        action = env.action_space.sample() if agent is None else agent.predict(obs)[0]
+        obs, _, _, _, _ = env.step(action)
+        done, winner = env.risk_env.check_winner()
+        if done:
+            return int(winner), turn + 1
+    return None, max_turns
+
+class Arena():
+    """
+    The env and the loaded entrants of one worker process
+
+    Parameters:
+    config: the dictionary built by run_tournament
+    """
+    def __init__(self, config):
+        self.config = config
+        players = [Player(i) for i in range(2)]
+        self.env = RiskEnvWrapper(RiskEnv(config['board'], players, **config['env_kwargs']),
+                                  max_episode_steps=config['max_turns'], **config['wrapper_kwargs'])
+        self.agents = []
+        for model_path in config['model_paths']:
+            if model_path == "random":
+                self.agents.append(None)
+            else:
+                from trinet import TriNet
+                self.agents.append(TriNet(self.env, model_path=model_path))
+
+    def play(self, first, second, seed):
+        """
+        Play entrant first (moving first) against entrant second
+
+        Returns:
+        first, second: the entrant indices
+        score: 1 if first won, 0 if second won, 0.5 for a draw
+        turns: the number of turns played
+        """
+        winner, turns = play_game(self.env, [self.agents[first], self.agents[second]], seed, self.config['max_turns'])
+        score = 0.5 if winner is None else float(winner == 0)
+        return first, second, score, turns
+
+_arena = None
+
+def _init_worker(config):
+    global _arena
+    _arena = Arena(config)
+
+def _play_worker(args):
+    return _arena.play(*args)
+
+def elo_ratings(scores, games, anchor=None, iterations=1000):
+    """
+    Maximum likelihood Bradley-Terry ratings on the Elo scale. Draws count as half a win,
+    and every pair gets one virtual draw so that unbeaten or winless entrants stay finite.
+
+    Parameters:
+    scores: a N x N numpy array, scores[i, j] is the total score of i against j
+    games: a N x N numpy array, games[i, j] is the number of games between i and j (symmetric)
+    anchor: index of the entrant rated 0, or None to center the ratings on 0
+
+    Returns:
+    elo: a (N,) numpy array of ratings
+    stderr: a (N,) numpy array of the standard errors of the ratings
+    """
+    n = len(scores)
+    off_diagonal = 1 - np.eye(n)
+    scores = scores + 0.5 * off_diagonal
+    games = games + off_diagonal
+    gamma = np.ones(n)
+    for _ in range(iterations):
+        updated = scores.sum(axis=1) / np.sum(games / (gamma[:, None] + gamma[None, :]), axis=1)
+        updated /= np.exp(np.mean(np.log(updated)))
+        if np.allclose(updated, gamma, rtol=1e-10):
+            break
+        gamma = updated
+    strength = np.log(gamma)
+    p = 1 / (1 + np.exp(strength[None, :] - strength[:, None]))
+    information = np.sum(games * p * (1 - p), axis=1)
+    strength -= strength[anchor] if anchor is not None else strength.mean()
+    return strength * ELO_SCALE, ELO_SCALE / np.sqrt(information)
+
+def separated(elo, stderr, z):
+    """
+    Check whether the confidence intervals of entrants adjacent in the ranking are disjoint
+    """
+    order = np.argsort(elo)
+    low, high = elo - z * stderr, elo + z * stderr
+    return bool(np.all(high[order[:-1]] < low[order[1:]]))
+
+def run_tournament(board, entrants, max_rounds=50, min_rounds=2, max_turns=200, workers=1, z=1.96, seed=0,
+                   env_kwargs=None, wrapper_kwargs=None, start_method=None, verbose=True):
+    """
+    Play round-robin rounds until the ratings separate or max_rounds is reached. A round is
+    one game of every ordered pair of entrants, so everyone moves first equally often.
+
+    Parameters:
+    board: path to the board JSON
+    entrants: a list of (name, model_path) pairs, model_path "random" for the random baseline
+    max_rounds: the largest number of rounds to play
+    min_rounds: rounds to play before early stopping is considered
+    max_turns: turns after which a game is scored as a draw
+    workers: the number of game processes
+    z: width of the confidence intervals in standard errors
+    seed: base seed of the games
+    env_kwargs, wrapper_kwargs: keyword arguments of RiskEnv and RiskEnvWrapper, matching the checkpoints
+    start_method: multiprocessing start method, defaults to forkserver where available
+
+    Returns:
+    results: a dictionary with the names, scores, games, elo, stderr, rounds, turns and elapsed seconds
+    """
+    names = [name for name, _ in entrants]
+    config = {
+        'board': board, 'model_paths': [resolve_checkpoint(path) for _, path in entrants],
+        'max_turns': max_turns, 'env_kwargs': env_kwargs or {}, 'wrapper_kwargs': wrapper_kwargs or {}
+    }
+    anchor = next((i for i, (_, path) in enumerate(entrants) if path == "random"), None)
+    n = len(entrants)
+    pairs = [(i, j) for i in range(n) for j in range(n) if i != j]
+    scores, games = np.zeros((n, n)), np.zeros((n, n))
+    turns = 0
+
+    pool = None
+    if workers > 1:
+        preload = HEADLESS_MODULES + ("tournament",)
+        if any(path != "random" for path in config['model_paths']):
+            preload += ("trinet",)
+        pool = get_context(start_method, preload).Pool(workers, initializer=_init_worker, initargs=(config,))
+    else:
+        _init_worker(config)
+
+    start = time.perf_counter()
+    try:
+        for round_index in range(max_rounds):
+            tasks = [(i, j, seed + round_index * len(pairs) + k) for k, (i, j) in enumerate(pairs)]
+            results = pool.imap_unordered(_play_worker, tasks) if pool is not None else map(_play_worker, tasks)
+            for first, second, score, game_turns in results:
+                scores[first, second] += score
+                scores[second, first] += 1 - score
+                games[first, second] += 1
+                games[second, first] += 1
+                turns += game_turns
+            elo, stderr = elo_ratings(scores, games, anchor)
+            if verbose:
+                elapsed = time.perf_counter() - start
+                print(f"round {round_index + 1}: {games.sum() / 2:.0f} games, {games.sum() / 2 / elapsed:.2f} games/sec")
+            if round_index + 1 >= min_rounds and separated(elo, stderr, z):
+                break
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return {
+        'names': names, 'scores': scores, 'games': games, 'elo': elo, 'stderr': stderr,
+        'rounds': round_index + 1, 'turns': turns, 'elapsed': time.perf_counter() - start
+    }
+
+def print_report(results, z=1.96):
+    names, scores, games = results['names'], results['scores'], results['games']
+    total_games = games.sum() / 2
+    print(f"{results['rounds']} rounds, {total_games:.0f} games, {results['turns'] / max(total_games, 1):.1f} turns/game, "
+          f"{total_games / results['elapsed']:.2f} games/sec")
+    print(f"{'entrant':20s} {'games':>6s} {'score':>6s} {'elo':>8s} {'+/-':>6s}")
+    for i in np.argsort(-results['elo']):
+        played = games[i].sum()
+        print(f"{names[i]:20s} {played:6.0f} {scores[i].sum() / max(played, 1):6.3f} "
+              f"{results['elo'][i]:8.1f} {z * results['stderr'][i]:6.1f}")
+    print("score of row against column:")
+    print(" " * 20 + "".join(f"{name[:8]:>9s}" for name in names))
+    for i, name in enumerate(names):
+        row = [scores[i, j] / games[i, j] if games[i, j] else np.nan for j in range(len(names))]
+        print(f"{name:20s}" + "".join("        -" if i == j else f"{value:9.3f}" for j, value in enumerate(row)))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--board", type=str, default="world.json", help="Path to board configuration JSON")
+    parser.add_argument("--models", type=str, nargs="*", default=[], help="Paths of TriNet checkpoints")
+    parser.add_argument("--players", type=str, help="Players configuration JSON (like self_competing.json) with more checkpoints")
+    parser.add_argument("--no-random", action="store_true", help="Leave the random baseline out")
+    parser.add_argument("--max-rounds", type=int, default=50, help="Largest number of round-robin rounds")
+    parser.add_argument("--min-rounds", type=int, default=2, help="Rounds before early stopping is considered")
+    parser.add_argument("--max-turns", type=int, default=200, help="Turns after which a game is a draw")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of game processes")
+    parser.add_argument("--z", type=float, default=1.96, help="Confidence interval width in standard errors")
+    parser.add_argument("--attack-mode", type=str, default="dice", choices=["dice", "resolved"], help="Battle resolution")
+    parser.add_argument("--compact-obs", action="store_true", help="The checkpoints use compact observations")
+    parser.add_argument("--edge-actions", action="store_true", help="The checkpoints use edge-indexed actions")
+    parser.add_argument("--seed", type=int, default=0, help="Base seed of the games")
+    args = parser.parse_args()
+
+    entrants = [(os.path.basename(path), path) for path in args.models]
+    if args.players:
+        with open(args.players) as f:
+            for player in json.load(f)["players"]:
+                entrants.append((player.get("name", os.path.basename(player["model_path"])), player["model_path"]))
+    if not args.no_random:
+        entrants.append(("random", "random"))
+    if len(entrants) < 2:
+        raise ValueError("A tournament needs at least two entrants")
+
+    results = run_tournament(args.board, entrants, max_rounds=args.max_rounds, min_rounds=args.min_rounds,
+                             max_turns=args.max_turns, workers=args.workers, z=args.z, seed=args.seed,
+                             env_kwargs={'attack_mode': args.attack_mode},
+                             wrapper_kwargs={'compact_obs': args.compact_obs, 'edge_actions': args.edge_actions})
+    print_report(results, args.z)
@@ -2,21 +2,46 @@ from risk_env import RiskEnv, Player
 from risk_env_wrapper import RiskEnvWrapper
 from stable_baselines3.common.vec_env import VecNormalize
 from trinet import TriNet
+from profiler import StepProfiler
 import json
 import argparse
 
 def main(args):
-    players = [Player(i) for i in range(2)]
+    # the agent plays seat 0, every opponent another seat ("self" leaves that seat to the agent too)
+    opponents = [None] + [None if spec == "self" else spec for spec in args.opponents] if args.opponents else None
+    players = [Player(i) for i in range(len(opponents) if opponents else 2)]
     risk_env = RiskEnv(args.board, players)
-    env = RiskEnvWrapper(risk_env)
+    # the envs report their phases through info['profile'], the training profiler collects them
+    env = RiskEnvWrapper(risk_env, compact_obs=args.compact_obs, edge_actions=args.edge_actions,
+                         profiler=StepProfiler() if args.profile else None, opponents=opponents)
+    profiler = StepProfiler() if args.profile else None
 
     # Initialize and train TriNet
-    if args.load:
-        trinet = TriNet(env, model_path=args.load)
+    model_path = args.load or "models/trinet"
+    make_trinet = lambda model_path: TriNet(env, model_path=model_path, n_envs=args.n_envs, vec_backend=args.vec_backend,
+                                            seed=args.seed, policy=args.policy)
+
+    if args.data_parallel and not args.actor_learner:
+        from distributed_ppo import launch
+        config = {
+            'board': args.board, 'compact_obs': args.compact_obs, 'edge_actions': args.edge_actions,
+            'policy': args.policy, 'opponents': opponents, 'n_envs': args.n_envs, 'model_path': model_path,
+            'total_timesteps': 100000, 'seed': args.seed, 'verbose': 1, 'save_path': "models/trinet_data_parallel"
+        }
+        # every rank builds its own TriNet and envs, this process only builds one for the trained model
+        launch(config, args.data_parallel)
+        trinet = make_trinet("models/trinet_data_parallel.zip")
     else:
-        trinet = TriNet(env,model_path="models/trinet")
-    
-    trinet.train(100000)
+        trinet = make_trinet(model_path)
+        if args.actor_learner:
+            from actor_learner import ActorLearner
+            learner = ActorLearner(trinet, env, num_actors=args.actors, seed=args.seed)
+            learner.learn(100000)
+            learner.close()
+        else:
+            trinet.train(100000, profiler=profiler)
+            if profiler is not None:
+                profiler.dump_csv(args.profile)
     trinet.save_model("models/trinet_attack_motivated")
     import matplotlib.pyplot as plt
 
@@ -36,6 +61,21 @@ if __name__ == "__main__": # Initialize environment and players
     parser.add_argument("--board", type=str, help="Path to board configuration JSON")
     parser.add_argument("--players", type=str, help="Path to players configuration JSON")
     parser.add_argument("--load", type=str, help="Path to model to load")
+    parser.add_argument("--n-envs", type=int, default=1, help="Number of environments to collect rollouts from")
+    parser.add_argument("--vec-backend", type=str, default="dummy", choices=["dummy", "subproc", "shm"],
+                        help="dummy steps every env in this process, subproc/shm use one worker process per env")
+    parser.add_argument("--seed", type=int, default=0, help="Base seed of the worker RNGs")
+    parser.add_argument("--compact-obs", action="store_true", help="Observe narrow per-territory fields instead of T x T matrices")
+    parser.add_argument("--edge-actions", action="store_true", help="Index attacks by board edge and fortify with a (source, dest, fraction) head")
+    parser.add_argument("--policy", type=str, default="mlp", choices=["mlp", "gnn"],
+                        help="gnn passes messages along the board's edges and needs --compact-obs --edge-actions")
+    parser.add_argument("--profile", type=str, help="Time the env phases and PPO updates and write the summary to this CSV")
+    parser.add_argument("--actor-learner", action="store_true", help="Train with asynchronous actor processes instead of synchronous PPO rollouts")
+    parser.add_argument("--actors", type=int, default=2, help="Actor processes of --actor-learner")
+    parser.add_argument("--data-parallel", type=int, default=0,
+                        help="Train with this many data-parallel learner processes (see distributed_ppo.py)")
+    parser.add_argument("--opponents", type=str, nargs="+",
+                        help="Opponents of seats 1, 2, ...: greedy, border, turtle, random, a checkpoint path or self")
 
     args = parser.parse_args()
     main(args)
\ No newline at end of file
@@ -0,0 +1,304 @@
+"""
+Compact binary trajectory logs. Every step stores the full board state after it (owners and
+units in narrow dtypes), the decoded reinforcement, the battles fought with their losses, the
+fortify move and the reward, so any state can be read back by index without re-simulating.
+Steps are written in chunks of fixed-size .npy files that are memory-mapped on read, so a log
+of millions of steps never has to fit in memory.
+
+Layout of a log directory:
+meta.json: board, T, number of players, dtypes, chunk size, rows and battles of every chunk, first step of every game
+steps_K.npy: one STEP_DTYPE record per step of chunk K
+owners_K.npy, units_K.npy, reinforce_K.npy: rows x T arrays of chunk K
+battles_K.npy: the BATTLE_DTYPE records of chunk K, steps point into it with battle_start/battle_count
+"""
+
+import os
+import json
+import argparse
+import numpy as np
+
+FORMAT_VERSION = 1
+
+STEP_DTYPE = np.dtype([
+    ('game', np.int64), ('turn', np.int32), ('player', np.int8), ('next_player', np.int8),
+    ('reward', np.float32), ('done', np.bool_), ('battle_start', np.int64), ('battle_count', np.int32),
+    ('fortify_src', np.int32), ('fortify_dest', np.int32), ('fortify_units', np.int32)
+])
+BATTLE_DTYPE = np.dtype([
+    ('src', np.int32), ('dest', np.int32), ('units', np.int32),
+    ('attacker_lost', np.int32), ('defender_lost', np.int32), ('conquered', np.bool_)
+])
+
+class TrajectoryRecorder():
+    def __init__(self, path, board, num_territories, num_players=2, chunk_steps=16384, units_dtype="uint16"):
+        """
+        Record steps into the log at path. An existing log of the same board is appended to.
+        Give every env its own path, a log has a single writer.
+
+        Parameters:
+        path: the log directory
+        board: path to the board JSON, stored so the replay tool can rebuild the env
+        num_territories: T
+        num_players: the number of players
+        chunk_steps: steps per chunk file, the recorder buffers one chunk in memory
+        units_dtype: dtype of the unit counts and reinforcements, a ValueError is raised when
+        a count does not fit
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+            if self.meta['num_territories'] != num_territories:
+                raise ValueError(f"{path} holds a log of a board with {self.meta['num_territories']} territories")
+        else:
+            self.meta = {
+                'version': FORMAT_VERSION, 'board': board, 'num_territories': num_territories, 'num_players': num_players,
+                'units_dtype': units_dtype, 'chunk_steps': chunk_steps,
+                'chunk_rows': [], 'chunk_battles': [], 'game_starts': []
+            }
+        self.units_dtype = np.dtype(self.meta['units_dtype'])
+        self.units_max = np.iinfo(self.units_dtype).max
+        self.chunk_steps = self.meta['chunk_steps']
+        T = num_territories
+        self.steps = np.zeros(self.chunk_steps, dtype=STEP_DTYPE)
+        self.owners = np.zeros((self.chunk_steps, T), dtype=np.int8)
+        self.units = np.zeros((self.chunk_steps, T), dtype=self.units_dtype)
+        self.reinforce = np.zeros((self.chunk_steps, T), dtype=self.units_dtype)
+        self.battles = []
+        self.rows = 0
+        # a partially filled last chunk is continued
+        if self.meta['chunk_rows'] and self.meta['chunk_rows'][-1] < self.chunk_steps:
+            chunk = len(self.meta['chunk_rows']) - 1
+            self.rows = self.meta['chunk_rows'].pop()
+            self.meta['chunk_battles'].pop()
+            for name, buffer in (('steps', self.steps), ('owners', self.owners), ('units', self.units),
+                                 ('reinforce', self.reinforce)):
+                buffer[:self.rows] = np.load(self._file(name, chunk))
+            self.battles = [tuple(battle) for battle in np.load(self._file('battles', chunk))]
+        self.game = len(self.meta['game_starts']) - 1
+        self.turn = 0
+
+    def _file(self, name, chunk):
+        return os.path.join(self.path, f"{name}_{chunk:06d}.npy")
+
+    def __len__(self):
+        return sum(self.meta['chunk_rows']) + self.rows
+
+    def start_game(self, risk_env):
+        """
+        Record the initial state of a new game as a step without actions
+        """
+        self.game += 1
+        self.meta['game_starts'].append(len(self))
+        self.turn = 0
+        self._append(risk_env, risk_env.current_player_id, None, 0.0, False)
+
+    def record_step(self, risk_env, player_id, reinforce_action, reward, done):
+        """
+        Record the state after a turn, with the battles and the fortify move risk_env logged in
+        its battle_log and fortify_log, which are emptied
+
+        Parameters:
+        risk_env: the RiskEnv after the turn
+        player_id: the player who moved
+        reinforce_action: the (T,) units placed
+        reward: the reward of the turn
+        done: whether the episode ended
+        """
+        if self.game < 0:
+            raise ValueError("start_game must be called before the first step is recorded")
+        self.turn += 1
+        self._append(risk_env, player_id, reinforce_action, reward, done)
+
+    def _append(self, risk_env, player_id, reinforce_action, reward, done):
+        owners, units = risk_env.game_state[:,0], risk_env.game_state[:,1]
+        if units.max() > self.units_max or (reinforce_action is not None and np.max(reinforce_action) > self.units_max):
+            raise ValueError(f"Unit counts do not fit in {self.units_dtype}")
+        row = self.rows
+        battle_log = risk_env.battle_log or []
+        fortify_log = risk_env.fortify_log or []
+        fortify = fortify_log[-1] if fortify_log else (-1, -1, 0)
+        self.steps[row] = (self.game, self.turn, player_id, risk_env.current_player_id, reward, done,
+                           len(self.battles), len(battle_log), *fortify)
+        self.owners[row] = owners
+        self.units[row] = units
+        self.reinforce[row] = 0 if reinforce_action is None else reinforce_action
+        self.battles.extend(battle_log)
+        if risk_env.battle_log is not None:
+            risk_env.battle_log.clear()
+        if risk_env.fortify_log is not None:
+            risk_env.fortify_log.clear()
+        self.rows += 1
+        if self.rows == self.chunk_steps:
+            self._write_chunk()
+            self.meta['chunk_rows'].append(self.rows)
+            self.meta['chunk_battles'].append(len(self.battles))
+            self.rows = 0
+            self.battles = []
+            self._write_meta()
+
+    def _write_chunk(self):
+        chunk = len(self.meta['chunk_rows'])
+        np.save(self._file('steps', chunk), self.steps[:self.rows])
+        np.save(self._file('owners', chunk), self.owners[:self.rows])
+        np.save(self._file('units', chunk), self.units[:self.rows])
+        np.save(self._file('reinforce', chunk), self.reinforce[:self.rows])
+        np.save(self._file('battles', chunk), np.array(self.battles, dtype=BATTLE_DTYPE))
+
+    def _write_meta(self):
+        meta = dict(self.meta)
+        if self.rows:
+            meta['chunk_rows'] = self.meta['chunk_rows'] + [self.rows]
+            meta['chunk_battles'] = self.meta['chunk_battles'] + [len(self.battles)]
+        with open(os.path.join(self.path, "meta.json.tmp"), "w") as f:
+            json.dump(meta, f)
+        os.replace(os.path.join(self.path, "meta.json.tmp"), os.path.join(self.path, "meta.json"))
+
+    def flush(self):
+        """
+        Write the partially filled chunk so that readers see every step recorded so far
+        """
+        if self.rows:
+            self._write_chunk()
+        self._write_meta()
+
+    def close(self):
+        self.flush()
+
+class TrajectoryLog():
+    """
+    Read-only random access to a log written by TrajectoryRecorder. Chunks are memory-mapped
+    when first used.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported trajectory log version {self.meta['version']}")
+        self.num_territories = self.meta['num_territories']
+        self.chunk_steps = self.meta['chunk_steps']
+        self.num_steps = sum(self.meta['chunk_rows'])
+        self.game_starts = np.array(self.meta['game_starts'] + [self.num_steps], dtype=np.int64)
+        self._chunks = {}
+
+    def __len__(self):
+        return self.num_steps
+
+    @property
+    def num_games(self):
+        return len(self.game_starts) - 1
+
+    def _array(self, name, chunk):
+        key = (name, chunk)
+        if key not in self._chunks:
+            self._chunks[key] = np.load(os.path.join(self.path, f"{name}_{chunk:06d}.npy"), mmap_mode="r")
+        return self._chunks[key]
+
+    def _locate(self, index):
+        if not -self.num_steps <= index < self.num_steps:
+            raise IndexError(f"Step {index} out of range for a log of {self.num_steps} steps")
+        index %= self.num_steps
+        # every chunk but the last one being written is full
+        return divmod(index, self.chunk_steps)
+
+    def state(self, index):
+        """
+        Get the board after step index
+
+        Returns:
+        game_state: a T x 2 numpy array of (owner id, number of units), like RiskEnv.game_state
+        """
+        chunk, row = self._locate(index)
+        return np.stack((self._array('owners', chunk)[row], self._array('units', chunk)[row]), axis=1).astype(np.int64)
+
+    def step(self, index):
+        """
+        Get everything recorded for step index
+
+        Returns:
+        a dictionary with game, turn, player (who moved), next_player, reward, done, game_state,
+        reinforce ((T,) units placed), battles (a BATTLE_DTYPE array) and fortify ((src, dest, units),
+        src -1 if nobody moved). The first step of every game is its initial state, with turn 0
+        and no actions.
+        """
+        chunk, row = self._locate(index)
+        record = self._array('steps', chunk)[row]
+        start, count = int(record['battle_start']), int(record['battle_count'])
+        return {
+            'game': int(record['game']), 'turn': int(record['turn']), 'player': int(record['player']),
+            'next_player': int(record['next_player']), 'reward': float(record['reward']), 'done': bool(record['done']),
+            'game_state': self.state(index),
+            'reinforce': self._array('reinforce', chunk)[row].astype(np.int64),
+            'battles': np.array(self._array('battles', chunk)[start:start + count]),
+            'fortify': (int(record['fortify_src']), int(record['fortify_dest']), int(record['fortify_units']))
+        }
+
+    def game(self, game):
+        """
+        Get the range of step indices of a game
+        """
+        return range(self.game_starts[game], self.game_starts[game + 1])
+
+    def load(self, risk_env, index):
+        """
+        Put a RiskEnv in the state after step index, with its counters, component labels and hash
+        rebuilt. The random generator is left as it is.
+        """
+        record = self.step(index)
+        risk_env.game_state = record['game_state']
+        risk_env.current_player_id = record['next_player']
+        risk_env.turn = record['turn']
+        risk_env.label_components()
+        risk_env.count_ownership()
+        risk_env.rehash()
+        done, winner = risk_env.check_winner()
+        risk_env.winner = winner if done else None
+
+    def nbytes(self):
+        """
+        Get the size of the log on disk in bytes
+        """
+        return sum(os.path.getsize(os.path.join(self.path, name)) for name in os.listdir(self.path))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("log", type=str, help="Path to a trajectory log directory")
+    parser.add_argument("--step", type=int, nargs="*", default=[], help="Steps to print")
+    parser.add_argument("--game", type=int, default=None, help="Print a summary of every step of this game")
+    parser.add_argument("--render", type=str, default=None, help="Draw the first --step to this image file")
+    args = parser.parse_args()
+
+    log = TrajectoryLog(args.log)
+    print(f"{len(log)} steps, {log.num_games} games, T = {log.num_territories}, board {log.meta['board']}, "
+          f"{log.nbytes() / max(len(log), 1):.1f} bytes/step on disk")
+    if args.game is not None:
+        print(f"{'step':>8s} {'turn':>5s} {'player':>6s} {'battles':>7s} {'won':>4s} {'fortify':>16s} {'reward':>7s}")
+        for index in log.game(args.game):
+            record = log.step(index)
+            print(f"{index:8d} {record['turn']:5d} {record['player']:6d} {len(record['battles']):7d} "
+                  f"{int(record['battles']['conquered'].sum()):4d} {str(record['fortify']):>16s} {record['reward']:7.2f}")
+    for index in args.step:
+        record = log.step(index)
+        print(f"step {index}: game {record['game']}, turn {record['turn']}, player {record['player']} moved, "
+              f"reward {record['reward']:.3f}, done {record['done']}")
+        print("owners:", record['game_state'][:,0])
+        print("units: ", record['game_state'][:,1])
+        print("reinforce:", record['reinforce'])
+        for battle in record['battles']:
+            print(f"battle {battle['src']} -> {battle['dest']} with {battle['units']}: attacker lost {battle['attacker_lost']}, "
+                  f"defender lost {battle['defender_lost']}{', conquered' if battle['conquered'] else ''}")
+        print("fortify (src, dest, units):", record['fortify'])
+    if args.render:
+        from risk_env import RiskEnv, Player
+        from risk_env_wrapper import RiskEnvWrapper
+        from risk_graph_2 import GameRenderer
+        index = args.step[0] if args.step else len(log) - 1
+        env = RiskEnvWrapper(RiskEnv(log.meta['board'], [Player(i) for i in range(log.meta['num_players'])]))
+        log.load(env.risk_env, index)
+        renderer = GameRenderer(env, headless=True)
+        renderer.update(f"Step {index}")
+        renderer.figure.savefig(args.render)
+        print(f"step {index} drawn to {args.render}")
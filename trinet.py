@@ -3,8 +3,60 @@ import torch
 import numpy as np
 import torch.nn as nn
 from stable_baselines3 import PPO
-from stable_baselines3.common.vec_env import DummyVecEnv
 from stable_baselines3.common.vec_env import VecNormalize
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.preprocessing import get_flattened_obs_dim
+from stable_baselines3.common.torch_layers import BaseFeaturesExtractor
+from shared_vec_env import make_vec_env
+class ProfilerCallback(BaseCallback):
+    """
+    Time the phases of PPO training with a StepProfiler: 'rollout' (collecting n_steps from the
+    envs, including their steps) and 'ppo_update' (the gradient epochs between two rollouts).
+    The env phases are recorded too when the envs report info['profile'].
+    """
+    def __init__(self, profiler):
+        super().__init__()
+        self.profiler = profiler
+        self.updating = False
+
+    def _on_rollout_start(self):
+        if self.updating:
+            self.profiler.lap('ppo_update')
+        self.profiler.begin()
+
+    def _on_step(self):
+        for info in self.locals.get('infos', ()):
+            if 'profile' in info:
+                self.profiler.record(info['profile'])
+        return True
+
+    def _on_rollout_end(self):
+        self.profiler.lap('rollout')
+        self.updating = True
+
+    def _on_training_end(self):
+        if self.updating:
+            self.profiler.lap('ppo_update')
+            self.updating = False
+
+class CompactObsExtractor(BaseFeaturesExtractor):
+    """
+    Features of the compact observation for the mlp policy. Its integer fields are scaled to [0, 1]
+    inside the policy instead of by VecNormalize: units and reinforcement_max like the full
+    observation (clipped to 100 and 50), owners, current_player and component ids by their largest
+    value. The scaled fields are flattened and concatenated like SB3's CombinedExtractor does.
+    """
+    SCALES = {'units': 100.0, 'reinforcement_max': 50.0}
+
+    def __init__(self, observation_space):
+        super().__init__(observation_space, features_dim=sum(get_flattened_obs_dim(space) for space in observation_space.spaces.values()))
+        self.keys = sorted(observation_space.spaces)
+        self.scales = {key: self.SCALES.get(key, max(float(observation_space[key].high.max()), 1.0)) for key in self.keys}
+
+    def forward(self, observations):
+        return torch.cat([torch.clamp(observations[key].float() / self.scales[key], 0.0, 1.0).flatten(1)
+                          for key in self.keys], dim=1)
+
 class TriNet(nn.Module):
     """
     A neural network model that uses the PPO algorithm to learn reinforcement attack and fortify strategies for the game of Risk.
@@ -12,44 +64,77 @@ class TriNet(nn.Module):
     the turn, and that the player must follow through with their declared actions (with fortification continuing to the greatest
     extent possible). The network is trained using the PPO algorithm from the stable_baselines3 library.
     """
-    def __init__(self, env, model_path=None):
+    def __init__(self, env, model_path=None, n_envs=1, vec_backend="dummy", seed=0, policy="mlp", gnn_kwargs=None):
+        """
+        Parameters:
+        env: a RiskEnvWrapper, copied into every rollout environment
+        model_path: path of a saved model to load, or "random" for a random policy
+        n_envs: number of independent environments to collect rollouts from
+        vec_backend: "dummy" (single process), "subproc" or "shm" (one worker process per environment,
+        "shm" returns observations through shared memory)
+        seed: base seed of the worker RNGs
+        policy: "mlp" for SB3's MultiInputPolicy, or "gnn" for the message passing gnn.GraphPolicy, whose
+        checkpoints load on any board (needs compact_obs and edge_actions)
+        gnn_kwargs: hidden_dim and num_layers of the GraphPolicy
+        """
         super(TriNet, self).__init__()
-        self.env = DummyVecEnv([lambda: env])
+        self.edge_actions = env.edge_actions
+        self.edge_sources, self.edge_targets = env.risk_env.board.edge_sources, env.risk_env.board.edge_targets
+        self.env = make_vec_env(env, n_envs=n_envs, vec_backend=vec_backend, seed=seed)
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         
-        self.env = VecNormalize(self.env, norm_obs=True, norm_reward=True, clip_obs=10.0)
+        # compact observations are stored with their integer dtypes in the rollout buffer, which
+        # would truncate normalized values, so the policy scales them itself (see CompactObsExtractor)
+        # the action mask is a 0/1 flag and is left as it is
+        norm_obs_keys = [] if env.compact_obs else [key for key in env.observation_space.spaces if key != 'action_mask']
+        self.env = VecNormalize(self.env, norm_obs=True, norm_reward=True, clip_obs=10.0, norm_obs_keys=norm_obs_keys)
 
         learning_rate = 5e-6#0.00001 
         clip_range = 0.2
         entropy_coef = 0.001
         
-        self.agent = PPO("MultiInputPolicy", self.env, verbose=1, learning_rate=learning_rate, clip_range=clip_range, ent_coef=entropy_coef)
+        if policy == "gnn":
+            if not (env.compact_obs and env.edge_actions):
+                raise ValueError("The gnn policy needs compact_obs and edge_actions")
+            from gnn import GraphPolicy
+            self.policy_kwargs = {'edge_sources': self.edge_sources, 'edge_targets': self.edge_targets, **(gnn_kwargs or {})}
+            self.agent = PPO(GraphPolicy, self.env, verbose=1, learning_rate=learning_rate, clip_range=clip_range,
+                             ent_coef=entropy_coef, policy_kwargs=self.policy_kwargs)
+        elif policy == "mlp":
+            self.policy_kwargs = None
+            mlp_kwargs = {'features_extractor_class': CompactObsExtractor} if env.compact_obs else None
+            self.agent = PPO("MultiInputPolicy", self.env, verbose=1, learning_rate=learning_rate, clip_range=clip_range, ent_coef=entropy_coef,
+                             policy_kwargs=mlp_kwargs)
+        else:
+            raise ValueError("policy must be 'mlp' or 'gnn'")
         self.agent.policy.to(self.device)
+        self.random = model_path == "random"
         if model_path and model_path != "random" and os.path.exists(model_path):
             self.load_model(model_path)
-        self.random = model_path == "random"
 
-    def train(self, num_steps):
+    def train(self, num_steps, profiler=None):
+        """
+        Parameters:
+        num_steps: timesteps to train for
+        profiler: an optional StepProfiler that times rollouts and PPO updates (see ProfilerCallback)
+        """
         if self.random:
             return
-        self.agent.learn(total_timesteps=num_steps)
+        callback = ProfilerCallback(profiler) if profiler is not None else None
+        self.agent.learn(total_timesteps=num_steps, callback=callback)
         
     def predict(self, obs):
         return self.agent.predict(obs)
     
     def get_action(self, obs):
+        """
+        Predict a flat action of the env's action space, which RiskEnvWrapper.step takes as it is.
+        RiskEnvWrapper.decode_action turns it into the legal turn it stands for.
+        """
         if self.random: 
             return self.env.action_space.sample() 
         action, _ = self.predict(obs) 
-        T = obs["owners"].shape[0] 
-        # reinforce = action['reinforce'] 
-        # attack_units = action['attack_units'] 
-        # fortify_units = action['fortify_units']
-        reinforce = action[:T]
-        attack_units = (action[T:T + T * T].reshape((T, T)) * (T + 1)).astype(np.int32)
-        fortify_units = (action[T + T * T:].reshape((T, T)) * (T + 1)).astype(np.int32) 
-        # return { 'reinforce': reinforce, 'attack_units': attack_units, 'fortify_units': fortify_units }
-        return np.concatenate((reinforce, attack_units.flatten(), fortify_units.flatten()))
+        return action
 
     def save_model(self, path):
         if self.random:
@@ -60,5 +145,10 @@ class TriNet(nn.Module):
     def load_model(self, path):
         if self.random:
             return
-        self.agent = PPO.load(path, self.env)
+        custom_objects = None
+        if self.policy_kwargs is not None:
+            # graph checkpoints carry no board-sized weights, so they are rebuilt for this env's board
+            custom_objects = {'observation_space': self.env.observation_space, 'action_space': self.env.action_space,
+                              'policy_kwargs': self.policy_kwargs}
+        self.agent = PPO.load(path, self.env, custom_objects=custom_objects)
         self.agent.policy.to(self.device)
\ No newline at end of file
@@ -0,0 +1,263 @@
+"""
+Pool of warm env workers. Under forkserver the server imports the headless core once and
+every worker is forked from it, then builds its RiskEnvWrapper from the compiled board cache
+and resets it before it is handed out. A task given to a pool worker therefore starts at its
+first step instead of paying for interpreter start, imports and board parsing.
+"""
+
+import time
+import argparse
+import subprocess
+import sys
+import multiprocessing as mp
+from multiprocessing.connection import wait
+
+from board_cache import load_board
+
+HEADLESS_MODULES = ("numpy", "gymnasium", "board_cache", "battle_tables", "risk_env", "risk_env_wrapper")
+
+def get_context(start_method=None, preload=HEADLESS_MODULES):
+    """
+    Get a multiprocessing context, forkserver where available. The forkserver imports the
+    preload modules once when it starts, so the processes forked from it do not import them.
+    Preloading only takes effect if the forkserver of this process has not started yet.
+    """
+    if start_method is None:
+        start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+    ctx = mp.get_context(start_method)
+    if start_method == "forkserver" and preload:
+        ctx.set_forkserver_preload(list(preload))
+    return ctx
+
+def make_env(board, num_players=2, seed=None, env_kwargs=None, wrapper_kwargs=None):
+    from risk_env import RiskEnv, Player
+    from risk_env_wrapper import RiskEnvWrapper
+    risk_env = RiskEnv(board, [Player(i) for i in range(num_players)], seed=seed, **(env_kwargs or {}))
+    return RiskEnvWrapper(risk_env, **(wrapper_kwargs or {}))
+
+def _worker(remote, parent_remote, config, rank):
+    parent_remote.close()
+    seed = None if config['seed'] is None else config['seed'] + rank
+    env = make_env(config['board'], config['num_players'], seed, config['env_kwargs'], config['wrapper_kwargs'])
+    env.reset(seed=seed)
+    remote.send(("ready", None))
+    while True:
+        try:
+            cmd, data = remote.recv()
+        except EOFError:
+            break
+        if cmd == "call":
+            fn, args = data
+            try:
+                remote.send(("ok", fn(env, *args)))
+            except Exception as e:
+                remote.send(("error", e))
+        elif cmd == "close":
+            break
+    remote.close()
+
+class WarmWorker():
+    """
+    A pool worker holding a reset RiskEnvWrapper, handed out by WarmWorkerPool.acquire
+    """
+    def __init__(self, rank, remote, process):
+        self.rank = rank
+        self.remote = remote
+        self.process = process
+
+    def submit(self, fn, *args):
+        self.remote.send(("call", (fn, args)))
+
+    def result(self):
+        status, value = self.remote.recv()
+        if status == "error":
+            raise value
+        return value
+
+    def call(self, fn, *args):
+        """
+        Run fn(env, *args) in the worker on its env and return the result. fn must be picklable,
+        i.e. a module level function.
+        """
+        self.submit(fn, *args)
+        return self.result()
+
+class WarmWorkerPool():
+    """
+    A fixed set of worker processes, each with an env of the same board already built and reset
+
+    Parameters:
+    board: path to the board configuration JSON, compiled into the board cache before the workers start
+    num_workers: the number of workers
+    num_players: players of the RiskEnv
+    seed: seed of the first worker's env, worker i uses seed + i (None for unseeded envs)
+    env_kwargs, wrapper_kwargs: extra arguments of RiskEnv and RiskEnvWrapper
+    preload: modules the forkserver imports once for all workers
+    start_method: multiprocessing start method, defaults to forkserver where available
+
+    Class variables:
+    startup_time: seconds from starting the pool until every worker was ready
+    """
+    def __init__(self, board, num_workers=2, num_players=2, seed=0, env_kwargs=None, wrapper_kwargs=None,
+                 preload=HEADLESS_MODULES, start_method=None):
+        start = time.perf_counter()
+        load_board(board)
+        ctx = get_context(start_method, preload)
+        config = {'board': board, 'num_players': num_players, 'seed': seed,
+                  'env_kwargs': env_kwargs, 'wrapper_kwargs': wrapper_kwargs}
+        self.workers = []
+        for rank in range(num_workers):
+            remote, work_remote = ctx.Pipe()
+            process = ctx.Process(target=_worker, args=(work_remote, remote, config, rank), daemon=True)
+            process.start()
+            work_remote.close()
+            self.workers.append(WarmWorker(rank, remote, process))
+        for worker in self.workers:
+            worker.result()
+        self.idle = list(self.workers)
+        self.startup_time = time.perf_counter() - start
+        self.closed = False
+
+    def acquire(self):
+        """
+        Take an idle worker, raising a ValueError if every worker is handed out
+        """
+        if not self.idle:
+            raise ValueError("Every worker of the pool is in use")
+        return self.idle.pop()
+
+    def release(self, worker):
+        self.idle.append(worker)
+
+    def run(self, fn, *args):
+        """
+        Run fn(env, *args) on an idle worker and return the result
+        """
+        worker = self.acquire()
+        try:
+            return worker.call(fn, *args)
+        finally:
+            self.release(worker)
+
+    def map(self, fn, items):
+        """
+        Run fn(env, item) for every item across the idle workers
+
+        Returns:
+        results: the results in the order of the items
+        """
+        items = list(items)
+        results = [None] * len(items)
+        workers = [self.acquire() for _ in range(len(self.idle))]
+        if not workers:
+            raise ValueError("Every worker of the pool is in use")
+        pending, next_item = {}, 0
+        try:
+            for worker in workers:
+                if next_item < len(items):
+                    worker.submit(fn, items[next_item])
+                    pending[worker.remote] = (worker, next_item)
+                    next_item += 1
+            while pending:
+                for remote in wait(list(pending)):
+                    worker, index = pending.pop(remote)
+                    results[index] = worker.result()
+                    if next_item < len(items):
+                        worker.submit(fn, items[next_item])
+                        pending[worker.remote] = (worker, next_item)
+                        next_item += 1
+        finally:
+            for worker in workers:
+                self.release(worker)
+        return results
+
+    def close(self):
+        if self.closed:
+            return
+        for worker in self.workers:
+            try:
+                worker.remote.send(("close", None))
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in self.workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.remote.close()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def first_step(env, seed=0):
+    """
+    Reset the env and play one random step
+
+    Returns:
+    seconds: the time taken by the step
+    """
+    env.reset(seed=seed)
+    env.action_space.seed(seed)
+    start = time.perf_counter()
+    env.step(env.action_space.sample())
+    return time.perf_counter() - start
+
+def _cold_task(board, seed, start, results):
+    env = make_env(board, seed=seed)
+    first_step(env, seed)
+    results.put(time.time() - start)
+
+COLD_SCRIPT = """
+import time, sys
+start = time.perf_counter()
+{imports}
+from worker_pool import make_env, first_step
+env = make_env(sys.argv[1], seed=0)
+first_step(env)
+print(time.perf_counter() - start)
+"""
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--board", type=str, default="world.json", help="Path to board configuration JSON")
+    parser.add_argument("--workers", type=int, default=2, help="Workers of the warm pool")
+    parser.add_argument("--repeats", type=int, default=5, help="Measurements per startup mode")
+    args = parser.parse_args()
+
+    def median(values):
+        return sorted(values)[len(values) // 2]
+
+    # a new interpreter running one step, with the imports a worker used to pay and with the lean core
+    print(f"{'time to first step':>40s} {'ms':>8s}")
+    for name, imports in (("new interpreter, plotting + trinet", "import matplotlib.pyplot, networkx, trinet"),
+                          ("new interpreter, plotting", "import matplotlib.pyplot, networkx"),
+                          ("new interpreter, headless core", "")):
+        times = [float(subprocess.run([sys.executable, "-c", COLD_SCRIPT.format(imports=imports), args.board],
+                                      capture_output=True, text=True, check=True).stdout)
+                 for _ in range(args.repeats)]
+        print(f"{name:>40s} {median(times) * 1000:8.1f}")
+
+    # a new process per task from each start method
+    for start_method in ("spawn", "forkserver"):
+        ctx = get_context(start_method)
+        results = ctx.Queue()
+        times = []
+        for _ in range(args.repeats + 1):
+            process = ctx.Process(target=_cold_task, args=(args.board, 0, time.time(), results))
+            process.start()
+            times.append(results.get())
+            process.join()
+        # the first forkserver process also starts the server
+        print(f"{'new process, ' + start_method:>40s} {median(times[1:]) * 1000:8.1f}")
+
+    with WarmWorkerPool(args.board, num_workers=args.workers) as pool:
+        times = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            pool.run(first_step)
+            times.append(time.perf_counter() - start)
+        print(f"{'warm pool worker':>40s} {median(times) * 1000:8.1f}")
+        print(f"pool of {args.workers} workers ready after {pool.startup_time * 1000:.1f} ms")